@@ -0,0 +1,154 @@
+"""请求准入控制：按路由分道限流、有界排队与截止时间
+
+每个分道（lane）有自己的并发上限、排队长度和排队截止时间：排满时立即拒绝，
+排队超过截止时间也拒绝（识别帧过时就不再处理，客户端会发送更新的画面）。
+
+gunicorn gthread 模式下排队中的请求同样占着一个线程，因此线程按下面的方式划分（处理中 + 排队中都计入）：
+BYPASS_THREADS 个线程准入控制从不分出，留给不经过准入控制的 /health、/ready、/metrics；
+reserved 个线程只给优先分道（注册/删除）；其余 threads - reserved - BYPASS_THREADS 个为普通分道共用，
+单个普通分道还要给其他普通分道至少留一个线程。优先分道可以借用空闲的共用线程，
+但所有分道合计不超过 threads - BYPASS_THREADS。这样导出、识别或注册洪峰都不会占满线程、拖垮 /health 和看板。
+"""
+import os
+import threading
+import time
+
+REJECT_REASONS = ('busy', 'queue_full', 'deadline')
+BYPASS_THREADS = 1  # 准入控制从不分出的线程数
+
+
+class Rejected(Exception):
+    """请求未被准入；reason 为 busy（可分出的线程已占满）、queue_full 或 deadline"""
+
+    def __init__(self, lane, reason):
+        super().__init__(f'{lane} {reason}')
+        self.lane = lane
+        self.reason = reason
+
+
+class Lane:
+    """一个分道的配置与计数；由 AdmissionController 加锁访问"""
+
+    def __init__(self, name, limit=2, queue_size=8, deadline=5.0, priority=False, alpha=0.2):
+        self.name = name
+        self.limit = limit  # 同时处理的请求数
+        self.queue_size = queue_size  # 最多排队的请求数
+        self.deadline = deadline  # 最长排队时间（秒）
+        self.priority = priority  # 可以使用预留线程
+        self.alpha = alpha
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = {reason: 0 for reason in REJECT_REASONS}
+        self.wait_avg = 0.0  # 排队请求等待时间的指数滑动平均（秒）
+        self.wait_max = 0.0
+        self.condition = None
+
+    @classmethod
+    def from_env(cls, name, prefix='ADMISSION_', **defaults):
+        """从环境变量读取配置，例如 ADMISSION_READS_LIMIT、ADMISSION_READS_QUEUE、ADMISSION_READS_DEADLINE"""
+        key = prefix + name.upper() + '_'
+        lane = cls(name, **defaults)
+        lane.limit = int(os.environ.get(key + 'LIMIT', lane.limit))
+        lane.queue_size = int(os.environ.get(key + 'QUEUE', lane.queue_size))
+        lane.deadline = float(os.environ.get(key + 'DEADLINE', lane.deadline))
+        return lane
+
+    def observe_wait(self, seconds):
+        self.queued += 1
+        self.wait_avg = seconds if self.queued == 1 else self.wait_avg + self.alpha * (seconds - self.wait_avg)
+        self.wait_max = max(self.wait_max, seconds)
+
+    def stats(self):
+        return {
+            'limit': self.limit,
+            'queue_size': self.queue_size,
+            'deadline_s': self.deadline,
+            'priority': self.priority,
+            'active': self.active,
+            'waiting': self.waiting,
+            'admitted': self.admitted,
+            'queued': self.queued,
+            'rejected': dict(self.rejected),
+            'wait_ms_avg': round(self.wait_avg * 1000, 2),
+            'wait_ms_max': round(self.wait_max * 1000, 2),
+        }
+
+
+class AdmissionController:
+    """按进程的准入控制"""
+
+    def __init__(self, lanes, threads=4, reserved=1):
+        self.threads = threads  # 每个进程处理请求的线程数
+        self.reserved = reserved  # 只留给优先分道的线程数
+        self.shared_threads = max(threads - reserved - BYPASS_THREADS, 1)  # 普通分道共用的线程数
+        self.occupied = 0  # 普通分道占用的线程数（处理中 + 排队中）
+        self.priority_occupied = 0  # 优先分道占用的线程数（处理中 + 排队中）
+        self._lock = threading.Lock()
+        self.lanes = {}
+        for lane in lanes:
+            lane.condition = threading.Condition(self._lock)
+            self.lanes[lane.name] = lane
+
+    def _reject(self, lane, reason):
+        lane.rejected[reason] += 1
+        raise Rejected(lane.name, reason)
+
+    def acquire(self, name):
+        """进入分道，必要时排队；未被准入时抛出 Rejected，返回排队秒数"""
+        lane = self.lanes[name]
+        started = time.monotonic()
+        with self._lock:
+            if self.occupied + self.priority_occupied >= self.threads - BYPASS_THREADS:
+                self._reject(lane, 'busy')
+            if not lane.priority and (self.occupied >= self.shared_threads
+                                      or lane.active + lane.waiting >= max(self.shared_threads - 1, 1)):
+                self._reject(lane, 'busy')
+            waited = 0.0
+            if lane.active >= lane.limit:
+                if lane.waiting >= lane.queue_size:
+                    self._reject(lane, 'queue_full')
+                lane.waiting += 1
+                self._occupy(lane, 1)
+                try:
+                    deadline_at = started + lane.deadline
+                    while lane.active >= lane.limit:
+                        remaining = deadline_at - time.monotonic()
+                        if remaining <= 0:
+                            self._reject(lane, 'deadline')
+                        lane.condition.wait(remaining)
+                finally:
+                    lane.waiting -= 1
+                    self._occupy(lane, -1)
+                waited = time.monotonic() - started
+                lane.observe_wait(waited)
+            lane.active += 1
+            lane.admitted += 1
+            self._occupy(lane, 1)
+            return waited
+
+    def _occupy(self, lane, delta):
+        if lane.priority:
+            self.priority_occupied += delta
+        else:
+            self.occupied += delta
+
+    def release(self, name):
+        lane = self.lanes[name]
+        with self._lock:
+            lane.active -= 1
+            self._occupy(lane, -1)
+            lane.condition.notify()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'threads': self.threads,
+                'reserved': self.reserved,
+                'bypass': BYPASS_THREADS,
+                'shared_threads': self.shared_threads,
+                'occupied': self.occupied,
+                'priority_occupied': self.priority_occupied,
+                'lanes': {name: lane.stats() for name, lane in self.lanes.items()},
+            }
@@ -1,123 +1,225 @@
-import cv2
-import mediapipe as mp
 import numpy as np
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, g, request, jsonify, render_template_string
 from flask_cors import CORS
 import base64
 import io
 from PIL import Image
 import json
-import sqlite3
 from datetime import datetime
 import os
+import math
+import tempfile
 import threading
 import time
-import face_recognition
-import pickle
+import queue
 from collections import defaultdict
 
+import admission
+import events
+import models
+import photos
+import presence
+import quality
+import reports
+import recognition
+import storage
+import zones
+from metrics import Counters
+from pacing import RecognitionPacer
+from gallery import Gallery
+
 app = Flask(__name__)
 CORS(app)
 
-# 初始化MediaPipe人脸检测
-mp_face_detection = mp.solutions.face_detection
-mp_drawing = mp.solutions.drawing_utils
-face_detection = mp_face_detection.FaceDetection(
-    model_selection=0, min_detection_confidence=0.5
-)
+# face_recognition/dlib、cv2、mediapipe 均由 models 模块在首次使用时加载
 
 # 人脸识别相关变量
-known_face_encodings = []
-known_face_names = []
+GALLERY_QUANTIZATION = os.environ.get('GALLERY_QUANTIZATION', 'none')  # none / float16 / int8
+GALLERY_RERANK_K = int(os.environ.get('GALLERY_RERANK_K', 8))  # 量化粗筛后精确重排的候选数
+# 量化时全精度特征落盘的目录（mmap访问），默认为系统临时目录；off 为不落盘，此时紧凑副本是额外的内存
+GALLERY_SPILL_DIR = os.environ.get('GALLERY_SPILL_DIR') or tempfile.gettempdir()
+gallery = Gallery(quantization=GALLERY_QUANTIZATION, rerank_k=GALLERY_RERANK_K,
+                  spill_dir=None if GALLERY_SPILL_DIR == 'off' else GALLERY_SPILL_DIR)  # 当前人脸库快照，读取无需加锁
 face_tracking = {}  # 跟踪每个人脸的状态
 person_appearances = defaultdict(list)  # 记录每个人的出现时间
-TRACKING_TIMEOUT = 3  # 3秒没检测到就认为离开了
+TRACKING_TIMEOUT = recognition.TRACKING_TIMEOUT
+GALLERY_SYNC_INTERVAL = float(os.environ.get('GALLERY_SYNC_INTERVAL', 2))  # 人脸库同步轮询间隔（秒）
+SSE_MAX_STREAM_SECONDS = int(os.environ.get('SSE_MAX_STREAM_SECONDS', 300))  # 单个推送连接的最长时间，之后浏览器自动重连
+
+RECOGNIZE_CAPACITY = int(os.environ.get('RECOGNIZE_CAPACITY', 4))  # 同时处理的识别请求数（识别主要耗CPU，不随线程数增加）
+RECOGNIZE_MAX_INFLIGHT = int(os.environ.get('RECOGNIZE_MAX_INFLIGHT', RECOGNIZE_CAPACITY * 2))  # 超过后返回429
+RECOGNIZE_TARGET_LATENCY = float(os.environ.get('RECOGNIZE_TARGET_LATENCY', 0.25))  # 单帧期望耗时（秒）
+RECOGNIZE_MAX_CROPS = int(os.environ.get('RECOGNIZE_MAX_CROPS', 16))  # 裁剪模式下单次请求最多的人脸数
+
+ADMISSION_THREADS = int(os.environ.get('ADMISSION_THREADS', os.environ.get('GUNICORN_THREADS', 8)))  # 每个进程的请求线程数
+ADMISSION_RESERVED = int(os.environ.get('ADMISSION_RESERVED', 1))  # 只留给注册/删除的线程数；另有一个线程留给健康检查（admission.BYPASS_THREADS）
+RECOGNIZE_QUEUE_DEADLINE = float(os.environ.get('RECOGNIZE_QUEUE_DEADLINE', RECOGNIZE_TARGET_LATENCY * 2))  # 识别帧最长排队时间（秒），超过即视为过时
+# 每个推送连接在整个连接期间占着一个线程，按普通分道共用线程数的一半设默认值（默认8线程时为3）；
+# 推送属于普通分道，无论怎样设置都至少给其他普通分道留一个线程
+SSE_MAX_CLIENTS = int(os.environ.get('SSE_MAX_CLIENTS', max(
+    (ADMISSION_THREADS - ADMISSION_RESERVED - admission.BYPASS_THREADS) // 2, 1)))  # 每个进程的统计推送连接上限
+
+RETENTION_DAYS = int(os.environ.get('RETENTION_DAYS', 0))  # 出现记录在热表中保留的天数，0表示不归档
+RETENTION_INTERVAL = float(os.environ.get('RETENTION_INTERVAL', 3600))  # 归档检查间隔（秒）
+
+PHOTOS_DIR = os.environ.get('PHOTOS_DIR', 'registered_faces')  # 注册照片目录（按内容哈希命名）
+PHOTO_WRITE_QUEUE = int(os.environ.get('PHOTO_WRITE_QUEUE', 64))  # 等待后台写入的照片数上限，满了在请求中同步写入
+
+PURGE_INTERVAL = float(os.environ.get('PURGE_INTERVAL', 5))  # 检查待清理的已删除人员的间隔（秒）
+PURGE_BATCH_SIZE = int(os.environ.get('PURGE_BATCH_SIZE', 500))  # 每个写事务删除的出现记录数
+
+BACKUP_DIR = os.environ.get('BACKUP_DIR', 'backups')
+BACKUP_INTERVAL = float(os.environ.get('BACKUP_INTERVAL', 0))  # 定时备份间隔（秒），0表示只手动备份
+BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', 7))  # 保留最近几份备份
+
+# 存储后端，由环境变量 FACE_STORE 选择（默认本地SQLite）
+store = storage.create_store()
+
+# 过期记录归档（存储不支持或未启用时为None）
+retention_worker = store.retention_worker(RETENTION_DAYS, interval=RETENTION_INTERVAL) if RETENTION_DAYS > 0 else None
+
+# 注册照片：按内容去重，后台原子写入原图和缩略图
+photo_store = photos.PhotoStore(PHOTOS_DIR, queue_size=PHOTO_WRITE_QUEUE)
+
+# 已删除人员的考勤数据后台清理（存储不支持时为None，删除时同步完成）
+purge_worker = store.purge_worker(interval=PURGE_INTERVAL, batch_size=PURGE_BATCH_SIZE,
+                                  remove_photo=photo_store.remove)
+
+# 在线备份（存储不支持时为None）
+backup_manager = store.backup_manager(BACKUP_DIR, keep=BACKUP_KEEP, photos_dir=PHOTOS_DIR)
+
+# 识别负载与客户端节奏建议
+recognition_pacer = RecognitionPacer(capacity=RECOGNIZE_CAPACITY,
+                                     max_inflight=RECOGNIZE_MAX_INFLIGHT,
+                                     target_latency=RECOGNIZE_TARGET_LATENCY)
+recognize_counters = Counters()  # 按输入模式统计请求数与上传字节数
+
+# 准入控制：各分道的并发上限、排队长度与排队截止时间，可用 ADMISSION_<分道>_LIMIT/QUEUE/DEADLINE 覆盖
+admission_control = admission.AdmissionController([
+    admission.Lane.from_env('recognize', limit=RECOGNIZE_CAPACITY,
+                            queue_size=max(RECOGNIZE_MAX_INFLIGHT - RECOGNIZE_CAPACITY, 0),
+                            deadline=RECOGNIZE_QUEUE_DEADLINE),
+    admission.Lane.from_env('enroll', limit=1, queue_size=4, deadline=15, priority=True),
+    admission.Lane.from_env('writes', limit=2, queue_size=16, deadline=5),
+    admission.Lane.from_env('reads', limit=2, queue_size=8, deadline=5),
+    admission.Lane.from_env('export', limit=1, queue_size=2, deadline=30),
+    # 推送连接不排队：满了直接拒绝，网页退回轮询 /statistics
+    admission.Lane('stream', limit=SSE_MAX_CLIENTS, queue_size=0, deadline=0),
+], threads=ADMISSION_THREADS, reserved=ADMISSION_RESERVED)
+# 视图函数 -> 分道；未列出的（健康检查、指标、页面等）不经过准入控制
+ROUTE_LANES = {
+    'recognize_faces': 'recognize',
+    'register_face': 'enroll',
+    'delete_face': 'enroll',
+    'record_appearance': 'writes',
+    'get_statistics': 'reads',
+    'get_registered_faces': 'reads',
+    'get_presence': 'reads',
+    'get_timeline': 'reads',
+    'get_purges': 'reads',
+    'export_data': 'export',
+    'get_report': 'export',
+    'stream_statistics': 'stream',
+    'list_camera_zones': 'reads',
+    'get_camera_zones': 'reads',
+    'set_camera_zones': 'enroll',
+    'delete_camera_zones': 'enroll',
+}
+
+# 人脸质量预过滤：不达标的人脸跳过编码；注册时使用更严格的阈值
+quality_limits = quality.QualityLimits.from_env('QUALITY_')
+enroll_quality_limits = quality.QualityLimits.from_env('ENROLL_QUALITY_', min_size=80, min_sharpness=50.0)
+quality_counters = Counters()  # 识别时的评估数、通过数与各原因的跳过数
+enroll_quality_counters = Counters()
+
+# 各摄像头的识别区域：其他进程的修改在一个同步间隔内生效
+ZONE_MARGIN = float(os.environ.get('ZONE_MARGIN', 0.1))  # 检测范围在区域外接矩形外扩展的边距（画面短边的比例）
+camera_zones = zones.ZoneRegistry(store.camera_zones, refresh_interval=GALLERY_SYNC_INTERVAL or 2,
+                                  margin=ZONE_MARGIN)
+
+# 统计推送：数据变化时计算一次，分发给所有看板
+stats_broadcaster = events.StatsBroadcaster(store.statistics, store.change_marker,
+                                            poll_interval=GALLERY_SYNC_INTERVAL or 2,
+                                            max_clients=SSE_MAX_CLIENTS)
+_gallery_sync_pid = None
 
 # 初始化数据库
 def init_db():
-    """初始化SQLite数据库"""
-    conn = sqlite3.connect('face_records.db')
-    c = conn.cursor()
-    
-    # 创建人脸注册表
-    c.execute('''CREATE TABLE IF NOT EXISTS registered_faces
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  name TEXT UNIQUE,
-                  encoding BLOB,
-                  photo_path TEXT,
-                  created_at TEXT)''')
-    
-    # 创建出现记录表
-    c.execute('''CREATE TABLE IF NOT EXISTS appearance_records
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  person_name TEXT,
-                  start_time TEXT,
-                  end_time TEXT,
-                  duration REAL,
-                  confidence REAL)''')
-    
-    # 创建统计表
-    c.execute('''CREATE TABLE IF NOT EXISTS person_statistics
-                 (person_name TEXT PRIMARY KEY,
-                  total_appearances INTEGER,
-                  total_duration REAL,
-                  last_seen TEXT,
-                  first_seen TEXT)''')
-    
-    conn.commit()
-    conn.close()
-    
-    # 加载已注册的人脸
-    load_registered_faces()
+    """初始化数据库表结构"""
+    store.init_schema()
 
 def load_registered_faces():
-    """从数据库加载已注册的人脸"""
-    global known_face_encodings, known_face_names
-    
-    conn = sqlite3.connect('face_records.db')
-    c = conn.cursor()
-    c.execute("SELECT name, encoding FROM registered_faces")
-    
-    known_face_encodings = []
-    known_face_names = []
-    
-    for name, encoding_blob in c.fetchall():
-        encoding = pickle.loads(encoding_blob)
-        known_face_encodings.append(encoding)
-        known_face_names.append(name)
-    
-    conn.close()
-    print(f"已加载 {len(known_face_names)} 个注册人脸")
+    """从存储加载已注册的人脸"""
+    version, faces, encoder = store.load_active_gallery()
+    snapshot = gallery.replace([name for name, _ in faces],
+                               [encoding for _, encoding in faces], version, encoder)
+    print(f"已加载 {len(snapshot)} 个注册人脸（版本 {version}）")
 
-def update_person_statistics(person_name, start_time, end_time):
-    """更新人员统计信息"""
-    conn = sqlite3.connect('face_records.db')
-    c = conn.cursor()
-    
-    duration = (end_time - start_time).total_seconds()
-    
-    # 检查是否已有统计记录
-    c.execute("SELECT total_appearances, total_duration FROM person_statistics WHERE person_name = ?", 
-              (person_name,))
-    result = c.fetchone()
-    
-    if result:
-        # 更新现有记录
-        total_appearances, total_duration = result
-        c.execute("""UPDATE person_statistics 
-                     SET total_appearances = ?, total_duration = ?, last_seen = ?
-                     WHERE person_name = ?""",
-                  (total_appearances + 1, total_duration + duration, 
-                   end_time.isoformat(), person_name))
-    else:
-        # 创建新记录
-        c.execute("""INSERT INTO person_statistics 
-                     (person_name, total_appearances, total_duration, first_seen, last_seen)
-                     VALUES (?, ?, ?, ?, ?)""",
-                  (person_name, 1, duration, start_time.isoformat(), end_time.isoformat()))
-    
-    conn.commit()
-    conn.close()
+def sync_gallery():
+    """拉取并应用比当前版本新的人脸库变更，返回应用的条数"""
+    changes = store.gallery_changes(gallery.current.version)
+    if any(op == 'reload' for _, op, _, _ in changes):
+        # 编码参数已切换（reencode.py）：整体重新加载特征和参数
+        load_registered_faces()
+    elif changes:
+        gallery.apply(changes)
+    return len(changes)
+
+def _gallery_sync_loop():
+    while True:
+        time.sleep(GALLERY_SYNC_INTERVAL)
+        try:
+            applied = sync_gallery()
+            if applied:
+                app.logger.info(f"Gallery synced to version {gallery.current.version} ({applied} changes)")
+        except Exception as e:
+            app.logger.error(f"Gallery sync error: {str(e)}")
+
+@app.before_request
+def ensure_gallery_sync():
+    """每个worker进程首次处理请求时启动人脸库同步线程（线程不会跨fork保留）"""
+    global _gallery_sync_pid
+    if _gallery_sync_pid != os.getpid() and GALLERY_SYNC_INTERVAL > 0:
+        _gallery_sync_pid = os.getpid()
+        threading.Thread(target=_gallery_sync_loop, name='gallery-sync', daemon=True).start()
+
+@app.before_request
+def ensure_maintenance():
+    """每个worker进程启动归档、清理与定时备份线程；多个进程同时归档或清理由数据库写事务串行化，备份由文件锁互斥"""
+    if retention_worker is not None:
+        retention_worker.ensure_thread()
+    if purge_worker is not None:
+        purge_worker.ensure_thread()
+    if backup_manager is not None:
+        backup_manager.schedule(BACKUP_INTERVAL)
+
+@app.before_request
+def admit_request():
+    """按路由所属分道准入；排满或排队超时的请求直接拒绝"""
+    lane = ROUTE_LANES.get(request.endpoint)
+    if lane is None:
+        return None
+    try:
+        admission_control.acquire(lane)
+    except admission.Rejected as e:
+        if lane == 'recognize':
+            # 与过载时一样返回429，页面端保留上一帧结果并按建议时间后重发
+            retry_after_ms = recognition_pacer.retry_after_ms()
+            response = jsonify({'error': '服务器繁忙，请稍后重试', 'reason': e.reason,
+                                'retry_after_ms': retry_after_ms, 'pacing': recognition_pacer.hints()})
+            response.headers['Retry-After'] = str(max(1, math.ceil(retry_after_ms / 1000)))
+            return response, 429
+        response = jsonify({'error': '服务器繁忙，请稍后重试', 'reason': e.reason, 'lane': lane})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    g.admission_lane = lane
+    return None
+
+@app.teardown_request
+def release_admission(exc):
+    lane = g.pop('admission_lane', None)
+    if lane is not None:
+        admission_control.release(lane)
 
 # HTML模板
 HTML_TEMPLATE = '''
@@ -469,6 +571,16 @@ HTML_TEMPLATE = '''
         let detecting = false;
         let registerMode = false;
         let currentDetections = new Map();  // 当前检测到的人脸
+        let statsStream = null;  // 统计推送连接（SSE）
+        let statsPolling = null;  // 不支持推送时的轮询定时器
+        let statsState = null;  // 最近一次的完整统计
+        let pacing = { interval_ms: 100, max_dimension: 640, jpeg_quality: 0.8 };  // 服务器建议的发送节奏
+        let trackedBoxes = [];  // 上一次识别出的人脸框（原始画面坐标），用于裁剪模式
+        let framesSinceFull = 0;
+        const CAMERA_ID = new URLSearchParams(location.search).get('camera') || 'default';  // 页面地址 ?camera= 指定摄像头，决定识别区域
+        const FULL_FRAME_EVERY = 10;  // 每隔多少帧上传一次整帧，以发现新进入画面的人
+        const CROP_MARGIN = 0.3;  // 裁剪时人脸框四周留出的比例
+        const CROP_FACE_SIZE = 160;  // 裁剪图中人脸的最大边长
         
         // 按钮元素
         const startBtn = document.getElementById('startBtn');
@@ -519,44 +631,106 @@ HTML_TEMPLATE = '''
             stopBtn.disabled = true;
         }
 
+        function captureCrops() {
+            // 按上一次的人脸框裁剪出小图，服务器跳过整帧检测
+            return trackedBoxes.map(bbox => {
+                let marginX = bbox.width * CROP_MARGIN;
+                let marginY = bbox.height * CROP_MARGIN;
+                let x = Math.max(0, Math.floor(bbox.x - marginX));
+                let y = Math.max(0, Math.floor(bbox.y - marginY));
+                let w = Math.min(video.videoWidth, Math.ceil(bbox.x + bbox.width + marginX)) - x;
+                let h = Math.min(video.videoHeight, Math.ceil(bbox.y + bbox.height + marginY)) - y;
+                let cropScale = Math.min(1, CROP_FACE_SIZE / Math.max(bbox.width, bbox.height));
+                
+                let cropCanvas = document.createElement('canvas');
+                cropCanvas.width = Math.round(w * cropScale);
+                cropCanvas.height = Math.round(h * cropScale);
+                cropCanvas.getContext('2d').drawImage(video, x, y, w, h, 0, 0, cropCanvas.width, cropCanvas.height);
+                
+                return {
+                    image: cropCanvas.toDataURL('image/jpeg', pacing.jpeg_quality),
+                    x: x,
+                    y: y,
+                    scale: cropScale,
+                    face: {
+                        x: (bbox.x - x) * cropScale,
+                        y: (bbox.y - y) * cropScale,
+                        width: bbox.width * cropScale,
+                        height: bbox.height * cropScale
+                    }
+                };
+            });
+        }
+
         async function detectAndRecognize() {
             if (!detecting) return;
 
-            // 捕获当前帧
-            let tempCanvas = document.createElement('canvas');
-            tempCanvas.width = video.videoWidth;
-            tempCanvas.height = video.videoHeight;
-            let tempCtx = tempCanvas.getContext('2d');
-            tempCtx.drawImage(video, 0, 0);
-            
-            let imageData = tempCanvas.toDataURL('image/jpeg', 0.8);
+            let scale = 1;
+            let body;
+            if (trackedBoxes.length > 0 && framesSinceFull < FULL_FRAME_EVERY) {
+                // 上一帧的人脸都已识别：只上传人脸裁剪图
+                body = { crops: captureCrops(), frame_width: video.videoWidth, frame_height: video.videoHeight };
+                framesSinceFull++;
+            } else {
+                // 捕获当前帧，按服务器建议缩小尺寸
+                scale = Math.min(1, pacing.max_dimension / Math.max(video.videoWidth, video.videoHeight));
+                let tempCanvas = document.createElement('canvas');
+                tempCanvas.width = Math.round(video.videoWidth * scale);
+                tempCanvas.height = Math.round(video.videoHeight * scale);
+                let tempCtx = tempCanvas.getContext('2d');
+                tempCtx.drawImage(video, 0, 0, tempCanvas.width, tempCanvas.height);
+                
+                body = { image: tempCanvas.toDataURL('image/jpeg', pacing.jpeg_quality) };
+                framesSinceFull = 0;
+            }
             
+            body.camera = CAMERA_ID;
             try {
                 let response = await fetch('/recognize', {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json',
                     },
-                    body: JSON.stringify({ image: imageData })
+                    body: JSON.stringify(body)
                 });
                 
                 let result = await response.json();
+                if (result.pacing) pacing = result.pacing;
+                
+                if (response.status === 429) {
+                    // 服务器过载：保留上一帧的结果，按建议时间后再发
+                    setTimeout(detectAndRecognize, result.retry_after_ms || 1000);
+                    return;
+                }
                 
                 // 清除画布
                 ctx.clearRect(0, 0, canvas.width, canvas.height);
                 
                 // 处理识别结果
                 let detectedNow = new Set();
+                let recognizedBoxes = [];
+                let hasUnknown = false;
                 
                 result.faces.forEach(face => {
-                    let bbox = face.bbox;
+                    // 坐标换算回原始画面
+                    let bbox = {
+                        x: face.bbox.x / scale,
+                        y: face.bbox.y / scale,
+                        width: face.bbox.width / scale,
+                        height: face.bbox.height / scale
+                    };
                     
                     // 绘制边界框
                     if (face.name === 'Unknown') {
                         ctx.strokeStyle = '#ff0000';  // 红色表示未识别
+                        hasUnknown = true;
+                    } else if (face.name === 'low_quality') {
+                        ctx.strokeStyle = '#ff9800';  // 橙色表示质量不足，未做识别
+                        hasUnknown = true;
                     } else {
                         ctx.strokeStyle = '#00ff00';  // 绿色表示已识别
                         detectedNow.add(face.name);
+                        recognizedBoxes.push(bbox);
                     }
                     
                     ctx.lineWidth = 3;
@@ -570,6 +744,9 @@ HTML_TEMPLATE = '''
                     ctx.fillText(face.name, bbox.x + 5, bbox.y - 8);
                 });
                 
+                // 有未识别或质量不足的人脸时下一帧改为整帧检测
+                trackedBoxes = hasUnknown ? [] : recognizedBoxes;
+                
                 // 更新活跃人员显示
                 if (detectedNow.size > 0) {
                     let names = Array.from(detectedNow).join(', ');
@@ -589,8 +766,8 @@ HTML_TEMPLATE = '''
                 console.error('识别错误:', err);
             }
             
-            // 继续下一帧
-            setTimeout(detectAndRecognize, 100);
+            // 按服务器建议的间隔继续下一帧
+            setTimeout(detectAndRecognize, pacing.interval_ms);
         }
 
         function updatePersonTracking(detectedNow) {
@@ -638,8 +815,8 @@ HTML_TEMPLATE = '''
                     })
                 });
                 
-                // 刷新统计信息
-                loadStatistics();
+                // 推送模式下统计由服务器推送，轮询模式下立即刷新
+                if (!statsStream) loadStatistics();
                 
             } catch (err) {
                 console.error('记录失败:', err);
@@ -701,24 +878,65 @@ HTML_TEMPLATE = '''
             }
         }
 
+        function renderStatistics() {
+            document.getElementById('registeredCount').textContent = statsState.registered_count;
+            document.getElementById('todayCount').textContent = statsState.today_count;
+            document.getElementById('currentCount').textContent = currentDetections.size;
+            document.getElementById('avgDuration').textContent = statsState.avg_duration + '分';
+            
+            // 更新人员列表
+            updatePersonList(statsState.person_stats);
+        }
+
         async function loadStatistics() {
             try {
                 let response = await fetch('/statistics');
-                let data = await response.json();
-                
-                document.getElementById('registeredCount').textContent = data.registered_count;
-                document.getElementById('todayCount').textContent = data.today_count;
-                document.getElementById('currentCount').textContent = currentDetections.size;
-                document.getElementById('avgDuration').textContent = data.avg_duration + '分';
-                
-                // 更新人员列表
-                updatePersonList(data.person_stats);
+                statsState = await response.json();
+                renderStatistics();
                 
             } catch (err) {
                 console.error('加载统计失败:', err);
             }
         }
 
+        function applyStatisticsDelta(delta) {
+            Object.assign(statsState, delta.summary);
+            let people = new Map(statsState.person_stats.map(person => [person.name, person]));
+            delta.remove.forEach(name => people.delete(name));
+            delta.upsert.forEach(person => people.set(person.name, person));
+            statsState.person_stats = Array.from(people.values())
+                .sort((a, b) => b.last_seen.localeCompare(a.last_seen));
+            renderStatistics();
+        }
+
+        function subscribeStatistics() {
+            if (!window.EventSource) {
+                startStatisticsPolling();
+                return;
+            }
+            statsStream = new EventSource('/statistics/stream');
+            statsStream.addEventListener('snapshot', event => {
+                statsState = JSON.parse(event.data);
+                renderStatistics();
+            });
+            statsStream.addEventListener('delta', event => {
+                if (statsState) applyStatisticsDelta(JSON.parse(event.data));
+            });
+            statsStream.onerror = () => {
+                // 连接被拒绝（如连接数已满）时浏览器不会自动重连，退回定时轮询
+                if (statsStream.readyState === EventSource.CLOSED) {
+                    statsStream = null;
+                    startStatisticsPolling();
+                }
+            };
+        }
+
+        function startStatisticsPolling() {
+            if (statsPolling) return;
+            loadStatistics();
+            statsPolling = setInterval(loadStatistics, 5000);
+        }
+
         async function loadRegisteredFaces() {
             try {
                 let response = await fetch('/registered_faces');
@@ -753,7 +971,7 @@ HTML_TEMPLATE = '''
                 if (response.ok) {
                     updateStatus(`已删除 ${name}`, '#ff9800');
                     loadRegisteredFaces();
-                    loadStatistics();
+                    if (!statsStream) loadStatistics();
                 }
                 
             } catch (err) {
@@ -809,10 +1027,9 @@ HTML_TEMPLATE = '''
 
         // 页面加载时初始化
         window.onload = () => {
-            loadStatistics();
             loadRegisteredFaces();
-            // 定期刷新统计
-            setInterval(loadStatistics, 5000);
+            // 订阅统计推送，不可用时退回定期轮询
+            subscribeStatistics();
         };
 
         // 页面关闭时清理
@@ -831,54 +1048,67 @@ def index():
 
 @app.route('/recognize', methods=['POST'])
 def recognize_faces():
-    """人脸识别接口"""
+    """人脸识别接口，响应中附带客户端节奏建议"""
+    # 过载时直接拒绝，客户端按建议的时间后重试
+    if not recognition_pacer.try_acquire():
+        retry_after_ms = recognition_pacer.retry_after_ms()
+        response = jsonify({
+            'error': '服务器繁忙，请稍后重试',
+            'retry_after_ms': retry_after_ms,
+            'pacing': recognition_pacer.hints()
+        })
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after_ms / 1000)))
+        return response, 429
+    
     try:
         data = request.json
-        image_data = data['image'].split(',')[1]
-        image = Image.open(io.BytesIO(base64.b64decode(image_data)))
-        
-        # 转换为numpy数组
-        img_array = np.array(image)
-        
-        # 使用face_recognition检测和识别
-        face_locations = face_recognition.face_locations(img_array)
-        face_encodings = face_recognition.face_encodings(img_array, face_locations)
-        
-        faces = []
-        for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-            # 默认为未知
-            name = "Unknown"
-            confidence = 0
-            
-            if known_face_encodings:
-                # 计算与已知人脸的距离
-                face_distances = face_recognition.face_distance(known_face_encodings, face_encoding)
-                
-                if len(face_distances) > 0:
-                    best_match_index = np.argmin(face_distances)
-                    min_distance = face_distances[best_match_index]
-                    
-                    # 如果距离小于阈值，认为是匹配的
-                    if min_distance < 0.6:  # 可调整阈值
-                        name = known_face_names[best_match_index]
-                        confidence = 1 - min_distance
-            
-            faces.append({
-                'bbox': {
-                    'x': left,
-                    'y': top,
-                    'width': right - left,
-                    'height': bottom - top
-                },
-                'name': name,
-                'confidence': confidence
-            })
-        
-        return jsonify({'faces': faces})
+        # 整个请求使用同一个快照，姓名与特征不会错位
+        snapshot = gallery.current
+        camera = data.get('camera') or zones.DEFAULT_CAMERA
+        camera_zone = camera_zones.get(camera)
+        
+        if 'crops' in data:
+            # 裁剪模式：客户端上传已知位置的人脸小图，跳过整帧检测
+            mode = 'crops'
+            crops = data['crops'][:RECOGNIZE_MAX_CROPS]
+            # 画面尺寸用于把区域比例换算成像素，宽高要么都给、要么都不给
+            if ('frame_width' in data) != ('frame_height' in data):
+                return jsonify({'error': 'frame_width 和 frame_height 需要同时提供'}), 400
+            frame_size = None
+            if 'frame_width' in data:
+                frame_size = (data['frame_height'], data['frame_width'])
+                if not all(isinstance(value, (int, float)) and value > 0 for value in frame_size):
+                    return jsonify({'error': 'frame_width 和 frame_height 应为正数'}), 400
+            faces = recognition.recognize_crops(crops, snapshot, recognition_pacer,
+                                                 quality_limits, quality_counters,
+                                                 camera_zone, frame_size, camera_zones.counters(camera))
+            recognize_counters.add('crops_faces', len(crops))
+        else:
+            mode = 'frame'
+            with recognition_pacer.stage('decode'):
+                img_array = recognition.decode_image(data['image'])
+            faces = recognition.recognize_frame(img_array, snapshot, recognition_pacer,
+                                                 quality_limits, quality_counters,
+                                                 camera_zone, camera_zones.counters(camera))
+        
+        recognize_counters.add(f'{mode}_requests')
+        recognize_counters.add(f'{mode}_bytes', request.content_length or 0)
+        
+        return jsonify({'faces': faces, 'pacing': recognition_pacer.hints()})
     
     except Exception as e:
         app.logger.error(f"Recognition error: {str(e)}")
         return jsonify({'error': str(e)}), 500
+    
+    finally:
+        recognition_pacer.release()
+
+def discard_photo(photo_path):
+    """删除注册失败留下的照片；同内容的照片已被其他注册引用时保留"""
+    try:
+        photo_store.remove(photo_path, lambda: store.photo_referenced(photo_path))
+    except Exception as e:
+        app.logger.error(f"Discard photo error: {str(e)}")
 
 @app.route('/register_face', methods=['POST'])
 def register_face():
@@ -886,14 +1116,14 @@ def register_face():
     try:
         data = request.json
         name = data['name']
-        image_data = data['image'].split(',')[1]
-        image = Image.open(io.BytesIO(base64.b64decode(image_data)))
+        photo_data = base64.b64decode(data['image'].split(',')[1])
+        image = Image.open(io.BytesIO(photo_data))
         
         # 转换为numpy数组
         img_array = np.array(image)
         
         # 检测人脸
-        face_locations = face_recognition.face_locations(img_array)
+        face_locations = recognition.detect_faces(img_array)
         
         if len(face_locations) == 0:
             return jsonify({'success': False, 'message': '未检测到人脸'})
@@ -901,38 +1131,40 @@ def register_face():
         if len(face_locations) > 1:
             return jsonify({'success': False, 'message': '检测到多张人脸，请确保只有一个人'})
         
-        # 提取人脸特征
-        face_encodings = face_recognition.face_encodings(img_array, face_locations)
-        face_encoding = face_encodings[0]
-        
-        # 保存到数据库
-        conn = sqlite3.connect('face_records.db')
-        c = conn.cursor()
+        # 质量不足的照片会拉低之后的匹配准确率
+        score = quality.filter_faces(img_array, face_locations, enroll_quality_limits,
+                                     enroll_quality_counters)[0]
+        if not score['passed']:
+            return jsonify({'success': False, 'message': '人脸质量不足：' + score['reason'], 'quality': score})
         
         # 检查是否已存在
-        c.execute("SELECT id FROM registered_faces WHERE name = ?", (name,))
-        if c.fetchone():
-            conn.close()
+        if store.face_exists(name):
             return jsonify({'success': False, 'message': '该姓名已存在'})
         
-        # 保存图片
-        os.makedirs('registered_faces', exist_ok=True)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        photo_path = f'registered_faces/{name}_{timestamp}.jpg'
-        image.save(photo_path)
-        
-        # 保存到数据库
-        encoding_blob = pickle.dumps(face_encoding)
-        c.execute("""INSERT INTO registered_faces (name, encoding, photo_path, created_at)
-                     VALUES (?, ?, ?, ?)""",
-                  (name, encoding_blob, photo_path, datetime.now().isoformat()))
-        
-        conn.commit()
-        conn.close()
-        
-        # 更新内存中的人脸数据
-        known_face_encodings.append(face_encoding)
-        known_face_names.append(name)
+        # 先写入照片原图（记录引用的文件一定存在），再提取人脸特征并保存到数据库，同时发布人脸库变更；
+        # 编码期间切换了编码参数（见 reencode.py）时存储拒绝写入，按新参数重新编码
+        photo_path = photo_store.save(photo_data)
+        try:
+            encoder = gallery.current.encoder or recognition.DEFAULT_ENCODER
+            for _ in range(3):
+                face_encoding = recognition.encode_faces(img_array, face_locations, encoder)[0]
+                try:
+                    version = store.add_face(name, face_encoding, photo_path, encoder=encoder)
+                    break
+                except storage.EncoderChanged as e:
+                    encoder = e.params
+            else:
+                discard_photo(photo_path)
+                return jsonify({'success': False, 'message': '编码参数正在切换，请稍后重试'}), 503
+        except Exception:
+            # 写入失败（如同名注册并发提交）：照片没有被这次注册引用，不能留在磁盘上
+            discard_photo(photo_path)
+            raise
+        photo_store.ensure(photo_data)
+        
+        # 更新本进程内存中的人脸数据，其他副本通过同步线程获取
+        gallery.apply_local('add', name, face_encoding, version)
+        stats_broadcaster.notify()
         
         return jsonify({'success': True, 'message': f'成功注册 {name}'})
     
@@ -949,22 +1181,9 @@ def record_appearance():
         start_time = datetime.fromisoformat(data['start_time'].replace('Z', '+00:00'))
         end_time = datetime.fromisoformat(data['end_time'].replace('Z', '+00:00'))
         
-        duration = (end_time - start_time).total_seconds()
-        
-        conn = sqlite3.connect('face_records.db')
-        c = conn.cursor()
-        
-        # 记录这次出现
-        c.execute("""INSERT INTO appearance_records 
-                     (person_name, start_time, end_time, duration, confidence)
-                     VALUES (?, ?, ?, ?, ?)""",
-                  (name, start_time.isoformat(), end_time.isoformat(), duration, 0.95))
-        
-        conn.commit()
-        conn.close()
-        
-        # 更新统计信息
-        update_person_statistics(name, start_time, end_time)
+        # 记录这次出现并更新统计信息
+        store.record_appearance(name, start_time, end_time, 0.95)
+        stats_broadcaster.notify()
         
         return jsonify({'success': True})
     
@@ -976,66 +1195,61 @@ def record_appearance():
 def get_statistics():
     """获取统计信息"""
     try:
-        conn = sqlite3.connect('face_records.db')
-        c = conn.cursor()
-        
-        # 获取注册人数
-        c.execute("SELECT COUNT(*) FROM registered_faces")
-        registered_count = c.fetchone()[0]
-        
-        # 获取今日签到人数
-        today = datetime.now().date().isoformat()
-        c.execute("""SELECT COUNT(DISTINCT person_name) FROM appearance_records 
-                     WHERE DATE(start_time) = ?""", (today,))
-        today_count = c.fetchone()[0]
-        
-        # 获取平均停留时间（分钟）
-        c.execute("SELECT AVG(duration) FROM appearance_records WHERE DATE(start_time) = ?", (today,))
-        avg_duration = c.fetchone()[0] or 0
-        avg_duration = round(avg_duration / 60, 1)  # 转换为分钟
-        
-        # 获取每个人的统计信息
-        c.execute("""SELECT ps.*, 
-                     (SELECT COUNT(*) FROM appearance_records 
-                      WHERE person_name = ps.person_name AND DATE(start_time) = ?) as today_count
-                     FROM person_statistics ps
-                     ORDER BY ps.last_seen DESC""", (today,))
-        
-        person_stats = []
-        for row in c.fetchall():
-            person_stats.append({
-                'name': row[0],
-                'appearances': row[1],
-                'total_duration': round(row[2] / 60, 1),  # 转换为分钟
-                'last_seen': datetime.fromisoformat(row[3]).strftime('%Y-%m-%d %H:%M'),
-                'today_count': row[5]
-            })
-        
-        conn.close()
-        
-        return jsonify({
-            'registered_count': registered_count,
-            'today_count': today_count,
-            'avg_duration': avg_duration,
-            'person_stats': person_stats
-        })
+        return jsonify(store.statistics())
     
     except Exception as e:
         app.logger.error(f"Statistics error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/statistics/stream', methods=['GET'])
+def stream_statistics():
+    """统计推送（SSE）：连接时发送完整统计，之后只在数据变化时推送增量"""
+    try:
+        subscription = stats_broadcaster.subscribe()
+    except Exception as e:
+        app.logger.error(f"Statistics stream error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    
+    if subscription is None:
+        return jsonify({'error': '推送连接数已满，请使用 /statistics 轮询'}), 503
+    subscriber, snapshot = subscription
+    
+    def generate():
+        try:
+            yield events.format_event('snapshot', snapshot)
+            deadline = time.time() + SSE_MAX_STREAM_SECONDS
+            while time.time() < deadline:
+                try:
+                    yield subscriber.get(timeout=15)
+                except queue.Empty:
+                    # 保活注释，防止代理断开空闲连接
+                    yield ': keepalive\n\n'
+        finally:
+            stats_broadcaster.unsubscribe(subscriber)
+    
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # 请求结束（teardown）时推送还没开始，分道占用改为在连接关闭时释放
+    lane = g.pop('admission_lane', None)
+    
+    def close():
+        stats_broadcaster.unsubscribe(subscriber)
+        if lane is not None:
+            admission_control.release(lane)
+    
+    response.call_on_close(close)
+    return response
+
 @app.route('/registered_faces', methods=['GET'])
 def get_registered_faces():
     """获取已注册的人脸列表"""
     try:
-        conn = sqlite3.connect('face_records.db')
-        c = conn.cursor()
-        
-        c.execute("SELECT name, photo_path FROM registered_faces ORDER BY created_at DESC")
-        
         faces = []
-        for name, photo_path in c.fetchall():
-            # 读取图片并转换为base64
+        for name, photo_path in store.list_faces():
+            # 优先使用缩略图；刚注册、后台尚未写完时跳过
+            thumbnail_path = photo_store.variant_path(photo_path, 'thumb')
+            if os.path.exists(thumbnail_path):
+                photo_path = thumbnail_path
             if os.path.exists(photo_path):
                 with open(photo_path, 'rb') as f:
                     photo_data = base64.b64encode(f.read()).decode()
@@ -1044,8 +1258,6 @@ def get_registered_faces():
                         'photo': f'data:image/jpeg;base64,{photo_data}'
                     })
         
-        conn.close()
-        
         return jsonify({'faces': faces})
     
     except Exception as e:
@@ -1054,37 +1266,24 @@ def get_registered_faces():
 
 @app.route('/delete_face', methods=['POST'])
 def delete_face():
-    """删除注册的人脸"""
+    """删除注册的人脸：立即从人脸库和统计中移除，出现记录和照片由后台清理（进度见 /purges）"""
     try:
         data = request.json
         name = data['name']
         
-        conn = sqlite3.connect('face_records.db')
-        c = conn.cursor()
+        deleted = store.delete_face(name)
         
-        # 获取照片路径
-        c.execute("SELECT photo_path FROM registered_faces WHERE name = ?", (name,))
-        result = c.fetchone()
-        
-        if result:
-            photo_path = result[0]
-            # 删除照片文件
-            if os.path.exists(photo_path):
-                os.remove(photo_path)
+        if deleted:
+            version, photo_path = deleted
+            if purge_worker is not None:
+                purge_worker.notify()
+            elif photo_path:
+                # 不支持后台清理的存储：直接删除照片文件
+                photo_store.remove(photo_path)
             
-            # 从数据库删除
-            c.execute("DELETE FROM registered_faces WHERE name = ?", (name,))
-            
-            # 删除相关记录
-            c.execute("DELETE FROM appearance_records WHERE person_name = ?", (name,))
-            c.execute("DELETE FROM person_statistics WHERE person_name = ?", (name,))
-            
-            conn.commit()
-        
-        conn.close()
-        
-        # 重新加载人脸数据
-        load_registered_faces()
+            # 更新本进程内存中的人脸数据
+            gallery.apply_local('delete', name, version=version)
+            stats_broadcaster.notify()
         
         return jsonify({'success': True})
     
@@ -1092,51 +1291,25 @@ def delete_face():
         app.logger.error(f"Delete error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/purges', methods=['GET'])
+def get_purges():
+    """已删除人员的考勤数据清理进度"""
+    if purge_worker is None:
+        return jsonify({'error': '当前存储不支持后台清理'}), 501
+    return jsonify(purge_worker.stats())
+
 @app.route('/export_data', methods=['GET'])
 def export_data():
-    """导出数据"""
+    """导出数据；?start=2024-01-01&end=2024-02-01 导出指定范围的出现记录（包含已归档的记录）"""
     try:
-        conn = sqlite3.connect('face_records.db')
-        c = conn.cursor()
-        
-        # 获取所有数据
-        data = {
-            'export_time': datetime.now().isoformat(),
-            'registered_faces': [],
-            'appearance_records': [],
-            'statistics': []
-        }
-        
-        # 注册人脸
-        c.execute("SELECT name, created_at FROM registered_faces")
-        for row in c.fetchall():
-            data['registered_faces'].append({
-                'name': row[0],
-                'created_at': row[1]
-            })
-        
-        # 出现记录
-        c.execute("SELECT * FROM appearance_records ORDER BY start_time DESC")
-        for row in c.fetchall():
-            data['appearance_records'].append({
-                'person_name': row[1],
-                'start_time': row[2],
-                'end_time': row[3],
-                'duration': row[4]
-            })
-        
-        # 统计信息
-        c.execute("SELECT * FROM person_statistics")
-        for row in c.fetchall():
-            data['statistics'].append({
-                'person_name': row[0],
-                'total_appearances': row[1],
-                'total_duration': row[2],
-                'first_seen': row[4],
-                'last_seen': row[3]
-            })
-        
-        conn.close()
+        start = request.args.get('start')
+        end = request.args.get('end')
+        if start or end:
+            data = store.export(datetime.fromisoformat(start) if start else None,
+                                datetime.fromisoformat(end) if end else None)
+        else:
+            # 获取热表中的全部数据
+            data = store.export()
         
         # 返回JSON文件
         response = app.response_class(
@@ -1152,27 +1325,169 @@ def export_data():
         app.logger.error(f"Export error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/presence', methods=['GET'])
+def get_presence():
+    """在场查询：?at=2024-01-01T14:30 某一时刻在场的人；?start=...&end=... 该时段内出现过的人（end 默认为现在）"""
+    try:
+        at = request.args.get('at')
+        start = request.args.get('start')
+        if at:
+            return jsonify(presence.present_at(store, datetime.fromisoformat(at)))
+        if not start:
+            return jsonify({'error': '需要 at 或 start 参数'}), 400
+        end = request.args.get('end')
+        return jsonify(presence.present_during(store, datetime.fromisoformat(start),
+                                               datetime.fromisoformat(end) if end else datetime.now()))
+    except ValueError as e:
+        return jsonify({'error': f'时间格式错误: {e}'}), 400
+
+@app.route('/timeline/<name>', methods=['GET'])
+def get_timeline(name):
+    """某人的出现时间线；?start=&end= 默认最近7天"""
+    try:
+        start = request.args.get('start')
+        end = request.args.get('end')
+        return jsonify(presence.timeline(store, name,
+                                         datetime.fromisoformat(start) if start else None,
+                                         datetime.fromisoformat(end) if end else None))
+    except ValueError as e:
+        return jsonify({'error': f'时间格式错误: {e}'}), 400
+
+@app.route('/reports/<kind>', methods=['GET'])
+def get_report(kind):
+    """考勤报表 daily/weekly/monthly；?date=2024-01-15 指定日期（默认今天），?format=csv&table=people|occupancy|arrivals 导出CSV，
+    ?bucket=分钟 指定在场人数曲线的分桶"""
+    try:
+        if kind not in reports.KINDS:
+            return jsonify({'error': f'报表类型应为 {"/".join(reports.KINDS)}'}), 404
+        day = request.args.get('date')
+        day = datetime.fromisoformat(day).date() if day else None
+        bucket = request.args.get('bucket', type=float)
+        report = reports.attendance_report(store, kind, day, bucket)
+        if request.args.get('format') != 'csv':
+            return jsonify(report)
+        table = request.args.get('table', 'people')
+        response = Response(reports.to_csv(report, table), mimetype='text/csv')
+        response.headers['Content-Disposition'] = f'attachment; filename=attendance_{kind}_{report["days"][0]}_{table}.csv'
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/cameras/zones', methods=['GET'])
+def list_camera_zones():
+    """全部摄像头的识别区域"""
+    return jsonify({'cameras': store.camera_zones()})
+
+@app.route('/cameras/<camera>/zones', methods=['GET'])
+def get_camera_zones(camera):
+    """摄像头的识别区域，未配置时为空列表（整帧识别）"""
+    return jsonify({'camera': camera, 'zones': store.camera_zones().get(camera, [])})
+
+@app.route('/cameras/<camera>/zones', methods=['PUT'])
+def set_camera_zones(camera):
+    """设置摄像头的识别区域：{"zones": [{"type": "rect", "x", "y", "width", "height"} |
+    {"type": "polygon", "points": [[x, y], ...]}]}，坐标为相对画面宽高的比例；空列表表示整帧识别"""
+    try:
+        camera_zone_list = zones.parse_zones((request.json or {}).get('zones'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    store.set_camera_zones(camera, camera_zone_list)
+    camera_zones.refresh()
+    return jsonify({'camera': camera, 'zones': camera_zone_list})
+
+@app.route('/cameras/<camera>/zones', methods=['DELETE'])
+def delete_camera_zones(camera):
+    """删除摄像头的识别区域，恢复整帧识别"""
+    existed = store.set_camera_zones(camera, None)
+    camera_zones.refresh()
+    return jsonify({'success': existed}), 200 if existed else 404
+
+@app.route('/backup', methods=['GET'])
+def backup_status():
+    """备份进度与最近的备份"""
+    if backup_manager is None:
+        return jsonify({'error': '当前存储不支持在线备份'}), 501
+    return jsonify(backup_manager.stats())
+
+@app.route('/backup', methods=['POST'])
+def start_backup():
+    """在后台开始一次在线备份，进度通过 GET /backup 查询"""
+    if backup_manager is None:
+        return jsonify({'error': '当前存储不支持在线备份'}), 501
+    if not backup_manager.start():
+        return jsonify({'success': False, 'message': '已有备份正在进行', 'progress': backup_manager.stats()}), 409
+    return jsonify({'success': True, 'message': '备份已开始'}), 202
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    """健康检查接口"""
+    """存活检查接口，不依赖模型加载"""
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
         'version': '2.0.0',
-        'registered_faces': len(known_face_names)
+        'registered_faces': len(gallery.current),
+        'gallery_version': gallery.current.version
     })
 
-if __name__ == '__main__':
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """运行指标"""
+    return jsonify({
+        'recognize': dict(recognition_pacer.stats(), inputs=recognize_counters.snapshot()),
+        'admission': admission_control.stats(),
+        'zones': camera_zones.stats(),
+        'gallery': dict(gallery.current.memory_bytes(), size=len(gallery.current),
+                        quantization=GALLERY_QUANTIZATION,
+                        encoder=gallery.current.encoder or recognition.DEFAULT_ENCODER),
+        'quality': {
+            'recognize': quality_counters.snapshot(),
+            'enroll': enroll_quality_counters.snapshot()
+        },
+        'statistics_stream': {
+            'clients': stats_broadcaster.client_count,
+            'computations': stats_broadcaster.computations
+        },
+        'retention': retention_worker.stats() if retention_worker else None,
+        'purge': purge_worker.stats() if purge_worker else None,
+        'photos': photo_store.stats(),
+        'backup': backup_manager.stats() if backup_manager else None
+    })
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """就绪检查接口：模型预热和人脸库加载完成前返回503"""
+    status = models.status()
+    snapshot = gallery.current
+    status['registered_faces'] = len(snapshot)
+    status['gallery_version'] = snapshot.version
+    return jsonify(status), 200 if status['ready'] else 503
+
+def create_app(preload=False):
+    """应用工厂：准备目录和数据库，并预热模型与人脸库
+
+    preload=True 供gunicorn在fork之前调用（preload_app）：主进程只同步加载人脸库，
+    worker通过写时复制共享内存页；模型由各worker在fork后自行后台预热
+    （gunicorn.conf.py 的 post_fork），主进程不会因预热迟迟不监听端口。
+    否则在后台线程中预热模型并加载人脸库，服务立即可以响应 /health。
+    """
+    import logging
+    logging.basicConfig(level=logging.INFO)
+    
     # 创建必要的目录
     os.makedirs('captures', exist_ok=True)
-    os.makedirs('registered_faces', exist_ok=True)
+    os.makedirs(PHOTOS_DIR, exist_ok=True)
     
     # 初始化数据库
     init_db()
     
-    # 配置日志
-    import logging
-    logging.basicConfig(level=logging.INFO)
+    if preload:
+        load_registered_faces()
+    else:
+        models.start_background_warm_up(load_registered_faces)
     
-    # 启动应用
-    app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
+    return app
+
+if __name__ == '__main__':
+    # 开发服务器，生产环境请使用: gunicorn -c gunicorn.conf.py wsgi:app
+    create_app()
+    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=False)
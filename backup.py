@@ -0,0 +1,288 @@
+"""在线备份：SQLite在线备份API + 注册照片 + 清单与校验和
+
+数据库按 pages_per_step 页一步复制，步与步之间释放读锁，写入只会被短暂阻塞。
+复制期间如果有其他连接写入，SQLite会从头重新复制；连续重来多次时逐步加大步长，
+保证在持续写入下也能完成。归档文件（见 retention.py）同样通过备份API复制。
+
+每次备份生成一个目录 backups/backup-YYYYmmdd-HHMMSS/，内含数据库、照片、归档文件和
+manifest.json（每个文件的大小与SHA-256）。先写入 .partial 目录，完成后再改名，
+因此目录存在即表示备份完整。同一时刻只有一个进程在备份（文件锁）。
+
+    python backup.py create --db face_records.db --backup-dir backups
+    python backup.py verify backups/backup-20240101-020000
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import datetime
+
+import retention
+
+try:
+    import fcntl
+except ImportError:  # Windows 上只做进程内互斥
+    fcntl = None
+
+BACKUP_PREFIX = 'backup-'
+MANIFEST = 'manifest.json'
+DATABASE_FILE = 'face_records.db'
+_HASH_CHUNK = 1 << 20
+
+
+class _Restart(Exception):
+    """备份被并发写入打断次数过多，换更大的步长重来"""
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _file_entry(root, path):
+    return {'path': os.path.relpath(path, root).replace(os.sep, '/'),
+            'bytes': os.path.getsize(path),
+            'sha256': file_sha256(path)}
+
+
+def verify(backup_path):
+    """按清单校验备份，返回 (是否完整, 问题列表)"""
+    with open(os.path.join(backup_path, MANIFEST), encoding='utf-8') as f:
+        manifest = json.load(f)
+    problems = []
+    for entry in manifest['files']:
+        path = os.path.join(backup_path, entry['path'])
+        if not os.path.exists(path):
+            problems.append(f"缺少文件 {entry['path']}")
+        elif file_sha256(path) != entry['sha256']:
+            problems.append(f"校验和不一致 {entry['path']}")
+    return not problems, problems
+
+
+class BackupManager:
+    """执行备份并记录进度；schedule 启动定时备份线程"""
+
+    def __init__(self, connect, backup_dir, photos_dir='registered_faces', archive_dir=None,
+                 pages_per_step=256, step_pause=0.005, max_restarts=3, keep=7):
+        self.connect = connect
+        self.backup_dir = backup_dir
+        self.photos_dir = photos_dir
+        self.archive_dir = archive_dir
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause  # 步与步之间的暂停（秒），期间写入可以提交
+        self.max_restarts = max_restarts  # 同一步长下允许被打断的次数
+        self.keep = keep  # 保留最近几份备份，0表示全部保留
+        self.progress = {'state': 'idle'}
+        self.last = None
+        self.succeeded = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._thread_pid = None
+
+    @property
+    def running(self):
+        return self.progress['state'] == 'running'
+
+    def _update(self, **fields):
+        self.progress = dict(self.progress, **fields)
+
+    def _copy_database(self, source, target, phase):
+        """用在线备份API复制数据库，返回 (步数, 重来次数)"""
+        pages = self.pages_per_step
+        steps = 0
+        restarts = 0
+        while True:
+            seen = {'remaining': None, 'restarts': 0}
+
+            def on_progress(status, remaining, total):
+                nonlocal steps
+                steps += 1
+                # 剩余页数回升说明源库被其他连接修改，SQLite已从头开始
+                if seen['remaining'] is not None and remaining > seen['remaining']:
+                    seen['restarts'] += 1
+                    if pages > 0 and seen['restarts'] > self.max_restarts:
+                        raise _Restart()
+                seen['remaining'] = remaining
+                self._update(phase=phase, pages_total=total, pages_done=total - remaining)
+
+            with closing(source()) as src, closing(sqlite3.connect(target)) as dst:
+                try:
+                    src.backup(dst, pages=pages, progress=on_progress, sleep=self.step_pause)
+                    return steps, restarts + seen['restarts']
+                except _Restart:
+                    restarts += seen['restarts']
+            # 步长放大4倍；超过总页数后一次复制完（期间短暂阻塞写入）
+            total = self.progress.get('pages_total') or 0
+            pages = -1 if pages * 4 >= total else pages * 4
+            logging.getLogger(__name__).info('备份被并发写入打断，步长调整为 %s', pages)
+
+    def run(self):
+        """执行一次备份，返回清单；已有备份在进行时返回None"""
+        if not self._lock.acquire(blocking=False):
+            return None
+        return self._run_locked()
+
+    def _run_locked(self):
+        os.makedirs(self.backup_dir, exist_ok=True)
+        lock_file = open(os.path.join(self.backup_dir, '.lock'), 'w')
+        try:
+            try:
+                # 跨进程互斥：gunicorn的每个worker都可能触发备份
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                logging.getLogger(__name__).info('其他进程正在备份，跳过')
+                return None
+            return self._run()
+        finally:
+            lock_file.close()
+            self._lock.release()
+
+    def _run(self):
+        started_at = datetime.now()
+        started = time.perf_counter()
+        name = BACKUP_PREFIX + started_at.strftime('%Y%m%d-%H%M%S')
+        final_path = os.path.join(self.backup_dir, name)
+        partial_path = final_path + '.partial'
+        self.progress = {'state': 'running', 'backup': name, 'started_at': started_at.isoformat(),
+                         'phase': 'database', 'pages_done': 0, 'pages_total': None}
+        try:
+            shutil.rmtree(partial_path, ignore_errors=True)
+            os.makedirs(partial_path)
+            database_path = os.path.join(partial_path, DATABASE_FILE)
+            steps, restarts = self._copy_database(self.connect, database_path, 'database')
+            with closing(sqlite3.connect(database_path)) as conn:
+                check = conn.execute("PRAGMA quick_check").fetchone()[0]
+                schema_version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if check != 'ok':
+                raise RuntimeError(f'备份数据库校验失败: {check}')
+
+            # 归档文件也可能正被归档线程写入，同样走备份API
+            if self.archive_dir:
+                archive_target = os.path.join(partial_path, 'archive')
+                os.makedirs(archive_target, exist_ok=True)
+                for month in retention.archive_months(self.archive_dir):
+                    source = retention.archive_path(self.archive_dir, month)
+                    self._copy_database(lambda: sqlite3.connect(source),
+                                        retention.archive_path(archive_target, month), f'archive {month}')
+
+            # 跳过照片写入线程尚未原子替换的临时文件
+            photos = sorted(photo for photo in os.listdir(self.photos_dir)
+                            if not photo.endswith('.tmp')) if os.path.isdir(self.photos_dir) else []
+            photo_target = os.path.join(partial_path, os.path.basename(os.path.normpath(self.photos_dir)))
+            os.makedirs(photo_target, exist_ok=True)
+            for i, photo in enumerate(photos):
+                shutil.copy2(os.path.join(self.photos_dir, photo), photo_target)
+                self._update(phase='photos', files_done=i + 1, files_total=len(photos))
+
+            self._update(phase='manifest')
+            files = []
+            for root, _, names in os.walk(partial_path):
+                files.extend(_file_entry(partial_path, os.path.join(root, n)) for n in sorted(names))
+            manifest = {
+                'name': name,
+                'created_at': started_at.isoformat(),
+                'duration_s': round(time.perf_counter() - started, 3),
+                'schema_version': schema_version,
+                'database_steps': steps,
+                'database_restarts': restarts,
+                'bytes': sum(entry['bytes'] for entry in files),
+                'files': files,
+            }
+            with open(os.path.join(partial_path, MANIFEST), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2, ensure_ascii=False)
+            os.replace(partial_path, final_path)
+            self._prune()
+
+            self.succeeded += 1
+            self.last = {key: manifest[key] for key in ('name', 'created_at', 'duration_s', 'bytes',
+                                                        'database_restarts')}
+            self.last.update(ok=True, files=len(files))
+            return manifest
+        except Exception as e:
+            self.failed += 1
+            self.last = {'name': name, 'created_at': started_at.isoformat(), 'ok': False, 'error': str(e),
+                         'duration_s': round(time.perf_counter() - started, 3)}
+            shutil.rmtree(partial_path, ignore_errors=True)
+            raise
+        finally:
+            self.progress = {'state': 'idle'}
+
+    def backups(self):
+        """已完成的备份名称，从新到旧"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        return sorted((n for n in os.listdir(self.backup_dir)
+                       if n.startswith(BACKUP_PREFIX) and not n.endswith('.partial')), reverse=True)
+
+    def _prune(self):
+        if self.keep:
+            for old in self.backups()[self.keep:]:
+                shutil.rmtree(os.path.join(self.backup_dir, old), ignore_errors=True)
+
+    def start(self):
+        """在后台线程中执行一次备份；已在进行时返回False"""
+        if not self._lock.acquire(blocking=False):
+            return False
+        threading.Thread(target=self._run_logged, args=(self._run_locked,), name='backup', daemon=True).start()
+        return True
+
+    def _run_logged(self, run=None):
+        try:
+            manifest = (run or self.run)()
+            if manifest:
+                logging.getLogger(__name__).info('备份完成 %s（%.1f秒）', manifest['name'], manifest['duration_s'])
+        except Exception:
+            logging.getLogger(__name__).exception('备份失败')
+
+    def schedule(self, interval):
+        """每个进程启动一次定时备份线程；多个进程同时到点时只有一个真正执行"""
+        if interval > 0 and self._thread_pid != os.getpid():
+            self._thread_pid = os.getpid()
+            threading.Thread(target=self._schedule_loop, args=(interval,), name='backup-schedule',
+                             daemon=True).start()
+
+    def _schedule_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            self._run_logged()
+
+    def stats(self):
+        return dict(self.progress, succeeded=self.succeeded, failed=self.failed, last=self.last,
+                    backups=self.backups()[:self.keep or None])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='在线备份与校验')
+    sub = parser.add_subparsers(dest='command', required=True)
+    create = sub.add_parser('create', help='立即备份')
+    create.add_argument('--db', default=os.environ.get('FACE_DB_PATH', 'face_records.db'))
+    create.add_argument('--backup-dir', default=os.environ.get('BACKUP_DIR', 'backups'))
+    create.add_argument('--photos-dir', default='registered_faces')
+    create.add_argument('--archive-dir', default=os.environ.get('ARCHIVE_DIR', 'archive'))
+    check = sub.add_parser('verify', help='按清单校验备份')
+    check.add_argument('path')
+    args = parser.parse_args(argv)
+
+    if args.command == 'verify':
+        ok, problems = verify(args.path)
+        print(json.dumps({'ok': ok, 'problems': problems}, indent=2, ensure_ascii=False))
+        raise SystemExit(0 if ok else 1)
+    manager = BackupManager(lambda: sqlite3.connect(args.db), args.backup_dir, args.photos_dir,
+                            args.archive_dir if os.path.isdir(args.archive_dir) else None)
+    manifest = manager.run()
+    print(json.dumps({key: value for key, value in manifest.items() if key != 'files'},
+                     indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+"""性能基准测试套件
+
+用法（在项目根目录执行）：
+    python -m bench.run --scale small,medium --output bench_output.json
+    python -m bench.compare old.json new.json
+"""
@@ -0,0 +1,64 @@
+"""对比两次基准测试结果，超过阈值的退化会以非零状态码退出
+
+    python -m bench.compare baseline.json current.json --threshold 0.15
+"""
+import argparse
+import json
+import sys
+
+METRICS = [('p50_ms', True), ('p99_ms', True), ('throughput_rps', False), ('peak_rss_bytes', True)]
+
+
+def index_results(report):
+    """(规模, 接口) -> 指标"""
+    results = {}
+    for scale in report['scales']:
+        for endpoint, metrics in scale['endpoints'].items():
+            results[(scale['scale'], endpoint)] = metrics
+        if scale.get('match_only'):
+            results[(scale['scale'], 'match_only')] = scale['match_only']
+    return results
+
+
+def compare(baseline, current, threshold):
+    """返回 (对比行, 是否有退化)"""
+    old = index_results(baseline)
+    new = index_results(current)
+    rows = []
+    regressed = False
+    for key in sorted(old.keys() & new.keys()):
+        for metric, lower_is_better in METRICS:
+            before = old[key].get(metric)
+            after = new[key].get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            worse = change > threshold if lower_is_better else change < -threshold
+            regressed = regressed or worse
+            rows.append((key[0], key[1], metric, before, after, change, worse))
+    return rows, regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='对比两次基准测试结果')
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.15, help='允许的相对变化（默认15%%）')
+    args = parser.parse_args(argv)
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, encoding='utf-8') as f:
+        current = json.load(f)
+
+    print(f"baseline {baseline.get('revision')} -> current {current.get('revision')}")
+    rows, regressed = compare(baseline, current, args.threshold)
+    for scale, endpoint, metric, before, after, change, worse in rows:
+        flag = '  <-- 退化' if worse else ''
+        print(f'{scale:>8} {endpoint:<22} {metric:<15} {before:>14.3f} {after:>14.3f} {change:+8.1%}{flag}')
+
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
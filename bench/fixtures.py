@@ -0,0 +1,175 @@
+"""基准测试数据：合成人脸图片与不同规模的种子数据库"""
+import base64
+import io
+import os
+import pickle
+import random
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timedelta
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+# 预设规模：(注册人数, 出现记录数)
+SCALES = {
+    'small': (10, 10_000),
+    'medium': (1_000, 1_000_000),
+    'large': (100_000, 10_000_000),
+}
+
+SEED_BATCH = 50_000
+
+
+def synthetic_face_image(seed, size=(640, 480)):
+    """生成一张带有简单人脸轮廓的合成图片（PIL Image）"""
+    rng = random.Random(seed)
+    width, height = size
+    bg = tuple(rng.randint(90, 160) for _ in range(3))
+    image = Image.new('RGB', size, bg)
+    draw = ImageDraw.Draw(image)
+
+    # 脸部
+    face_w = rng.randint(width // 5, width // 3)
+    face_h = int(face_w * 1.3)
+    cx = rng.randint(face_w, width - face_w)
+    cy = rng.randint(face_h // 2 + 10, height - face_h // 2 - 10)
+    skin = (rng.randint(190, 235), rng.randint(150, 190), rng.randint(120, 160))
+    draw.ellipse([cx - face_w // 2, cy - face_h // 2, cx + face_w // 2, cy + face_h // 2], fill=skin)
+
+    # 眼睛、鼻子、嘴巴
+    eye_y = cy - face_h // 8
+    eye_dx = face_w // 5
+    eye_r = max(face_w // 18, 2)
+    for ex in (cx - eye_dx, cx + eye_dx):
+        draw.ellipse([ex - eye_r * 2, eye_y - eye_r, ex + eye_r * 2, eye_y + eye_r], fill=(245, 245, 245))
+        draw.ellipse([ex - eye_r, eye_y - eye_r, ex + eye_r, eye_y + eye_r], fill=(40, 30, 20))
+    draw.line([cx, eye_y + eye_r * 2, cx - eye_r, cy + face_h // 10], fill=(150, 100, 80), width=2)
+    mouth_y = cy + face_h // 5
+    draw.arc([cx - face_w // 5, mouth_y - face_h // 12, cx + face_w // 5, mouth_y + face_h // 12],
+             20, 160, fill=(150, 50, 50), width=3)
+
+    return image.filter(ImageFilter.GaussianBlur(1))
+
+
+def load_face_images(faces_dir=None, count=8, seed=0):
+    """读取指定目录中的人脸图片；未指定时返回合成图片"""
+    images = []
+    if faces_dir:
+        for filename in sorted(os.listdir(faces_dir)):
+            if filename.lower().endswith(('.jpg', '.jpeg', '.png')):
+                images.append(Image.open(os.path.join(faces_dir, filename)).convert('RGB'))
+    if not images:
+        images = [synthetic_face_image(seed + i) for i in range(count)]
+    return images
+
+
+def image_to_data_url(image, quality=80):
+    """把图片编码为前端上传时使用的 data URL"""
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+
+def face_crop(image, size=160, quality=80):
+    """从画面中心裁出一块，作为裁剪模式的上传内容（整块视为人脸）"""
+    width, height = image.size
+    side = min(width, height) // 2
+    left, top = (width - side) // 2, (height - side) // 2
+    crop = image.crop((left, top, left + side, top + side)).resize((size, size))
+    return {'image': image_to_data_url(crop, quality), 'x': left, 'y': top, 'scale': size / side}
+
+
+def random_encoding(rng):
+    """生成与face_recognition编码形状一致的随机128维特征"""
+    return rng.normal(0, 0.09, 128)
+
+
+def create_legacy_tables(db_path):
+    """按迁移前的结构建表（person_name 与ISO时间字符串），用于迁移测试和对比"""
+    with closing(sqlite3.connect(db_path)) as conn:
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS registered_faces
+                (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE, encoding BLOB,
+                 photo_path TEXT, created_at TEXT);
+            CREATE TABLE IF NOT EXISTS appearance_records
+                (id INTEGER PRIMARY KEY AUTOINCREMENT, person_name TEXT, start_time TEXT,
+                 end_time TEXT, duration REAL, confidence REAL);
+            CREATE TABLE IF NOT EXISTS person_statistics
+                (person_name TEXT PRIMARY KEY, total_appearances INTEGER, total_duration REAL,
+                 last_seen TEXT, first_seen TEXT);
+            CREATE TABLE IF NOT EXISTS gallery_events
+                (version INTEGER PRIMARY KEY AUTOINCREMENT, op TEXT, name TEXT, encoding BLOB,
+                 created_at TEXT);
+        ''')
+
+
+def seed_database(db_path, people, records, seed=0, photo_path=None, legacy=False):
+    """向数据库批量写入注册人脸、出现记录与统计数据
+
+    legacy=True 时写入以姓名和ISO字符串存储的旧版考勤表（需先由 create_legacy_tables 建表）。
+    """
+    from storage import to_ms
+
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    now = datetime.now()
+
+    names = [f'person_{i:06d}' for i in range(people)]
+    person_ids = {}
+    for start in range(0, people, SEED_BATCH):
+        rows = []
+        for name in names[start:start + SEED_BATCH]:
+            rows.append((name, pickle.dumps(random_encoding(rng)), photo_path or '',
+                         (now - timedelta(days=60)).isoformat()))
+        c.executemany("""INSERT INTO registered_faces (name, encoding, photo_path, created_at)
+                         VALUES (?, ?, ?, ?)""", rows)
+        conn.commit()
+    person_ids.update(c.execute("SELECT name, id FROM registered_faces").fetchall())
+
+    # 出现记录分布在最近30天内，约十分之一落在今天
+    span = 30 * 24 * 3600
+    day_start = datetime(now.year, now.month, now.day)
+    elapsed_today = max(int((now - day_start).total_seconds()), 1)
+    for start in range(0, records, SEED_BATCH):
+        n = min(SEED_BATCH, records - start)
+        person_idx = rng.integers(0, people, n)
+        offsets = rng.integers(0, span, n)
+        today_mask = rng.random(n) < 0.1
+        durations = rng.integers(5, 3600, n)
+        rows = []
+        for idx, offset, is_today, duration in zip(person_idx, offsets, today_mask, durations):
+            if is_today:
+                start_time = day_start + timedelta(seconds=int(offset) % elapsed_today)
+            else:
+                start_time = now - timedelta(seconds=int(offset))
+            end_time = start_time + timedelta(seconds=int(duration))
+            if legacy:
+                rows.append((names[idx], start_time.isoformat(), end_time.isoformat(), float(duration), 0.95))
+            else:
+                rows.append((person_ids[names[idx]], to_ms(start_time), to_ms(end_time), float(duration), 0.95))
+        if legacy:
+            c.executemany("""INSERT INTO appearance_records
+                             (person_name, start_time, end_time, duration, confidence)
+                             VALUES (?, ?, ?, ?, ?)""", rows)
+        else:
+            c.executemany("""INSERT INTO appearances
+                             (person_id, start_ms, end_ms, duration, confidence)
+                             VALUES (?, ?, ?, ?, ?)""", rows)
+        conn.commit()
+
+    # 由出现记录汇总统计表
+    if legacy:
+        c.execute("""INSERT OR REPLACE INTO person_statistics
+                     (person_name, total_appearances, total_duration, last_seen, first_seen)
+                     SELECT person_name, COUNT(*), SUM(duration), MAX(end_time), MIN(start_time)
+                     FROM appearance_records GROUP BY person_name""")
+    else:
+        c.execute("""INSERT OR REPLACE INTO person_stats
+                     (person_id, total_appearances, total_duration, last_seen_ms, first_seen_ms)
+                     SELECT person_id, COUNT(*), SUM(duration), MAX(end_ms), MIN(start_ms)
+                     FROM appearances GROUP BY person_id""")
+    conn.commit()
+    conn.close()
+    return names
@@ -0,0 +1,105 @@
+"""人脸库fork回归测试：模拟 preload_app，master建好人脸库后fork出多个worker各自注册
+
+    python -m bench.fork_gallery --people 200 --workers 2
+
+每个worker先注册一个只属于自己的人，再像同步线程一样按版本顺序应用其他worker的注册，
+然后检查每个新注册的人都匹配到本人。全精度特征落盘（mmap）时，若映射在进程间共享，
+各worker的追加会写进同一行，出现匹配到别人的结果。发现错位时以非零状态码退出。
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import zlib
+
+import numpy as np
+
+from bench.run import REPO_ROOT
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from gallery import Gallery  # noqa: E402
+
+
+def encoding_for(name):
+    return np.random.default_rng(zlib.crc32(name.encode())).normal(0, 0.09, 128)
+
+
+def worker_encoding(index):
+    # 幅度减半，落在已有人员的 int8 缩放范围内，注册走追加而不是整体重建
+    return encoding_for(f'worker_{index}') * 0.5
+
+
+def run_worker(gallery, index, workers, base_version, wait_turn, done):
+    """在子进程中执行：返回错位的 [(姓名, 匹配结果)]"""
+    own = f'worker_{index}'
+    # 各worker按序号依次注册（版本号 base_version + 1 ...），worker_0 的版本号是紧接着的下一个，
+    # 直接推进版本、不会再被同步覆盖；全部注册完后再同步其他worker的变更
+    wait_turn()
+    gallery.apply_local('add', own, worker_encoding(index), base_version + 1 + index)
+    done()
+    wait_turn()
+    changes = [(base_version + 1 + i, 'add', f'worker_{i}', worker_encoding(i)) for i in range(workers)]
+    gallery.apply(changes)
+    snapshot = gallery.current
+    errors = []
+    for i in range(workers):
+        name = f'worker_{i}'
+        matched, _ = snapshot.match(worker_encoding(i))
+        if matched != name:
+            errors.append((name, matched))
+    return errors
+
+
+def run_case(quantization, people, workers, spill_dir):
+    gallery = Gallery(quantization=quantization, spill_dir=spill_dir)
+    names = [f'person_{i:06d}' for i in range(people)]
+    gallery.replace(names, [encoding_for(name) for name in names], 1)
+    done_read, done_write = os.pipe()
+    children = []
+    for index in range(workers):
+        read_fd, write_fd = os.pipe()
+        turn_read, turn_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            try:
+                errors = run_worker(gallery, index, workers, 1, lambda: os.read(turn_read, 1),
+                                    lambda: os.write(done_write, b'.'))
+                os.write(write_fd, json.dumps(errors).encode())
+            finally:
+                os._exit(0)
+        os.close(write_fd)
+        children.append((pid, read_fd, turn_write))
+    for _, _, turn_write in children:
+        os.write(turn_write, b'.')
+        os.read(done_read, 1)
+    for _, _, turn_write in children:
+        os.write(turn_write, b'.')
+    errors = []
+    for pid, read_fd, _ in children:
+        with os.fdopen(read_fd, 'rb') as f:
+            output = f.read()
+        os.waitpid(pid, 0)
+        errors += json.loads(output) if output else [['worker', 'crashed']]
+    return {'quantization': quantization, 'spill': bool(spill_dir), 'mismatches': errors}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='人脸库fork回归测试')
+    parser.add_argument('--people', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args(argv)
+
+    spill_dir = tempfile.mkdtemp(prefix='facefork_')
+    cases = [run_case(quantization, args.people, args.workers, spill)
+             for quantization in ('none', 'float16', 'int8')
+             for spill in ((None,) if quantization == 'none' else (None, spill_dir))]
+    print(json.dumps(cases, indent=2, ensure_ascii=False))
+    sys.exit(1 if any(case['mismatches'] for case in cases) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""区间查询对比：R*Tree区间索引 与 仅按开始时间索引
+
+    python -m bench.interval_queries --scale 1000x1000000 --iterations 50
+
+生成数据库后复制一份并删除区间索引（及其触发器），在两边执行相同的随机时段查询
+（某一时刻在场、一小时内出现过），报告延迟并检查结果是否一致。
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+from contextlib import closing
+from datetime import datetime, timedelta
+
+from bench.run import REPO_ROOT, measure
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from bench import fixtures  # noqa: E402
+import storage  # noqa: E402
+from storage import SQLiteStore  # noqa: E402
+
+
+def drop_interval_index(db_path):
+    with closing(sqlite3.connect(db_path)) as conn:
+        for name in storage._INTERVAL_TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute("DROP TABLE IF EXISTS appearance_intervals")
+        conn.commit()
+
+
+def random_windows(count, minutes, seed):
+    """最近30天内的随机查询时段"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    windows = []
+    for _ in range(count):
+        start = now - timedelta(seconds=rng.randint(0, 30 * 24 * 3600))
+        windows.append((start, start + timedelta(minutes=minutes)))
+    return windows
+
+
+def measure_queries(store, windows, iterations):
+    def call(i):
+        start, end = windows[i % len(windows)]
+        store.appearances_overlapping(start, end)
+        return True
+    return measure(call, iterations)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='区间查询对比')
+    parser.add_argument('--scale', default='1000x1000000', help='注册人数x出现记录数，或 small/medium/large')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.scale in fixtures.SCALES:
+        people, records = fixtures.SCALES[args.scale]
+    else:
+        people, records = (int(part) for part in args.scale.split('x'))
+
+    workdir = tempfile.mkdtemp(prefix='faceintervals_')
+    indexed_path = os.path.join(workdir, 'indexed.db')
+    plain_path = os.path.join(workdir, 'plain.db')
+    try:
+        SQLiteStore(indexed_path).init_schema()
+        fixtures.seed_database(indexed_path, people, records, seed=args.seed)
+        shutil.copyfile(indexed_path, plain_path)
+        drop_interval_index(plain_path)
+        indexed, plain = SQLiteStore(indexed_path), SQLiteStore(plain_path)
+
+        report = {'people': people, 'records': records}
+        for label, minutes in (('point', 0.001), ('hour', 60)):
+            windows = random_windows(args.iterations, minutes, args.seed)
+            with_index = measure_queries(indexed, windows, args.iterations)
+            without_index = measure_queries(plain, windows, args.iterations)
+            report[label] = {
+                'rtree': with_index,
+                'start_index': without_index,
+                'speedup': round(without_index['mean_ms'] / with_index['mean_ms'], 2),
+                'results_match': all(indexed.appearances_overlapping(s, e) == plain.appearances_overlapping(s, e)
+                                     for s, e in windows),
+            }
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""对比开发服务器与gunicorn生产模式的吞吐量
+
+    python -m bench.load_compare --endpoint /statistics --clients 16 --duration 20
+    python -m bench.load_compare --endpoint /recognize --workers 4 --threads 2
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+from bench import fixtures
+from bench.run import REPO_ROOT
+
+
+def wait_until_up(base_url, timeout=120):
+    """轮询/health直到服务可用"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(base_url + '/health', timeout=2) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.5)
+    return False
+
+
+def prepare_workdir(people, records, seed):
+    """建库并写入种子数据，两种服务模式共用同一份数据"""
+    workdir = tempfile.mkdtemp(prefix='faceload_')
+    subprocess.check_call([sys.executable, '-c', 'import app; app.init_db()'], cwd=workdir,
+                          env=dict(os.environ, PYTHONPATH=REPO_ROOT))
+    fixtures.seed_database(os.path.join(workdir, 'face_records.db'), people, records, seed=seed)
+    return workdir
+
+
+def start_server(mode, workdir, port, args):
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT, PORT=str(port),
+               GUNICORN_WORKERS=str(args.workers), GUNICORN_THREADS=str(args.threads),
+               GUNICORN_ACCESS_LOG='')
+    if mode == 'dev':
+        cmd = [sys.executable, os.path.join(REPO_ROOT, 'app.py')]
+    else:
+        cmd = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(REPO_ROOT, 'gunicorn.conf.py'), 'wsgi:app']
+    return subprocess.Popen(cmd, cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def drive(base_url, endpoint, body, clients, duration):
+    """多线程持续请求，返回延迟与吞吐"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def client():
+        local = []
+        failed = 0
+        while time.time() < stop_at:
+            req = urllib.request.Request(base_url + endpoint, data=body,
+                                         headers={'Content-Type': 'application/json'} if body else {})
+            t0 = time.perf_counter()
+            try:
+                with urllib.request.urlopen(req, timeout=60) as response:
+                    response.read()
+            except (urllib.error.URLError, ConnectionError, OSError):
+                failed += 1
+                continue
+            local.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    started = time.time()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.time() - started
+
+    samples = np.array(latencies or [0.0]) * 1000
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'throughput_rps': round(len(latencies) / wall, 2),
+        'p50_ms': round(float(np.percentile(samples, 50)), 2),
+        'p99_ms': round(float(np.percentile(samples, 99)), 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='开发服务器与gunicorn吞吐量对比')
+    parser.add_argument('--endpoint', default='/statistics')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--people', type=int, default=100)
+    parser.add_argument('--records', type=int, default=100_000)
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    body = None
+    if args.endpoint == '/recognize':
+        frame = fixtures.image_to_data_url(fixtures.synthetic_face_image(args.seed))
+        body = json.dumps({'image': frame}).encode()
+
+    workdir = prepare_workdir(args.people, args.records, args.seed)
+    base_url = f'http://127.0.0.1:{args.port}'
+    report = {'endpoint': args.endpoint, 'clients': args.clients, 'duration_s': args.duration,
+              'workers': args.workers, 'threads': args.threads, 'modes': {}}
+
+    for mode in ('dev', 'gunicorn'):
+        server = start_server(mode, workdir, args.port, args)
+        try:
+            if not wait_until_up(base_url):
+                report['modes'][mode] = {'error': '服务启动超时'}
+                continue
+            report['modes'][mode] = drive(base_url, args.endpoint, body, args.clients, args.duration)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+
+    dev = report['modes'].get('dev', {}).get('throughput_rps')
+    prod = report['modes'].get('gunicorn', {}).get('throughput_rps')
+    if dev and prod:
+        report['speedup'] = round(prod / dev, 2)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
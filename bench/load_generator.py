@@ -0,0 +1,355 @@
+"""多摄像头负载生成与流量回放
+
+    python -m bench.load_generator --cameras 10,50,100,200 --fps 5 --stage-seconds 30
+    python -m bench.load_generator --replay recorded_frames/ --cameras 20 --crops
+    python -m bench.load_generator --url http://10.0.0.5:5000 --cameras 50 --pollers 10
+
+每个虚拟摄像头与页面端一样按 --fps 向 /recognize 发送画面，同一时刻最多一个请求在途
+（处理不过来时实际帧率自然下降）；同时有看板轮询 /statistics 与 /registered_faces，
+并定期突发一批 /record_appearance。全部客户端跑在一个asyncio事件循环里，HTTP/1.1长连接
+由标准库实现，一个进程可以驱动数百个客户端。
+
+--cameras 给出多个值时逐级加压，每级运行 --stage-seconds 秒，报告各接口的延迟分位数、
+错误率与被拒绝（429/503）比例；摄像头实际帧率低于目标的90%、错误与拒绝超过1%
+或 /recognize 的p99超过 --slo-ms 的第一级即为饱和点。
+
+--replay 指定录制的帧目录：其中的子目录各是一路摄像头的帧序列，没有子目录时所有摄像头
+错开起点共用同一序列；未指定时使用合成图片。未指定 --url 时在本地启动服务并写入种子数据。
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import signal
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+import numpy as np
+from PIL import Image
+
+from bench import fixtures
+from bench.load_compare import prepare_workdir, start_server, wait_until_up
+
+REJECTED = (429, 503)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+class HttpConnection:
+    """一条keep-alive连接上的最小HTTP/1.1客户端"""
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None):
+        """返回 (状态码, 响应体)；复用的连接已被服务器关闭时重连一次"""
+        reused = self.writer is not None
+        if not reused:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            return await asyncio.wait_for(self._exchange(method, path, body), self.timeout)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.close()
+            if not reused:
+                raise
+            return await self.request(method, path, body)
+        except asyncio.TimeoutError:
+            self.close()
+            raise
+
+    async def _exchange(self, method, path, body):
+        head = f'{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nConnection: keep-alive\r\n'
+        if body is not None:
+            head += f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+        self.writer.write(head.encode() + b'\r\n' + (body or b''))
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('连接已被服务器关闭')
+        status = int(status_line.split()[1])
+        length = None
+        chunked = close = False
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name, value = name.strip().lower(), value.strip().lower()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'transfer-encoding':
+                chunked = 'chunked' in value
+            elif name == 'connection':
+                close = value == 'close'
+        if chunked:
+            data = b''
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                data += await self.reader.readexactly(size + 2)
+                if not size:
+                    break
+        elif length is not None:
+            data = await self.reader.readexactly(length)
+        else:
+            data = await self.reader.read()
+            close = True
+        # 开发服务器使用HTTP/1.0语义，每次响应后关闭连接
+        if close or status_line.startswith(b'HTTP/1.0'):
+            self.close()
+        return status, data
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.rejected = 0
+
+    def summary(self, seconds):
+        total = len(self.latencies) + self.errors + self.rejected
+        samples = np.array(self.latencies or [0.0]) * 1000
+        return {
+            'requests': total,
+            'ok': len(self.latencies),
+            'errors': self.errors,
+            'rejected': self.rejected,
+            'error_rate': round(self.errors / total, 4) if total else 0.0,
+            'reject_rate': round(self.rejected / total, 4) if total else 0.0,
+            'throughput_rps': round(len(self.latencies) / seconds, 2),
+            'p50_ms': round(float(np.percentile(samples, 50)), 2),
+            'p90_ms': round(float(np.percentile(samples, 90)), 2),
+            'p99_ms': round(float(np.percentile(samples, 99)), 2),
+            'max_ms': round(float(samples.max()), 2),
+        }
+
+
+async def timed(conn, stats, method, path, body=None):
+    """发送一次请求并计入统计；成功的请求才记录延迟"""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    try:
+        status, _ = await conn.request(method, path, body)
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+        stats.errors += 1
+        return
+    if status in REJECTED:
+        stats.rejected += 1
+    elif status >= 400:
+        stats.errors += 1
+    else:
+        stats.latencies.append(loop.time() - started)
+
+
+def _data_url(path):
+    if path.lower().endswith(('.jpg', '.jpeg')):
+        with open(path, 'rb') as f:
+            return 'data:image/jpeg;base64,' + base64.b64encode(f.read()).decode()
+    return fixtures.image_to_data_url(Image.open(path).convert('RGB'))
+
+
+def _images(directory):
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if name.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+def load_sequences(replay_dir, crops, seed):
+    """帧序列列表，每个元素是已编码好的 /recognize 请求体列表"""
+    def body(image):
+        """image 为图片文件路径或PIL图片"""
+        if crops:
+            if isinstance(image, str):
+                image = Image.open(image).convert('RGB')
+            return json.dumps({'crops': [fixtures.face_crop(image)]}).encode()
+        url = _data_url(image) if isinstance(image, str) else fixtures.image_to_data_url(image)
+        return json.dumps({'image': url}).encode()
+
+    if not replay_dir:
+        return [[body(image) for image in fixtures.load_face_images(count=16, seed=seed)]]
+    subdirs = sorted(os.path.join(replay_dir, name) for name in os.listdir(replay_dir)
+                     if os.path.isdir(os.path.join(replay_dir, name)))
+    sequences = [[body(path) for path in _images(d)] for d in subdirs] or [[body(path) for path in _images(replay_dir)]]
+    sequences = [sequence for sequence in sequences if sequence]
+    if not sequences:
+        raise SystemExit(f'{replay_dir} 中没有图片')
+    return sequences
+
+
+async def camera(make_conn, frames, offset, fps, stop_at, stats):
+    """虚拟摄像头：按目标帧率发送，最多一个请求在途；返回发送的帧数"""
+    loop = asyncio.get_running_loop()
+    conn = make_conn()
+    interval = 1 / fps
+    next_at = loop.time() + random.random() * interval  # 错开各摄像头的起点
+    sent = 0
+    try:
+        while True:
+            delay = next_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if loop.time() >= stop_at:
+                return sent
+            await timed(conn, stats, 'POST', '/recognize', frames[(offset + sent) % len(frames)])
+            sent += 1
+            next_at = max(next_at + interval, loop.time())
+    finally:
+        conn.close()
+
+
+async def poller(make_conn, interval, stop_at, stats):
+    """看板：与页面一样同时刷新统计与人脸列表"""
+    loop = asyncio.get_running_loop()
+    conn = make_conn()
+    await asyncio.sleep(random.random() * interval)
+    try:
+        while loop.time() < stop_at:
+            await timed(conn, stats['/statistics'], 'GET', '/statistics')
+            await timed(conn, stats['/registered_faces'], 'GET', '/registered_faces')
+            await asyncio.sleep(min(interval, max(stop_at - loop.time(), 0)))
+    finally:
+        conn.close()
+
+
+async def bursts(make_conn, names, size, interval, stop_at, stats):
+    """每隔 interval 秒并发写入 size 条出现记录"""
+    loop = asyncio.get_running_loop()
+    conns = [make_conn() for _ in range(size)]
+    try:
+        while True:
+            await asyncio.sleep(min(interval, max(stop_at - loop.time(), 0)))
+            if loop.time() >= stop_at:
+                return
+            end = datetime.now()
+            bodies = [json.dumps({'name': random.choice(names),
+                                  'start_time': (end - timedelta(seconds=random.randint(5, 600))).isoformat(),
+                                  'end_time': end.isoformat()}).encode() for _ in conns]
+            await asyncio.gather(*(timed(conn, stats, 'POST', '/record_appearance', body)
+                                   for conn, body in zip(conns, bodies)))
+    finally:
+        for conn in conns:
+            conn.close()
+
+
+async def run_stage(base_url, sequences, cameras, args, names):
+    parts = urlsplit(base_url)
+    host, port = parts.hostname, parts.port or 80
+
+    def make_conn():
+        return HttpConnection(host, port, args.timeout)
+
+    stats = {path: EndpointStats() for path in ('/recognize', '/statistics', '/registered_faces', '/record_appearance')}
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    stop_at = started + args.stage_seconds
+    camera_tasks = [camera(make_conn, sequences[i % len(sequences)], i * 7, args.fps, stop_at, stats['/recognize'])
+                    for i in range(cameras)]
+    others = [poller(make_conn, args.poll_interval, stop_at, stats) for _ in range(args.pollers)]
+    if args.burst_size:
+        others.append(bursts(make_conn, names, args.burst_size, args.burst_interval, stop_at,
+                             stats['/record_appearance']))
+    sent = await asyncio.gather(*camera_tasks, *others)
+    seconds = loop.time() - started
+    frames = sum(sent[:cameras])
+    achieved = stats['/recognize'].summary(seconds)['throughput_rps'] / cameras if cameras else 0
+    return {
+        'cameras': cameras,
+        'seconds': round(seconds, 2),
+        'frames_sent': frames,
+        'target_fps_per_camera': args.fps,
+        'achieved_fps_per_camera': round(achieved, 2),
+        'endpoints': {path: s.summary(seconds) for path, s in stats.items() if s.latencies or s.errors or s.rejected},
+    }
+
+
+def saturated(stage, args):
+    recognize = stage['endpoints'].get('/recognize')
+    if recognize is None:
+        return True
+    return (stage['achieved_fps_per_camera'] < 0.9 * args.fps
+            or recognize['error_rate'] + recognize['reject_rate'] > 0.01
+            or recognize['p99_ms'] > args.slo_ms)
+
+
+async def run_all(base_url, sequences, args, names):
+    stages = []
+    saturation = None
+    for cameras in args.cameras:
+        stage = await run_stage(base_url, sequences, cameras, args, names)
+        stage['saturated'] = saturated(stage, args)
+        stages.append(stage)
+        print(json.dumps({key: stage[key] for key in ('cameras', 'achieved_fps_per_camera', 'saturated')},
+                         ensure_ascii=False), flush=True)
+        if stage['saturated'] and saturation is None:
+            saturation = cameras
+            if not args.keep_going:
+                break
+    capacity = 0
+    for stage in stages:
+        if stage['saturated']:
+            break
+        capacity = stage['cameras']
+    return {'stages': stages, 'saturation_cameras': saturation, 'capacity_cameras': capacity}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='多摄像头负载生成与流量回放')
+    parser.add_argument('--cameras', default='10,50,100', help='逐级加压的摄像头数量，逗号分隔')
+    parser.add_argument('--fps', type=float, default=5.0, help='每路摄像头的目标帧率')
+    parser.add_argument('--stage-seconds', type=float, default=30)
+    parser.add_argument('--replay', help='录制的帧目录（子目录为各路摄像头）')
+    parser.add_argument('--crops', action='store_true', help='使用裁剪模式上传')
+    parser.add_argument('--pollers', type=int, default=5, help='看板数量')
+    parser.add_argument('--poll-interval', type=float, default=5.0)
+    parser.add_argument('--burst-size', type=int, default=20, help='每次突发写入的出现记录数，0表示不写入')
+    parser.add_argument('--burst-interval', type=float, default=10.0)
+    parser.add_argument('--slo-ms', type=float, default=1000, help='/recognize 的p99上限')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--keep-going', action='store_true', help='达到饱和后继续跑完所有级别')
+    parser.add_argument('--url', help='已运行的服务地址；未指定时在本地启动')
+    parser.add_argument('--server', choices=('gunicorn', 'dev'), default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--people', type=int, default=100)
+    parser.add_argument('--records', type=int, default=100_000)
+    parser.add_argument('--port', type=int, default=5056)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+    args.cameras = [int(part) for part in args.cameras.split(',')]
+
+    random.seed(args.seed)
+    sequences = load_sequences(args.replay, args.crops, args.seed)
+    names = [f'person_{i:06d}' for i in range(args.people)]
+    report = {'fps': args.fps, 'stage_seconds': args.stage_seconds, 'crops': args.crops,
+              'replay': args.replay, 'sequences': len(sequences), 'pollers': args.pollers,
+              'burst_size': args.burst_size}
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        workdir = prepare_workdir(args.people, args.records, args.seed)
+        base_url = f'http://127.0.0.1:{args.port}'
+        server = start_server(args.server, workdir, args.port, args)
+        report.update(server=args.server, workers=args.workers, threads=args.threads)
+    try:
+        if not wait_until_up(base_url):
+            raise SystemExit('服务启动超时')
+        report.update(asyncio.run(run_all(base_url, sequences, args, names)))
+    finally:
+        if server is not None:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
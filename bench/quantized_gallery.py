@@ -0,0 +1,99 @@
+"""量化人脸库基准：对比精确匹配与 float16 / int8 粗筛 + 精确重排
+
+    python -m bench.quantized_gallery --sizes 10000,100000 --queries 500
+    python -m bench.quantized_gallery --sizes 100000 --rerank-k 4,8,16 --spill
+
+查询一半是库中某人的特征加噪声（模拟同一人的新照片），一半是库外的随机特征。
+报告常驻内存、单次匹配延迟，以及与精确路径的一致率：top1 为最近邻是否相同，
+match 为在默认阈值下的匹配结果（姓名或未匹配）是否相同。
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bench.run import REPO_ROOT
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from bench.fixtures import random_encoding  # noqa: E402
+from gallery import Gallery  # noqa: E402
+
+NOISE = 0.03  # 同一人两张照片特征的差异（每维标准差）
+
+
+def make_queries(encodings, count, rng):
+    queries = []
+    for i in range(count):
+        if i % 2 == 0:
+            base = encodings[rng.integers(len(encodings))]
+            queries.append(base + rng.normal(0, NOISE, base.shape))
+        else:
+            queries.append(random_encoding(rng))
+    return queries
+
+
+def run_variant(gallery, queries, exact_results):
+    snapshot = gallery.current
+    latencies = []
+    top1 = []
+    matches = []
+    for query in queries:
+        t0 = time.perf_counter()
+        matches.append(snapshot.match(query)[0])
+        latencies.append(time.perf_counter() - t0)
+        top1.append(snapshot.match(query, tolerance=float('inf'))[0])
+    samples = np.array(latencies) * 1000
+    report = {
+        'memory': snapshot.memory_bytes(),
+        'p50_ms': round(float(np.percentile(samples, 50)), 3),
+        'p99_ms': round(float(np.percentile(samples, 99)), 3),
+        'mean_ms': round(float(samples.mean()), 3),
+    }
+    if exact_results is not None:
+        exact_top1, exact_matches = exact_results
+        report['top1_agreement'] = round(float(np.mean([a == b for a, b in zip(top1, exact_top1)])), 4)
+        report['match_agreement'] = round(float(np.mean([a == b for a, b in zip(matches, exact_matches)])), 4)
+    return report, (top1, matches)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='量化人脸库基准')
+    parser.add_argument('--sizes', default='10000,100000', help='人脸库规模，逗号分隔')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--rerank-k', default='8', help='精确重排的候选数，逗号分隔')
+    parser.add_argument('--spill', action='store_true', help='全精度特征落盘并通过mmap访问')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    spill_dir = tempfile.mkdtemp(prefix='facegallery_') if args.spill else None
+    report = {'queries': args.queries, 'spill': args.spill, 'results': []}
+    for size in [int(s) for s in args.sizes.split(',')]:
+        rng = np.random.default_rng(args.seed)
+        names = [f'person_{i:06d}' for i in range(size)]
+        encodings = [random_encoding(rng) for _ in names]
+        queries = make_queries(encodings, args.queries, rng)
+
+        exact = Gallery()
+        exact.replace(names, encodings, 1)
+        exact_report, exact_results = run_variant(exact, queries, None)
+        result = {'size': size, 'exact': exact_report}
+        for quantization in ('float16', 'int8'):
+            for k in [int(k) for k in args.rerank_k.split(',')]:
+                gallery = Gallery(quantization=quantization, rerank_k=k, spill_dir=spill_dir)
+                gallery.replace(names, encodings, 1)
+                variant, _ = run_variant(gallery, queries, exact_results)
+                variant['speedup'] = round(exact_report['mean_ms'] / variant['mean_ms'], 2)
+                variant['memory_ratio'] = round(
+                    variant['memory']['resident'] / exact_report['memory']['resident'], 3)
+                result[f'{quantization}_k{k}'] = variant
+        report['results'].append(result)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
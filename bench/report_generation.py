@@ -0,0 +1,78 @@
+"""考勤报表生成耗时与内存
+
+    python -m bench.report_generation --scale 1000x1000000 --chunk-sizes 20000,100000
+
+生成最近30天的出现记录后，按不同批大小生成覆盖这30天的报表，报告耗时与进程峰值内存的增量；
+并与一次读入全部记录、逐人合并的 presence.present_during 对比每人在场分钟数是否一致。
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from bench.run import REPO_ROOT, peak_rss_bytes
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from bench import fixtures  # noqa: E402
+import presence  # noqa: E402
+import reports  # noqa: E402
+from storage import SQLiteStore  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='考勤报表生成耗时与内存')
+    parser.add_argument('--scale', default='1000x1000000', help='注册人数x出现记录数，或 small/medium/large')
+    parser.add_argument('--chunk-sizes', default='20000,100000')
+    parser.add_argument('--bucket-minutes', type=float, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.scale in fixtures.SCALES:
+        people, records = fixtures.SCALES[args.scale]
+    else:
+        people, records = (int(part) for part in args.scale.split('x'))
+
+    workdir = tempfile.mkdtemp(prefix='facereports_')
+    db_path = os.path.join(workdir, 'reports.db')
+    try:
+        store = SQLiteStore(db_path)
+        store.init_schema()
+        fixtures.seed_database(db_path, people, records, seed=args.seed)
+        today = datetime.now().date()
+        start = datetime(today.year, today.month, today.day) - timedelta(days=29)
+        end = start + timedelta(days=30)
+
+        report = {'people': people, 'records': records, 'days': 30, 'runs': []}
+        minutes = None
+        # 峰值内存只增不减，先跑小批次
+        for chunk_size in sorted(int(size) for size in args.chunk_sizes.split(',')):
+            rss_before = peak_rss_bytes()
+            started = time.perf_counter()
+            result = reports.build_report(store, start, end, args.bucket_minutes, chunk_size=chunk_size)
+            report['runs'].append({
+                'chunk_size': chunk_size,
+                'seconds': round(time.perf_counter() - started, 3),
+                'peak_rss_growth_bytes': peak_rss_bytes() - rss_before,
+                'records': result['records'],
+                'segments': result['segments'],
+            })
+            minutes = {person['name']: person['present_minutes'] for person in result['people']}
+
+        started = time.perf_counter()
+        reference = presence.present_during(store, start, end)
+        report['present_during_seconds'] = round(time.perf_counter() - started, 3)
+        report['minutes_match'] = all(abs(minutes.get(person['name'], 0) - person['present_minutes']) <= 0.1
+                                      for person in reference['people']) and len(minutes) == reference['count']
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""通过Flask测试客户端驱动各个热点接口，输出延迟、吞吐与峰值内存（JSON）
+
+    python -m bench.run --scale small,medium --output bench_output.json
+    python -m bench.run --scale large --faces-dir ./my_faces --iterations 50
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 导出与列表接口在大规模数据下单次耗时很长，默认少跑几轮
+HEAVY_ENDPOINTS = {'export_data': 0.05, 'get_registered_faces': 0.1, 'get_statistics': 0.5}
+
+
+def peak_rss_bytes():
+    """当前进程的峰值常驻内存（字节）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def summarize(latencies, wall_time, errors):
+    """把一组延迟样本汇总成报告字段（毫秒）"""
+    samples = np.array(latencies) * 1000
+    return {
+        'iterations': len(latencies),
+        'errors': errors,
+        'p50_ms': round(float(np.percentile(samples, 50)), 3),
+        'p99_ms': round(float(np.percentile(samples, 99)), 3),
+        'mean_ms': round(float(samples.mean()), 3),
+        'max_ms': round(float(samples.max()), 3),
+        'throughput_rps': round(len(latencies) / wall_time, 3) if wall_time > 0 else None,
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+
+
+def measure(call, iterations, warmup=2):
+    """重复调用并记录每次耗时；call返回False表示该次请求失败"""
+    for i in range(warmup):
+        call(-1 - i)
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        ok = call(i)
+        latencies.append(time.perf_counter() - t0)
+        if not ok:
+            errors += 1
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def response_ok(response):
+    """HTTP状态码与接口自身的success字段都算数"""
+    if response.status_code >= 400:
+        return False
+    data = response.get_json(silent=True)
+    if isinstance(data, dict) and data.get('success') is False:
+        return False
+    return True
+
+
+def run_scale(scale, people, records, options):
+    """在独立进程中跑一个规模，返回该规模的全部结果"""
+    from bench import fixtures
+
+    workdir = tempfile.mkdtemp(prefix=f'facebench_{scale}_')
+    os.chdir(workdir)
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+
+    t0 = time.perf_counter()
+    import app as app_module
+    import_time = time.perf_counter() - t0
+
+    images = fixtures.load_face_images(options['faces_dir'], seed=options['seed'])
+    frames = [fixtures.image_to_data_url(img, quality=80) for img in images]
+    enroll_frames = [fixtures.image_to_data_url(img, quality=90) for img in images]
+    crop_bodies = [{'crops': [fixtures.face_crop(img)]} for img in images]
+
+    os.makedirs('registered_faces', exist_ok=True)
+    photo_path = os.path.join('registered_faces', 'bench_photo.jpg')
+    images[0].resize((160, 120)).save(photo_path)
+
+    app_module.init_db()
+    t0 = time.perf_counter()
+    names = fixtures.seed_database('face_records.db', people, records,
+                                   seed=options['seed'], photo_path=photo_path)
+    seed_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    app_module.load_registered_faces()
+    gallery_load_time = time.perf_counter() - t0
+
+    client = app_module.app.test_client()
+    rng = np.random.default_rng(options['seed'])
+    now = datetime.now()
+
+    def recognize(i):
+        return response_ok(client.post('/recognize', json={'image': frames[i % len(frames)]}))
+
+    def recognize_crops(i):
+        return response_ok(client.post('/recognize', json=crop_bodies[i % len(crop_bodies)]))
+
+    def register(i):
+        name = f'bench_reg_{i + 2}'
+        return response_ok(client.post('/register_face', json={
+            'name': name, 'image': enroll_frames[i % len(enroll_frames)]}))
+
+    def record(i):
+        start = now - timedelta(seconds=int(rng.integers(60, 3600)))
+        end = start + timedelta(seconds=int(rng.integers(5, 600)))
+        return response_ok(client.post('/record_appearance', json={
+            'name': names[int(rng.integers(0, len(names)))],
+            'start_time': start.isoformat(),
+            'end_time': end.isoformat()}))
+
+    def statistics(i):
+        return response_ok(client.get('/statistics'))
+
+    def export(i):
+        return response_ok(client.get('/export_data'))
+
+    def registered(i):
+        return response_ok(client.get('/registered_faces'))
+
+    scenarios = [
+        ('recognize_faces', recognize),
+        ('recognize_faces_crops', recognize_crops),
+        ('register_face', register),
+        ('record_appearance', record),
+        ('get_statistics', statistics),
+        ('export_data', export),
+        ('get_registered_faces', registered),
+    ]
+
+    endpoints = {}
+    for name, call in scenarios:
+        if options['only'] and name not in options['only']:
+            continue
+        iterations = max(int(options['iterations'] * HEAVY_ENDPOINTS.get(name, 1)), 3)
+        endpoints[name] = measure(call, iterations)
+
+    # 两种识别输入的单次上传大小
+    upload_bytes = {
+        'recognize_faces': int(np.mean([len(json.dumps({'image': f})) for f in frames])),
+        'recognize_faces_crops': int(np.mean([len(json.dumps(b)) for b in crop_bodies])),
+    }
+
+    # 只测匹配本身：跳过检测，直接拿随机探针比对整个库
+    match = None
+    snapshot = app_module.gallery.current
+    if len(snapshot):
+        probes = [rng.normal(0, 0.09, 128) for _ in range(16)]
+
+        def match_call(i):
+            snapshot.match(probes[i % len(probes)])
+            return True
+
+        match = measure(match_call, options['iterations'])
+
+    db_size = os.path.getsize('face_records.db')
+    return {
+        'scale': scale,
+        'people': people,
+        'records': records,
+        'import_s': round(import_time, 3),
+        'seed_s': round(seed_time, 3),
+        'gallery_load_s': round(gallery_load_time, 3),
+        'db_bytes': db_size,
+        'endpoints': endpoints,
+        'match_only': match,
+        'upload_bytes': upload_bytes,
+        'peak_rss_bytes': peak_rss_bytes(),
+        'workdir': workdir,
+    }
+
+
+def git_revision():
+    """当前提交号，便于跨提交对比"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def parse_scale(value, fixtures):
+    """解析 small/medium/large 或 自定义的 人数x记录数（如 500x20000）"""
+    if value in fixtures.SCALES:
+        return value, fixtures.SCALES[value]
+    people, records = value.lower().split('x')
+    return value, (int(people), int(records))
+
+
+def main(argv=None):
+    from bench import fixtures
+
+    parser = argparse.ArgumentParser(description='人脸考勤系统性能基准测试')
+    parser.add_argument('--scale', default='small,medium',
+                        help='逗号分隔：small/medium/large 或 人数x记录数')
+    parser.add_argument('--iterations', type=int, default=100, help='每个接口的基础迭代次数')
+    parser.add_argument('--faces-dir', default=None, help='真实人脸图片目录（默认使用合成图片）')
+    parser.add_argument('--only', default='', help='只跑指定接口，逗号分隔')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None, help='结果JSON输出路径')
+    args = parser.parse_args(argv)
+
+    options = {
+        'iterations': args.iterations,
+        'faces_dir': os.path.abspath(args.faces_dir) if args.faces_dir else None,
+        'only': set(filter(None, args.only.split(','))),
+        'seed': args.seed,
+    }
+
+    report = {
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': args.seed,
+        'scales': [],
+    }
+
+    # 每个规模用新的进程，保证峰值内存互不影响
+    ctx = multiprocessing.get_context('spawn')
+    for value in filter(None, args.scale.split(',')):
+        scale, (people, records) = parse_scale(value, fixtures)
+        print(f'[bench] {scale}: {people} 人, {records} 条记录', file=sys.stderr)
+        with ctx.Pool(1) as pool:
+            report['scales'].append(pool.apply(run_scale, (scale, people, records, options)))
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
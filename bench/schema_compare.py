@@ -0,0 +1,149 @@
+"""考勤表结构对比：旧版（姓名 + ISO字符串）与新版（person_id + 毫秒时间戳）
+
+    python -m bench.schema_compare --scale 1000x200000 --iterations 5
+
+先按旧结构生成数据库并测量，再复制一份用 migrations.py 迁移（含VACUUM）后测量，
+报告数据库大小、迁移耗时、统计查询与按人删除的延迟，并检查两边的统计结果是否一致。
+删除在事务内执行后回滚，不影响后续测量。
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import closing
+from datetime import datetime
+
+from bench.run import REPO_ROOT, measure
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from bench import fixtures  # noqa: E402
+import migrations  # noqa: E402
+from storage import SQLiteStore  # noqa: E402
+
+
+def legacy_statistics(db_path):
+    """迁移前 SQLiteStore.statistics 的查询"""
+    with closing(sqlite3.connect(db_path)) as conn:
+        c = conn.cursor()
+        c.execute("SELECT COUNT(*) FROM registered_faces")
+        registered_count = c.fetchone()[0]
+        today = datetime.now().date().isoformat()
+        c.execute("""SELECT COUNT(DISTINCT person_name) FROM appearance_records
+                     WHERE DATE(start_time) = ?""", (today,))
+        today_count = c.fetchone()[0]
+        c.execute("SELECT AVG(duration) FROM appearance_records WHERE DATE(start_time) = ?", (today,))
+        avg_duration = round((c.fetchone()[0] or 0) / 60, 1)
+        c.execute("""SELECT ps.*,
+                     (SELECT COUNT(*) FROM appearance_records
+                      WHERE person_name = ps.person_name AND DATE(start_time) = ?) as today_count
+                     FROM person_statistics ps
+                     ORDER BY ps.last_seen DESC""", (today,))
+        person_stats = [{
+            'name': row[0],
+            'appearances': row[1],
+            'total_duration': round(row[2] / 60, 1),
+            'last_seen': datetime.fromisoformat(row[3]).strftime('%Y-%m-%d %H:%M'),
+            'today_count': row[5]
+        } for row in c.fetchall()]
+    return {'registered_count': registered_count, 'today_count': today_count,
+            'avg_duration': avg_duration, 'person_stats': person_stats}
+
+
+LEGACY_DELETE = ["DELETE FROM registered_faces WHERE name = ?",
+                 "DELETE FROM appearance_records WHERE person_name = ?",
+                 "DELETE FROM person_statistics WHERE person_name = ?"]
+
+
+def new_delete(c, name):
+    """与 SQLiteStore.delete_face 相同的语句"""
+    person_id = c.execute("SELECT id FROM registered_faces WHERE name = ?", (name,)).fetchone()[0]
+    c.execute("DELETE FROM appearances WHERE person_id = ?", (person_id,))
+    c.execute("DELETE FROM person_stats WHERE person_id = ?", (person_id,))
+    c.execute("DELETE FROM registered_faces WHERE id = ?", (person_id,))
+
+
+def legacy_delete(c, name):
+    for sql in LEGACY_DELETE:
+        c.execute(sql, (name,))
+
+
+def measure_deletes(db_path, names, delete, iterations, seed):
+    """在事务内删除随机一人后回滚"""
+    rng = random.Random(seed)
+    with closing(sqlite3.connect(db_path, isolation_level=None)) as conn:
+        c = conn.cursor()
+
+        def call(i):
+            c.execute("BEGIN")
+            delete(c, rng.choice(names))
+            c.execute("ROLLBACK")
+            return True
+        return measure(call, iterations)
+
+
+def normalized(stats):
+    return dict(stats, person_stats=sorted(stats['person_stats'], key=lambda p: p['name']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='考勤表结构对比')
+    parser.add_argument('--scale', default='1000x200000', help='注册人数x出现记录数，或 small/medium/large')
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.scale in fixtures.SCALES:
+        people, records = fixtures.SCALES[args.scale]
+    else:
+        people, records = (int(part) for part in args.scale.split('x'))
+
+    workdir = tempfile.mkdtemp(prefix='faceschema_')
+    legacy_path = os.path.join(workdir, 'legacy.db')
+    migrated_path = os.path.join(workdir, 'migrated.db')
+    try:
+        fixtures.create_legacy_tables(legacy_path)
+        names = fixtures.seed_database(legacy_path, people, records, seed=args.seed, legacy=True)
+        shutil.copyfile(legacy_path, migrated_path)
+
+        started = time.perf_counter()
+        migration = migrations.migrate(lambda: sqlite3.connect(migrated_path), finalize=True)
+        migration['seconds'] = round(time.perf_counter() - started, 2)
+        with closing(sqlite3.connect(migrated_path)) as conn:
+            conn.execute('VACUUM')
+
+        store = SQLiteStore(migrated_path)
+        legacy = {
+            'db_bytes': os.path.getsize(legacy_path),
+            'statistics': measure(lambda i: legacy_statistics(legacy_path), args.iterations),
+            'delete_face': measure_deletes(legacy_path, names, legacy_delete, args.iterations, args.seed),
+        }
+        migrated = {
+            'db_bytes': os.path.getsize(migrated_path),
+            'statistics': measure(lambda i: store.statistics(), args.iterations),
+            'delete_face': measure_deletes(migrated_path, names, new_delete, args.iterations, args.seed),
+        }
+        report = {
+            'people': people,
+            'records': records,
+            'migration': migration,
+            'legacy': legacy,
+            'migrated': migrated,
+            'size_ratio': round(migrated['db_bytes'] / legacy['db_bytes'], 3),
+            'statistics_speedup': round(legacy['statistics']['mean_ms'] / migrated['statistics']['mean_ms'], 2),
+            'delete_speedup': round(legacy['delete_face']['mean_ms'] / migrated['delete_face']['mean_ms'], 2),
+            'statistics_match': normalized(legacy_statistics(legacy_path)) == normalized(store.statistics()),
+        }
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""人脸库并发压力测试：并行注册/删除/识别，检查姓名与特征是否错位
+
+    python -m bench.stress_gallery --readers 8 --writers 2 --duration 10
+
+每个人的特征由姓名确定性生成，探针与本人的距离为0、与他人的距离远大于阈值，
+因此任何一次匹配到别人都说明快照中姓名与特征错位。先只跑识别得到基线吞吐，
+再加入写线程，对比两者以确认写入不会拖垮识别吞吐。发现错位时以非零状态码退出。
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from bench.run import REPO_ROOT
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from gallery import Gallery  # noqa: E402
+from storage import SQLiteStore  # noqa: E402
+
+
+def encoding_for(name):
+    return np.random.default_rng(zlib.crc32(name.encode())).normal(0, 0.09, 128)
+
+
+def run_phase(gallery, store, names, churn_names, readers, writers, duration):
+    stop = threading.Event()
+    counters = {'reads': 0, 'mismatches': 0, 'writes': 0, 'syncs': 0}
+    lock = threading.Lock()
+
+    def reader(seed):
+        rng = random.Random(seed)
+        reads = mismatches = 0
+        while not stop.is_set():
+            snapshot = gallery.current
+            if len(snapshot.names) != len(snapshot):
+                mismatches += 1
+            name = rng.choice(names)
+            matched, _ = snapshot.match(encoding_for(name))
+            if matched is not None and matched != name:
+                mismatches += 1
+            elif name in snapshot and matched != name:
+                mismatches += 1
+            reads += 1
+        with lock:
+            counters['reads'] += reads
+            counters['mismatches'] += mismatches
+
+    def writer(own_names):
+        writes = 0
+        registered = set()
+        rng = random.Random(own_names[0])
+        while not stop.is_set():
+            name = rng.choice(own_names)
+            if name in registered:
+                version, _ = store.delete_face(name)
+                gallery.apply_local('delete', name, version=version)
+                registered.discard(name)
+            else:
+                encoding = encoding_for(name)
+                version = store.add_face(name, encoding, '')
+                gallery.apply_local('add', name, encoding, version)
+                registered.add(name)
+            writes += 1
+        for name in registered:
+            version, _ = store.delete_face(name)
+            gallery.apply_local('delete', name, version=version)
+        with lock:
+            counters['writes'] += writes
+
+    def syncer():
+        while not stop.is_set():
+            changes = store.gallery_changes(gallery.current.version)
+            if changes:
+                gallery.apply(changes)
+                counters['syncs'] += 1
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    if writers:
+        threads += [threading.Thread(target=writer, args=(churn_names[i::writers],)) for i in range(writers)]
+        threads.append(threading.Thread(target=syncer))
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    return {
+        'readers': readers,
+        'writers': writers,
+        'reads_per_s': round(counters['reads'] / wall, 1),
+        'writes_per_s': round(counters['writes'] / wall, 1),
+        'syncs': counters['syncs'],
+        'mismatches': counters['mismatches'],
+        'final_version': gallery.current.version,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='人脸库并发压力测试')
+    parser.add_argument('--people', type=int, default=1000, help='常驻人数')
+    parser.add_argument('--churn', type=int, default=200, help='反复注册/删除的人数')
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args(argv)
+
+    store = SQLiteStore(os.path.join(tempfile.mkdtemp(prefix='facestress_'), 'face_records.db'))
+    store.init_schema()
+    names = [f'person_{i:06d}' for i in range(args.people)]
+    for name in names:
+        store.add_face(name, encoding_for(name), '')
+    churn_names = [f'churn_{i:06d}' for i in range(args.churn)]
+
+    gallery = Gallery()
+    version, faces = store.load_gallery()
+    gallery.replace([n for n, _ in faces], [e for _, e in faces], version)
+
+    baseline = run_phase(gallery, store, names + churn_names, churn_names,
+                         args.readers, 0, args.duration)
+    contended = run_phase(gallery, store, names + churn_names, churn_names,
+                          args.readers, args.writers, args.duration)
+    report = {
+        'people': args.people,
+        'churn': args.churn,
+        'read_only': baseline,
+        'read_write': contended,
+        'read_throughput_ratio': round(contended['reads_per_s'] / baseline['reads_per_s'], 3)
+        if baseline['reads_per_s'] else None,
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    sys.exit(1 if baseline['mismatches'] or contended['mismatches'] else 0)
+
+
+if __name__ == '__main__':
+    main()
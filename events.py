@@ -0,0 +1,123 @@
+"""统计数据推送（Server-Sent Events）
+
+统计只在数据变化时计算一次，再把与上次结果的差异分发给所有已连接的看板，
+看板数量不再决定数据库负载。本进程的写操作会立即触发重新计算；其他worker或副本
+的写入通过轮询一个很廉价的变更标记（最大记录ID与人脸库版本）发现。
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+
+def diff_statistics(old, new):
+    """比较两次统计结果，返回增量（没有变化时返回None）"""
+    summary = {key: value for key, value in new.items()
+               if key != 'person_stats' and old.get(key) != value}
+    old_people = {person['name']: person for person in old.get('person_stats', [])}
+    new_people = {person['name']: person for person in new['person_stats']}
+    upsert = [person for name, person in new_people.items() if old_people.get(name) != person]
+    remove = [name for name in old_people if name not in new_people]
+    if not (summary or upsert or remove):
+        return None
+    return {'summary': summary, 'upsert': upsert, 'remove': remove}
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class StatsBroadcaster:
+    """计算统计增量并分发给订阅者"""
+
+    def __init__(self, compute, change_marker, poll_interval=2, refresh_interval=60,
+                 max_clients=8, queue_size=16):
+        self.compute = compute
+        self.change_marker = change_marker
+        self.poll_interval = poll_interval
+        self.refresh_interval = refresh_interval  # 没有写入时也定期刷新（跨天后"今日"数据会变化）
+        self.max_clients = max_clients
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._last = None
+        self._marker = None
+        self._computed_at = 0
+        self._thread_pid = None
+        self.computations = 0
+
+    @property
+    def client_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        """注册一个订阅者，返回 (消息队列, 当前完整统计)；连接数已满时返回 None"""
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                return None
+            if not self._subscribers or self._last is None:
+                self._refresh_locked()
+            subscriber = queue.Queue(maxsize=self.queue_size)
+            self._subscribers.add(subscriber)
+            snapshot = self._last
+        self._ensure_thread()
+        return subscriber, snapshot
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def notify(self):
+        """本进程写入数据后调用，尽快重新计算"""
+        if self._subscribers:
+            self._dirty.set()
+
+    def _refresh_locked(self):
+        self._marker = self.change_marker()
+        self._last = self.compute()
+        self._computed_at = time.time()
+        self.computations += 1
+
+    def _publish(self, message, snapshot):
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # 客户端太慢：清空积压的增量，改发一份完整统计让它重新同步
+                try:
+                    while True:
+                        subscriber.get_nowait()
+                except queue.Empty:
+                    pass
+                subscriber.put_nowait(format_event('snapshot', snapshot))
+
+    def _ensure_thread(self):
+        # 线程不会跨fork保留，每个worker进程各自启动
+        if self._thread_pid != os.getpid():
+            self._thread_pid = os.getpid()
+            threading.Thread(target=self._run, name='stats-broadcaster', daemon=True).start()
+
+    def _run(self):
+        while True:
+            dirty = self._dirty.wait(self.poll_interval)
+            self._dirty.clear()
+            if not self._subscribers:
+                continue
+            try:
+                with self._lock:
+                    marker = self.change_marker()
+                    due = time.time() - self._computed_at >= self.refresh_interval
+                    if not (dirty or due or marker != self._marker):
+                        continue
+                    previous = self._last
+                    self._refresh_locked()
+                    delta = diff_statistics(previous or {}, self._last)
+                    snapshot = self._last
+                if delta:
+                    self._publish(format_event('delta', delta), snapshot)
+            except Exception:
+                logging.getLogger(__name__).exception('统计推送计算失败')
+                time.sleep(self.poll_interval)
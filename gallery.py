@@ -0,0 +1,308 @@
+"""不可变、带版本的人脸库快照
+
+读者通过 Gallery.current 取得一个快照后只读访问，不需要加锁：快照中的姓名与特征
+一一对应，且永远不会被修改。写者在锁内基于当前快照构造新快照，再整体替换引用，
+因此任何时刻读到的都是某个完整版本。
+
+人脸很多时可以启用量化：快照额外保存一份 float16 或按维度缩放的 int8 紧凑副本，
+匹配时先在紧凑副本上粗筛出前 k 个候选，再用全精度特征精确重排，结果与精确匹配一致
+（除非真正的最近邻落在粗筛前 k 名之外）。全精度特征可以落盘并通过 mmap 访问，
+常驻内存只剩紧凑副本。
+
+快照之间共享只在末尾追加的行缓冲（预留约1/8的空行）：注册只追加一行并只量化这一行，
+删除只在新快照中把该行标记为已删除，旧快照看到的行永远不会被修改。
+空行用完、已删除的行过多或新特征超出 int8 缩放范围时才整体重建。
+"""
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+ENCODING_SIZE = 128
+QUANTIZATIONS = ('none', 'float16', 'int8')
+_SCAN_CHUNK = 4096  # 粗筛时每次反量化的行数，保持在CPU缓存内
+_MIN_HEADROOM = 64  # 行缓冲至少预留的空行数
+
+
+def quantize(matrix, quantization, scale=None):
+    """返回 (紧凑矩阵, 每维缩放系数)；反量化为 紧凑矩阵 * 缩放系数
+
+    给出 scale 时沿用已有的缩放系数（只量化新增的行）。
+    """
+    if quantization == 'float16':
+        return matrix.astype(np.float16), np.ones(matrix.shape[1], dtype=np.float32)
+    if quantization == 'int8':
+        if scale is None:
+            scale = np.abs(matrix).max(axis=0) / 127 if len(matrix) else np.ones(matrix.shape[1])
+            scale[scale == 0] = 1
+        compact = np.clip(np.rint(matrix / scale), -127, 127).astype(np.int8)
+        return compact, scale.astype(np.float32)
+    raise ValueError(f'未知的量化方式: {quantization}')
+
+
+def _squared_norms(compact, scale):
+    """反量化后各行的平方范数；粗筛按 |x|^2 - 2x·q 排序，与按距离排序等价"""
+    norms = np.empty(len(compact), dtype=np.float32)
+    for start in range(0, len(compact), _SCAN_CHUNK):
+        block = compact[start:start + _SCAN_CHUNK].astype(np.float32) * scale
+        norms[start:start + len(block)] = np.square(block).sum(axis=1)
+    return norms
+
+
+def _spill(matrix, capacity, spill_dir):
+    """把全精度矩阵写入容量为 capacity 行的临时文件，再以写时复制（MAP_PRIVATE）的mmap打开
+
+    之后追加的行只写进本进程的私有页，不会写回文件：preload_app 时各worker从master继承同一个映射，
+    各自追加也互不可见。文件打开后立即删除，映射在快照被回收前一直有效，不会在磁盘上留下旧版本。
+    """
+    fd, path = tempfile.mkstemp(prefix='gallery-', suffix='.npy', dir=spill_dir)
+    os.close(fd)
+    try:
+        written = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=(capacity, ENCODING_SIZE))
+        written[:len(matrix)] = matrix
+        written.flush()
+        del written
+        mapped = np.load(path, mmap_mode='c')
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return mapped
+
+
+class _Rows:
+    """快照共享的行缓冲：行只在末尾追加，已被快照引用的行不再修改"""
+
+    def __init__(self, names, matrix, quantization, spill_dir):
+        count = len(names)
+        capacity = count + max(count // 8, _MIN_HEADROOM)
+        self.quantization = quantization
+        self.names = list(names)  # 行号 -> 姓名
+        self.rows_of = {}  # 姓名 -> 该姓名用过的行号（递增）
+        for row, name in enumerate(self.names):
+            self.rows_of.setdefault(name, []).append(row)
+        if quantization != 'none' and spill_dir:
+            self.encodings = _spill(matrix, capacity, spill_dir)
+        else:
+            self.encodings = np.empty((capacity, ENCODING_SIZE), dtype=np.float64)
+            self.encodings[:count] = matrix
+        self.compact = self.scale = self.norms = None
+        if quantization != 'none':
+            compact, self.scale = quantize(matrix, quantization)
+            self.compact = np.empty((capacity, ENCODING_SIZE), dtype=compact.dtype)
+            self.compact[:count] = compact
+            self.norms = np.empty(capacity, dtype=np.float32)
+            self.norms[:count] = _squared_norms(compact, self.scale)
+        self.used = count
+
+    def append(self, name, encoding):
+        """追加一行并只量化这一行，返回行号；空行用完或超出 int8 缩放范围时返回None（需要整体重建）"""
+        if self.used >= len(self.encodings):
+            return None
+        encoding = np.asarray(encoding, dtype=np.float64).reshape(1, ENCODING_SIZE)
+        row = self.used
+        if self.compact is not None:
+            if self.quantization == 'int8' and np.any(np.abs(encoding) > self.scale * 127):
+                return None
+            compact, _ = quantize(encoding, self.quantization, self.scale)
+            self.compact[row] = compact[0]
+            self.norms[row] = _squared_norms(compact, self.scale)[0]
+        self.encodings[row] = encoding[0]
+        self.names.append(name)
+        self.rows_of.setdefault(name, []).append(row)
+        self.used = row + 1
+        return row
+
+
+class GallerySnapshot:
+    """某一版本的人脸库：共享行缓冲的前 count 行中，除已删除的行以外的人脸"""
+
+    __slots__ = ('version', 'encoder', 'options', 'encodings', '_rows', '_count', '_dead', '_dead_index',
+                 '_compact', '_scale', '_norms')
+
+    def __init__(self, names, encodings, version, quantization='none', rerank_k=8, spill_dir=None, encoder=None):
+        names = list(names)
+        matrix = np.array(encodings, dtype=np.float64).reshape(len(names), ENCODING_SIZE)
+        self.version = version
+        self.encoder = encoder  # 生成这些特征的编码参数，None 为默认参数；识别时用同样的参数编码
+        self.options = {'quantization': quantization, 'rerank_k': rerank_k, 'spill_dir': spill_dir}
+        self._attach(_Rows(names, matrix, quantization, spill_dir), len(names), frozenset())
+
+    def _attach(self, rows, count, dead):
+        self._rows = rows
+        self._count = count
+        self._dead = dead  # 已删除的行号
+        self._dead_index = np.fromiter(dead, dtype=np.int64, count=len(dead))
+        self.encodings = rows.encodings[:count]
+        self.encodings.setflags(write=False)
+        self._compact = self._scale = self._norms = None
+        if rows.compact is not None:
+            self._compact = rows.compact[:count]
+            self._compact.setflags(write=False)
+            self._scale = rows.scale
+            self._norms = rows.norms[:count]
+
+    def _derive(self, count, dead, version):
+        snapshot = object.__new__(GallerySnapshot)
+        snapshot.version = self.version if version is None else version
+        snapshot.encoder = self.encoder
+        snapshot.options = self.options
+        snapshot._attach(self._rows, count, dead)
+        return snapshot
+
+    def _row(self, name, count, dead):
+        """姓名在前 count 行中的有效行号，不存在或已删除时为None"""
+        for row in reversed(self._rows.rows_of.get(name, ())):
+            if row < count:
+                return None if row in dead else row
+        return None
+
+    @property
+    def names(self):
+        return tuple(self._rows.names[row] for row in range(self._count) if row not in self._dead)
+
+    def __len__(self):
+        return self._count - len(self._dead)
+
+    def __contains__(self, name):
+        return self._row(name, self._count, self._dead) is not None
+
+    def encoding_of(self, name):
+        row = self._row(name, self._count, self._dead)
+        return None if row is None else self.encodings[row]
+
+    def distances(self, encoding):
+        """与前 count 行的欧氏距离（与face_recognition.face_distance一致），已删除的行为inf"""
+        if not self._count:
+            return np.empty(0)
+        distances = np.linalg.norm(self.encodings - encoding, axis=1)
+        distances[self._dead_index] = np.inf
+        return distances
+
+    def candidates(self, encoding):
+        """在紧凑副本上粗筛，返回前 rerank_k 个候选的下标"""
+        query = np.asarray(encoding, dtype=np.float32) * self._scale
+        scores = np.empty(self._count, dtype=np.float32)
+        for start in range(0, self._count, _SCAN_CHUNK):
+            block = self._compact[start:start + _SCAN_CHUNK]
+            scores[start:start + len(block)] = block.astype(np.float32) @ query
+        approx = self._norms - 2 * scores
+        approx[self._dead_index] = np.inf
+        k = self.options['rerank_k']
+        if k >= len(approx):
+            return np.arange(len(approx))
+        return np.argpartition(approx, k - 1)[:k]
+
+    def match(self, encoding, tolerance=0.6):
+        """返回 (姓名, 距离)；没有小于阈值的匹配时返回 (None, 最小距离)"""
+        if not len(self):
+            return None, None
+        if self._compact is None:
+            indexes = None
+            distances = self.distances(encoding)
+        else:
+            # 只对候选计算精确距离；按行号顺序读取，对mmap更友好
+            indexes = np.sort(self.candidates(encoding))
+            distances = np.linalg.norm(self.encodings[indexes] - encoding, axis=1)
+            if self._dead:
+                # 活着的行不足 rerank_k 个时，候选中会混入已删除的行
+                distances[np.isin(indexes, self._dead_index)] = np.inf
+        best = int(np.argmin(distances))
+        min_distance = float(distances[best])
+        best_match_index = best if indexes is None else int(indexes[best])
+        if min_distance < tolerance:
+            return self._rows.names[best_match_index], min_distance
+        return None, min_distance
+
+    def with_changes(self, changes, version=None):
+        """应用一批 (op, 姓名, 特征) 变更，返回新快照；同名条目以最后一次为准
+
+        本快照是行缓冲的最新一版时只追加新行、标记删除的行；否则整体重建。
+        """
+        rows, count, dead = self._rows, self._count, set(self._dead)
+        if rows.used == count:
+            for op, name, encoding in changes:
+                row = self._row(name, count, dead)
+                if row is not None:
+                    dead.add(row)
+                if op == 'add':
+                    row = rows.append(name, encoding)
+                    if row is None:
+                        break
+                    count = row + 1
+            else:
+                if len(dead) <= max(count // 8, _MIN_HEADROOM):
+                    return self._derive(count, frozenset(dead), version)
+        # 整体重建：空行用完、已删除的行过多，或本快照已不是行缓冲的最新一版
+        entries = {self._rows.names[row]: self.encodings[row] for row in range(self._count) if row not in self._dead}
+        for op, name, encoding in changes:
+            entries.pop(name, None)
+            if op == 'add':
+                entries[name] = encoding
+        return GallerySnapshot(list(entries), list(entries.values()),
+                               self.version if version is None else version, encoder=self.encoder, **self.options)
+
+    def memory_bytes(self):
+        """常驻内存与落盘的特征字节数（按整个行缓冲计，包括预留的空行）"""
+        rows = self._rows
+        mapped = isinstance(rows.encodings, np.memmap)
+        resident = 0 if mapped else rows.encodings.nbytes
+        if rows.compact is not None:
+            resident += rows.compact.nbytes + rows.norms.nbytes
+        return {
+            'resident': resident,
+            'full_precision': rows.encodings.nbytes,
+            'full_precision_mmap': mapped,
+        }
+
+
+class Gallery:
+    """持有当前快照的容器：读无锁，写串行化后原子替换"""
+
+    def __init__(self, quantization='none', rerank_k=8, spill_dir=None):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f'未知的量化方式: {quantization}')
+        self.options = {'quantization': quantization, 'rerank_k': rerank_k, 'spill_dir': spill_dir}
+        self._snapshot = GallerySnapshot((), [], 0, **self.options)
+        self._write_lock = threading.Lock()
+
+    @property
+    def current(self):
+        return self._snapshot
+
+    def replace(self, names, encodings, version, encoder=None):
+        """整体替换为新加载的人脸库；encoder 为这些特征的编码参数"""
+        snapshot = GallerySnapshot(names, encodings, version, encoder=encoder, **self.options)
+        with self._write_lock:
+            self._snapshot = snapshot
+        return snapshot
+
+    def apply(self, changes):
+        """按版本顺序应用 [(版本号, op, 姓名, 特征)]，版本号推进到最后一条
+
+        早于当前版本的变更会被跳过，避免过期的轮询结果覆盖较新的状态。
+        """
+        with self._write_lock:
+            current = self._snapshot
+            pending = [(op, name, encoding) for version, op, name, encoding in changes
+                       if version > current.version]
+            if not pending:
+                return current
+            self._snapshot = current.with_changes(pending, version=changes[-1][0])
+            return self._snapshot
+
+    def apply_local(self, op, name, encoding=None, version=None):
+        """立即应用本进程写入的变更；version 为存储返回的变更版本号
+
+        恰好是下一个版本时推进版本号，同步线程不再重复应用；中间还有其他进程的变更时不推进，
+        由同步线程按顺序补齐（再次应用结果相同）；同步线程已经应用过时跳过。
+        """
+        with self._write_lock:
+            current = self._snapshot
+            if version is not None and version <= current.version:
+                return current
+            advance = version is not None and version == current.version + 1
+            self._snapshot = current.with_changes([(op, name, encoding)], version=version if advance else None)
+            return self._snapshot
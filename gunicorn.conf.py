@@ -0,0 +1,56 @@
+"""gunicorn配置：gunicorn -c gunicorn.conf.py wsgi:app
+
+所有参数都可以通过环境变量覆盖，便于在Deployment中调整。
+"""
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# 每个worker是一个独立进程；识别主要耗CPU，线程用于重叠IO与数据库等待。
+# 排队中的请求也占着线程，线程按准入控制（admission.py）划分：1个留给 /health 等不受控的路由，
+# ADMISSION_RESERVED 个留给注册/删除，其余由识别、读写、导出和统计推送共用。
+# 统计推送（SSE）连接整个连接期间占着一个线程，SSE_MAX_CLIENTS 应小于 threads - ADMISSION_RESERVED - 1
+# （默认取其一半）；看板多时先调大 threads，再相应调大 SSE_MAX_CLIENTS
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+worker_class = 'gthread'
+
+# 在主进程中加载人脸库，fork后worker以写时复制方式共享；
+# 模型在各worker中后台预热（见 post_fork），预热期间 /health 可用、/ready 返回503
+preload_app = True
+
+# 定期回收worker，防止内存缓慢增长；抖动避免所有worker同时重启
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+# 单帧识别可能较慢；优雅退出期间处理完正在进行的请求
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def when_ready(server):
+    """预加载完成、fork worker之前调用
+
+    把已加载的对象移入永久代，避免worker中的垃圾回收触碰这些对象、
+    导致共享页被复制。
+    """
+    gc.collect()
+    gc.freeze()
+    server.log.info('预加载完成，已冻结 %d 个对象', gc.get_freeze_count())
+
+
+
+def post_fork(server, worker):
+    """worker fork之后调用：在后台线程中预热模型
+
+    线程不能在fork之前启动（不会带进子进程），预热也不能放在主进程同步执行，
+    否则端口要等预热结束才监听，存活检查一直失败。
+    """
+    import models
+    models.start_background_warm_up()
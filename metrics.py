@@ -0,0 +1,22 @@
+"""进程内的运行指标"""
+import threading
+from collections import defaultdict
+
+
+class Counters:
+    """线程安全的计数器组，按名称累加"""
+
+    def __init__(self):
+        self._values = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, name, value=1):
+        with self._lock:
+            self._values[name] += value
+
+    def get(self, name):
+        return self._values.get(name, 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
@@ -0,0 +1,200 @@
+"""旧版考勤表在线迁移：姓名/ISO字符串 -> person_id/毫秒时间戳
+
+    python migrations.py face_records.db                 # 建新表、装触发器并分批回填，旧版应用照常运行
+    python migrations.py face_records.db --finalize      # 切换：补齐剩余记录，删除触发器和旧表
+    python migrations.py face_records.db --finalize --vacuum
+
+迁移分三步，均可中断后重跑：
+1. prepare：创建新表，并在旧表上安装触发器，旧版应用此后的每次写入都会同步到新表；
+2. backfill：按主键分批把已有记录复制到新表，每批一个短事务，批间暂停让出写锁，
+   进度记录在 schema_migration 表中；
+3. cut_over（--finalize）：在一个事务内补齐剩余记录、删除触发器和旧表，并把 user_version 置为2。
+   新版应用启动时（SQLiteStore.init_schema）会自动执行剩余步骤。
+
+姓名已不在 registered_faces 中的旧记录（人员删除后遗留的孤立记录）不会迁移。
+"""
+import argparse
+import json
+import sqlite3
+import time
+from contextlib import closing
+
+import storage
+
+LEGACY_TABLES = ('appearance_records', 'person_statistics')
+TRIGGERS = ('migrate_appearance_insert', 'migrate_appearance_update', 'migrate_appearance_delete',
+            'migrate_statistics_insert', 'migrate_statistics_update', 'migrate_statistics_delete',
+            'migrate_face_delete')
+
+
+def _ms(column):
+    """把ISO时间列转为毫秒时间戳的SQL表达式，与 storage.to_ms 结果一致
+
+    'utc' 修饰符把不带时区的时间当作本地时间换算；带时区后缀的时间保持不变。
+    """
+    return f"CAST(ROUND((julianday({column}, 'utc') - 2440587.5) * 86400000) AS INTEGER)"
+
+
+_COPY_APPEARANCE = f"""SELECT a.id, f.id, {_ms('a.start_time')}, {_ms('a.end_time')}, a.duration, a.confidence
+                       FROM appearance_records a JOIN registered_faces f ON f.name = a.person_name"""
+_COPY_STATISTICS = f"""SELECT f.id, s.total_appearances, s.total_duration,
+                              {_ms('s.first_seen')}, {_ms('s.last_seen')}
+                       FROM person_statistics s JOIN registered_faces f ON f.name = s.person_name"""
+
+
+def _mirror_appearance(row):
+    return f"""INSERT OR REPLACE INTO appearances (id, person_id, start_ms, end_ms, duration, confidence)
+               SELECT {row}.id, f.id, {_ms(row + '.start_time')}, {_ms(row + '.end_time')},
+                      {row}.duration, {row}.confidence
+               FROM registered_faces f WHERE f.name = {row}.person_name;"""
+
+
+_MIRROR_STATISTICS = f"""INSERT OR REPLACE INTO person_stats
+                             (person_id, total_appearances, total_duration, first_seen_ms, last_seen_ms)
+                         SELECT f.id, NEW.total_appearances, NEW.total_duration,
+                                {_ms('NEW.first_seen')}, {_ms('NEW.last_seen')}
+                         FROM registered_faces f WHERE f.name = NEW.person_name;"""
+
+_TRIGGER_SQL = {
+    'migrate_appearance_insert': "AFTER INSERT ON appearance_records BEGIN " + _mirror_appearance('NEW') + " END",
+    'migrate_appearance_update': "AFTER UPDATE ON appearance_records BEGIN "
+                                 "DELETE FROM appearances WHERE id = OLD.id; " + _mirror_appearance('NEW') + " END",
+    'migrate_appearance_delete': "AFTER DELETE ON appearance_records BEGIN "
+                                 "DELETE FROM appearances WHERE id = OLD.id; END",
+    'migrate_statistics_insert': "AFTER INSERT ON person_statistics BEGIN " + _MIRROR_STATISTICS + " END",
+    'migrate_statistics_update': "AFTER UPDATE ON person_statistics BEGIN " + _MIRROR_STATISTICS + " END",
+    'migrate_statistics_delete': "AFTER DELETE ON person_statistics BEGIN "
+                                 "DELETE FROM person_stats WHERE person_id = "
+                                 "(SELECT id FROM registered_faces WHERE name = OLD.person_name); END",
+    # 旧版应用先删注册记录再删考勤记录，此时已无法按姓名找到 person_id，在这里一并清理
+    'migrate_face_delete': "AFTER DELETE ON registered_faces BEGIN "
+                           "DELETE FROM appearances WHERE person_id = OLD.id; "
+                           "DELETE FROM person_stats WHERE person_id = OLD.id; END",
+}
+
+
+def is_legacy(c):
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'appearance_records'")
+    return c.fetchone() is not None
+
+
+def _progress(c):
+    c.execute("SELECT value FROM schema_migration WHERE key = 'appearance_backfill_id'")
+    row = c.fetchone()
+    return row[0] if row else 0
+
+
+def prepare(conn):
+    """创建新表、进度表和同步触发器（幂等）"""
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    storage.create_tables(c)
+    c.execute("CREATE TABLE IF NOT EXISTS schema_migration (key TEXT PRIMARY KEY, value INTEGER)")
+    for name in TRIGGERS:
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {_TRIGGER_SQL[name]}")
+    # 统计表每人一行，触发器装好后在同一事务内整体复制即可
+    c.execute("INSERT OR REPLACE INTO person_stats " + _COPY_STATISTICS)
+    conn.commit()
+
+
+def backfill(conn, batch_size=5000, pause=0.0, report=None):
+    """按主键分批复制旧出现记录，返回本次复制的行数
+
+    触发器安装之后写入的记录已经同步，INSERT OR IGNORE 保证重复复制无害。
+    """
+    c = conn.cursor()
+    c.execute("SELECT COALESCE(MAX(id), 0) FROM appearance_records")
+    last_id = c.fetchone()[0]
+    copied = 0
+    position = _progress(c)
+    while position < last_id:
+        upper = position + batch_size
+        c.execute("BEGIN IMMEDIATE")
+        c.execute(f"INSERT OR IGNORE INTO appearances (id, person_id, start_ms, end_ms, duration, confidence) "
+                  f"{_COPY_APPEARANCE} WHERE a.id > ? AND a.id <= ?", (position, upper))
+        copied += c.rowcount
+        c.execute("""INSERT OR REPLACE INTO schema_migration (key, value)
+                     VALUES ('appearance_backfill_id', ?)""", (min(upper, last_id),))
+        conn.commit()
+        position = upper
+        if report:
+            report(min(position, last_id), last_id)
+        if pause:
+            time.sleep(pause)
+    return copied
+
+
+def verify(conn):
+    """对比旧表与新表的行数；orphans 为姓名已不存在、不会迁移的旧记录数"""
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*) FROM appearance_records")
+    legacy = c.fetchone()[0]
+    c.execute("""SELECT COUNT(*) FROM appearance_records a
+                 WHERE NOT EXISTS (SELECT 1 FROM registered_faces f WHERE f.name = a.person_name)""")
+    orphans = c.fetchone()[0]
+    c.execute("SELECT COUNT(*) FROM appearances")
+    migrated = c.fetchone()[0]
+    return {'legacy_rows': legacy, 'orphans': orphans, 'migrated_rows': migrated,
+            'consistent': legacy - orphans == migrated}
+
+
+def cut_over(conn):
+    """在一个事务内补齐剩余记录，删除触发器和旧表"""
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    c.execute(f"INSERT OR IGNORE INTO appearances (id, person_id, start_ms, end_ms, duration, confidence) "
+              f"{_COPY_APPEARANCE} WHERE a.id > ?", (_progress(c),))
+    c.execute("INSERT OR REPLACE INTO person_stats " + _COPY_STATISTICS)
+    for name in TRIGGERS:
+        c.execute(f"DROP TRIGGER IF EXISTS {name}")
+    for table in LEGACY_TABLES + ('schema_migration',):
+        c.execute(f"DROP TABLE IF EXISTS {table}")
+    c.execute(f"PRAGMA user_version = {storage.SCHEMA_VERSION}")
+    conn.commit()
+
+
+def migrate(connect, batch_size=5000, pause=0.0, finalize=False, report=None):
+    """完整迁移流程，返回校验结果；connect 返回新的SQLite连接。旧表不存在时返回None"""
+    with closing(connect()) as conn:
+        conn.isolation_level = None  # 手动控制事务，每批单独提交
+        if not is_legacy(conn.cursor()):
+            return None
+        prepare(conn)
+        backfill(conn, batch_size, pause, report)
+        result = verify(conn)
+        if finalize:
+            cut_over(conn)
+        result['finalized'] = finalize
+        return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='考勤表在线迁移')
+    parser.add_argument('db', nargs='?', default=storage.DEFAULT_DB_PATH)
+    parser.add_argument('--batch-size', type=int, default=5000, help='每个事务复制的记录数')
+    parser.add_argument('--pause', type=float, default=0.01, help='批间暂停（秒），让出写锁给在线应用')
+    parser.add_argument('--finalize', action='store_true', help='回填后删除触发器和旧表')
+    parser.add_argument('--vacuum', action='store_true', help='切换后执行VACUUM回收旧表空间（会锁库）')
+    args = parser.parse_args(argv)
+
+    def report(done, total):
+        print(f'\r回填 {done}/{total}', end='', flush=True)
+
+    started = time.perf_counter()
+    result = migrate(lambda: sqlite3.connect(args.db, timeout=30), args.batch_size, args.pause,
+                     args.finalize, report)
+    print()
+    if result is None:
+        print('数据库已是新版结构，无需迁移')
+    if args.vacuum and (result is None or result['finalized']):
+        with closing(sqlite3.connect(args.db)) as conn:
+            # 顺便切换为增量VACUUM模式，之后归档释放的空间可以在后台逐步回收
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+    if result is not None:
+        result['seconds'] = round(time.perf_counter() - started, 2)
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""重量级模型的延迟加载与后台预热
+
+face_recognition/dlib、cv2、mediapipe 导入一次需要数秒，放到首次使用时再加载，
+这样应用导入和 /health 都是瞬时的；就绪状态由 /ready 单独反映。
+"""
+import importlib
+import logging
+import threading
+import time
+
+import numpy as np
+
+_lock = threading.Lock()
+_modules = {}
+_face_detection = None
+
+_ready = threading.Event()
+_state = {'stage': 'pending', 'error': None}
+
+IMPORT_TIMINGS = {}  # 模块名 -> 导入耗时（秒）
+STARTUP_TIMINGS = {}  # 预热阶段 -> 耗时（秒）
+
+
+def _load(name):
+    """线程安全地导入模块并记录耗时"""
+    module = _modules.get(name)
+    if module is None:
+        with _lock:
+            module = _modules.get(name)
+            if module is None:
+                t0 = time.perf_counter()
+                module = importlib.import_module(name)
+                IMPORT_TIMINGS[name] = round(time.perf_counter() - t0, 3)
+                _modules[name] = module
+    return module
+
+
+def face_recognition():
+    """face_recognition模块（导入时会加载dlib模型）"""
+    return _load('face_recognition')
+
+
+def cv2():
+    return _load('cv2')
+
+
+def face_detection():
+    """MediaPipe人脸检测器，首次使用时创建"""
+    global _face_detection
+    if _face_detection is None:
+        mp = _load('mediapipe')
+        with _lock:
+            if _face_detection is None:
+                _face_detection = mp.solutions.face_detection.FaceDetection(
+                    model_selection=0, min_detection_confidence=0.5
+                )
+    return _face_detection
+
+
+def _timed(stage, func):
+    _state['stage'] = stage
+    t0 = time.perf_counter()
+    result = func()
+    STARTUP_TIMINGS[stage] = round(time.perf_counter() - t0, 3)
+    return result
+
+
+def warm_up(load_gallery=None):
+    """导入模型、预热检测器并加载人脸库，全部完成后标记为就绪
+
+    load_gallery 为 None 表示人脸库已经加载好（gunicorn主进程预加载后fork的worker）。
+    """
+    try:
+        fr = _timed('import_models', face_recognition)
+        blank = np.zeros((120, 160, 3), dtype=np.uint8)
+        _timed('warm_up_detector', lambda: fr.face_locations(blank))
+        if load_gallery is not None:
+            _timed('load_gallery', load_gallery)
+        _state['stage'] = 'ready'
+        _ready.set()
+    except Exception as e:
+        _state['stage'] = 'failed'
+        _state['error'] = str(e)
+        raise
+
+
+def _background_warm_up(load_gallery):
+    try:
+        warm_up(load_gallery)
+    except Exception:
+        logging.getLogger(__name__).exception('模型预热失败')
+
+
+def start_background_warm_up(load_gallery=None):
+    """在后台线程中预热，不阻塞服务启动"""
+    thread = threading.Thread(target=_background_warm_up, args=(load_gallery,),
+                              name='model-warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def status():
+    """就绪状态与启动耗时明细"""
+    return {
+        'ready': _ready.is_set(),
+        'stage': _state['stage'],
+        'error': _state['error'],
+        'startup_timings': dict(STARTUP_TIMINGS),
+        'import_timings': dict(IMPORT_TIMINGS),
+    }
@@ -0,0 +1,97 @@
+"""识别请求的背压与客户端节奏建议
+
+根据当前在处理的请求数和各阶段耗时（指数滑动平均）估算负载压力，
+据此建议客户端的发送间隔、最大边长和JPEG质量；过载时直接拒绝请求，
+让节点平滑降级而不是越积越多。
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+STAGES = ('decode', 'detect', 'quality', 'encode', 'match')
+
+# (压力上限, 最大边长, JPEG质量)，压力越大画面越小
+RESOLUTION_STEPS = [(0.75, 640, 0.8), (1.5, 480, 0.7), (float('inf'), 320, 0.6)]
+
+
+class RecognitionPacer:
+    """按进程统计识别负载并给出节奏建议"""
+
+    def __init__(self, capacity=4, max_inflight=8, target_latency=0.25,
+                 min_interval_ms=100, max_interval_ms=2000, alpha=0.2):
+        self.capacity = capacity  # 能同时处理的请求数（通常等于线程数）
+        self.max_inflight = max_inflight  # 超过后返回429
+        self.target_latency = target_latency  # 单帧期望耗时（秒）
+        self.min_interval_ms = min_interval_ms
+        self.max_interval_ms = max_interval_ms
+        self.alpha = alpha
+        self.inflight = 0
+        self.latency = {stage: 0.0 for stage in STAGES}
+        self.accepted = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """尝试占用一个处理名额，过载时返回False"""
+        with self._lock:
+            if self.inflight >= self.max_inflight:
+                self.rejected += 1
+                return False
+            self.inflight += 1
+            self.accepted += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.inflight -= 1
+
+    @contextmanager
+    def stage(self, stage):
+        """计时一个阶段：with pacer.stage('detect'): ..."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - t0)
+
+    def observe(self, stage, seconds):
+        """记录某个阶段的耗时"""
+        with self._lock:
+            previous = self.latency[stage]
+            self.latency[stage] = seconds if previous == 0 else previous + self.alpha * (seconds - previous)
+
+    def pressure(self):
+        """负载压力：排队程度与处理耗时相对目标值的较大者，1表示刚好饱和"""
+        frame_latency = sum(self.latency.values())
+        return max(self.inflight / self.capacity, frame_latency / self.target_latency)
+
+    def hints(self):
+        """给客户端的节奏建议"""
+        pressure = self.pressure()
+        interval = self.min_interval_ms * max(1.0, 2 * pressure)
+        for limit, max_dimension, jpeg_quality in RESOLUTION_STEPS:
+            if pressure < limit:
+                break
+        return {
+            'interval_ms': int(min(interval, self.max_interval_ms)),
+            'max_dimension': max_dimension,
+            'jpeg_quality': jpeg_quality,
+        }
+
+    def retry_after_ms(self):
+        """过载时建议的重试等待时间"""
+        frame_latency = sum(self.latency.values()) or self.target_latency
+        backlog = max(self.inflight - self.capacity + 1, 1)
+        return int(min(max(frame_latency * backlog * 1000, self.min_interval_ms), self.max_interval_ms * 5))
+
+    def stats(self):
+        return {
+            'inflight': self.inflight,
+            'capacity': self.capacity,
+            'max_inflight': self.max_inflight,
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'pressure': round(self.pressure(), 3),
+            'stage_latency_ms': {stage: round(value * 1000, 2) for stage, value in self.latency.items()},
+            'hints': self.hints(),
+        }
@@ -0,0 +1,226 @@
+"""注册照片存储
+
+照片按上传内容的SHA-256命名（<摘要>.jpg），同一张照片重复上传只保存一份；缩略图等变体
+与原图同名加后缀（<摘要>_thumb.jpg）。原图在提交数据库记录之前于请求线程中写入（临时文件、fsync、
+os.replace 原子替换），记录引用的原图一定存在，重新编码（reencode.py）不会因照片缺失而无法切换；
+变体由后台线程写入，写入队列已满时在请求线程中同步写入。
+
+同一内容可能同时被删除（清理任务）和重新注册，两边都在操作之后复查：删除时先把文件改名移走、
+再复查数据库引用，仍被引用就移回；注册提交记录后再确认原图存在，不存在就重新写入。
+注册失败时按删除的方式移除照片，排队中的变体发现原图已不存在时不再保留。
+
+目录保持扁平（不分子目录），在线备份（backup.py）按文件逐个复制。
+"""
+import hashlib
+import io
+import logging
+import os
+import queue
+import threading
+import time
+
+from PIL import Image
+
+VARIANTS = {'thumb': 160}  # 变体名 -> 最长边像素
+TMP_SUFFIX = '.tmp'
+
+
+class PhotoStore:
+    """内容寻址的照片目录与后台写入线程"""
+
+    def __init__(self, root='registered_faces', variants=None, queue_size=64, usage_ttl=60.0):
+        self.root = root
+        self.variants = VARIANTS if variants is None else variants
+        self.usage_ttl = usage_ttl  # 磁盘占用重新扫描的间隔（秒），期间按本进程的写入和删除增减
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread_pid = None
+        self._usage = None
+        self._usage_at = 0
+        self.writes = 0
+        self.sync_writes = 0
+        self.duplicates = 0
+        self.errors = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def path(self, digest, variant=None):
+        return os.path.join(self.root, f'{digest}_{variant}.jpg' if variant else f'{digest}.jpg')
+
+    def variant_path(self, photo_path, variant):
+        """已保存照片的变体路径"""
+        base, ext = os.path.splitext(photo_path)
+        return f'{base}_{variant}{ext}'
+
+    def address(self, data):
+        """照片（上传的原始字节）的保存路径"""
+        return self.path(hashlib.sha256(data).hexdigest())
+
+    def save(self, data):
+        """写入一张照片的原图并返回保存路径（在提交引用它的数据库记录之前调用）；变体稍后由后台线程写入"""
+        photo_path = self.address(data)
+        if os.path.exists(photo_path):
+            self.duplicates += 1
+            return photo_path
+        self._write_original(photo_path, data)
+        return photo_path
+
+    def ensure(self, data):
+        """提交数据库记录之后调用：同内容的照片恰好被清理任务删除时重新写入"""
+        photo_path = self.address(data)
+        if not os.path.exists(photo_path):
+            logging.getLogger(__name__).warning('照片在注册期间被清理，重新写入: %s', photo_path)
+            self._write_original(photo_path, data)
+        return photo_path
+
+    def _write_original(self, photo_path, data):
+        os.makedirs(self.root, exist_ok=True)
+        image = Image.open(io.BytesIO(data))
+        if image.format == 'JPEG':
+            written = self._write_atomic(photo_path, lambda f: f.write(data))
+        else:
+            rgb = image.convert('RGB')
+            written = self._write_atomic(photo_path, lambda f: rgb.save(f, 'JPEG'))
+        with self._lock:
+            if self._usage is not None:
+                self._usage = (self._usage[0] + 1, self._usage[1] + written)
+        job = (photo_path, image, time.perf_counter())
+        self.ensure_thread()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self.sync_writes += 1
+            self._write(job)
+
+    def _write_atomic(self, path, write):
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}{TMP_SUFFIX}'
+        try:
+            with open(tmp, 'wb') as f:
+                write(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return os.path.getsize(path)
+
+    def _write(self, job):
+        """写入一张照片的全部变体"""
+        photo_path, image, submitted = job
+        written = files = 0
+        try:
+            for variant, size in self.variants.items():
+                if not os.path.exists(photo_path):
+                    break
+                thumbnail = image.convert('RGB')
+                thumbnail.thumbnail((size, size))
+                written += self._write_atomic(self.variant_path(photo_path, variant),
+                                              lambda f: thumbnail.save(f, 'JPEG', quality=85))
+                files += 1
+            if files and not os.path.exists(photo_path):
+                # 排队期间原图已被删除（注册失败或清理任务）：写出的变体没有原图，一并删除
+                for variant in self.variants:
+                    try:
+                        os.remove(self.variant_path(photo_path, variant))
+                    except FileNotFoundError:
+                        pass
+                return
+        except Exception:
+            self.errors += 1
+            logging.getLogger(__name__).exception('照片变体写入失败: %s', photo_path)
+            return
+        latency = time.perf_counter() - submitted
+        with self._lock:
+            self.writes += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            if self._usage is not None:
+                self._usage = (self._usage[0] + files, self._usage[1] + written)
+
+    def remove(self, photo_path, referenced=None):
+        """删除照片及其变体，返回是否删除
+
+        referenced 为复查数据库引用的函数：文件先改名移走再复查，仍被引用（期间有同内容的注册提交）
+        时移回原处；否则才真正删除。
+        """
+        if referenced is not None and referenced():
+            return False
+        moved = []
+        for path in [photo_path] + [self.variant_path(photo_path, variant) for variant in self.variants]:
+            trash = f'{path}.{os.getpid()}.{threading.get_ident()}.trash{TMP_SUFFIX}'
+            try:
+                os.replace(path, trash)
+            except FileNotFoundError:
+                continue
+            moved.append((path, trash))
+        try:
+            keep = referenced is not None and referenced()
+        except Exception:
+            # 复查失败：移回后抛出，清理任务下次重试
+            self._restore(moved)
+            raise
+        if keep:
+            self._restore(moved)
+            return False
+        removed = [0, 0]
+        for _, trash in moved:
+            removed[0] += 1
+            removed[1] += os.path.getsize(trash)
+            os.remove(trash)
+        with self._lock:
+            if self._usage is not None:
+                self._usage = (self._usage[0] - removed[0], self._usage[1] - removed[1])
+        return True
+
+    def _restore(self, moved):
+        for path, trash in moved:
+            os.replace(trash, path)
+
+    def ensure_thread(self):
+        # 线程不会跨fork保留，每个worker进程各自启动
+        if self._thread_pid != os.getpid():
+            self._thread_pid = os.getpid()
+            threading.Thread(target=self._run, name='photo-writer', daemon=True).start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._write(job)
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """等待已提交的变体全部写入"""
+        self._queue.join()
+
+    def disk_usage(self):
+        """(文件数, 字节数)"""
+        with self._lock:
+            if self._usage is not None and time.monotonic() - self._usage_at < self.usage_ttl:
+                return self._usage
+        files = size = 0
+        if os.path.isdir(self.root):
+            for entry in os.scandir(self.root):
+                if entry.is_file() and not entry.name.endswith(TMP_SUFFIX):
+                    files += 1
+                    size += entry.stat().st_size
+        with self._lock:
+            self._usage = (files, size)
+            self._usage_at = time.monotonic()
+        return self._usage
+
+    def stats(self):
+        files, size = self.disk_usage()
+        return {
+            'files': files,
+            'bytes': size,
+            'pending': self._queue.qsize(),
+            'writes': self.writes,
+            'sync_writes': self.sync_writes,
+            'duplicates': self.duplicates,
+            'errors': self.errors,
+            'write_ms_avg': round(self.latency_total / self.writes * 1000, 2) if self.writes else 0.0,
+            'write_ms_max': round(self.latency_max * 1000, 2),
+        }
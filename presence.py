@@ -0,0 +1,80 @@
+"""在场查询：某一时刻谁在场、某段时间内谁出现过、个人时间线
+
+底层是 AttendanceStore.appearances_overlapping（SQLite实现由R*Tree区间索引支持），
+这里负责把同一人重叠的出现记录合并，并计算与查询范围重叠的时长。
+"""
+from datetime import datetime, timedelta
+
+from storage import from_ms, to_ms
+
+
+def merge_intervals(intervals):
+    """合并重叠或相接的区间 [(开始, 结束)]，返回按开始时间排序的新列表"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [tuple(interval) for interval in merged]
+
+
+def _clipped_seconds(segments, start_ms, end_ms):
+    return sum(max(0, min(end, end_ms) - max(start, start_ms)) for start, end in segments) / 1000
+
+
+def _iso(ms):
+    return from_ms(ms).isoformat()
+
+
+def _group_by_person(rows):
+    people = {}
+    for name, start_ms, end_ms, _, _ in rows:
+        people.setdefault(name, []).append((start_ms, end_ms))
+    return people
+
+
+def present_at(store, at):
+    """at 时刻在场的人及其所在的那次出现"""
+    at_ms = to_ms(at)
+    rows = store.appearances_overlapping(at, from_ms(at_ms + 1))
+    people = [{'name': name, 'since': _iso(min(s for s, _ in spans)), 'until': _iso(max(e for _, e in spans))}
+              for name, spans in sorted(_group_by_person(rows).items())]
+    return {'at': _iso(at_ms), 'count': len(people), 'people': people}
+
+
+def present_during(store, start, end):
+    """[start, end) 内出现过的人，以及每人在范围内的在场时长（重叠的出现只计一次）"""
+    start_ms, end_ms = to_ms(start), to_ms(end)
+    rows = store.appearances_overlapping(start, end)
+    people = []
+    for name, spans in sorted(_group_by_person(rows).items()):
+        segments = merge_intervals(spans)
+        people.append({
+            'name': name,
+            'appearances': len(spans),
+            'first_seen': _iso(max(segments[0][0], start_ms)),
+            'last_seen': _iso(min(segments[-1][1], end_ms)),
+            'present_minutes': round(_clipped_seconds(segments, start_ms, end_ms) / 60, 1),
+        })
+    return {'start': _iso(start_ms), 'end': _iso(end_ms), 'count': len(people), 'people': people}
+
+
+def timeline(store, name, start=None, end=None):
+    """某人在 [start, end) 内的出现记录与合并后的在场时段，默认最近7天"""
+    end = end or datetime.now()
+    start = start or end - timedelta(days=7)
+    start_ms, end_ms = to_ms(start), to_ms(end)
+    rows = store.appearances_overlapping(start, end, name=name)
+    segments = merge_intervals((s, e) for _, s, e, _, _ in rows)
+    return {
+        'name': name,
+        'start': _iso(start_ms),
+        'end': _iso(end_ms),
+        'appearances': [{'start': _iso(s), 'end': _iso(e), 'duration': duration, 'confidence': confidence}
+                        for _, s, e, duration, confidence in rows],
+        'segments': [{'start': _iso(s), 'end': _iso(e), 'minutes': round((e - s) / 60000, 1)}
+                     for s, e in segments],
+        'present_minutes': round(_clipped_seconds(segments, start_ms, end_ms) / 60, 1),
+    }
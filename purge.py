@@ -0,0 +1,172 @@
+"""已删除人员的考勤数据后台清理
+
+删除人脸时只在一个短事务中删掉注册记录（直接删除，不是软删除）、统计和汇总，并在 face_purges 中登记一个清理任务；
+此后所有查询都按 registered_faces 关联，这个人的出现记录立即不可见，人脸库也立即移除此人。
+出现记录由 PurgeWorker 按 (person_id, start_ms) 索引分小批删除（从最新的开始，今日统计最先恢复准确），
+批间暂停让出写锁，识别和考勤写入不会被长时间阻塞。记录删完后再从月度归档文件（见 retention.py）中
+删除此人的记录（在此之前查询已按现存人员关联归档记录，这些记录同样不可见），最后删除照片文件；
+照片按内容去重（见 photos.py），仍被其他注册引用（例如删除后用同一张照片重新注册）时保留；
+引用在删除文件前后各查一次，与同内容的注册并发时不会删掉新记录引用的照片。
+
+多个worker进程同时清理同一个任务时，删除由写事务串行化，结果相同。
+
+    python purge.py face_records.db
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import datetime
+
+import retention
+
+
+def _remove_file(path, referenced):
+    if not referenced() and os.path.exists(path):
+        os.remove(path)
+
+
+class PurgeWorker:
+    """分批删除已删除人员的出现记录"""
+
+    def __init__(self, connect, interval=5.0, batch_size=500, pause=0.05, history=20, remove_photo=None,
+                 archive_dir=None):
+        self.connect = connect
+        self.archive_dir = archive_dir  # 月度归档目录，None 表示没有归档
+        self.remove_photo = remove_photo or _remove_file  # (照片路径, 复查引用的函数) -> 删除照片（及其变体）
+        self.interval = interval  # 没有新任务时的检查间隔（秒）
+        self.batch_size = batch_size  # 每个写事务删除的记录数
+        self.pause = pause  # 批间暂停，让出写锁
+        self.history = history  # stats 中列出的已完成任务数
+        self.runs = 0
+        self.purged_rows = 0
+        self.last_error = None
+        self._thread_pid = None
+        self._wakeup = threading.Event()
+
+    def pending(self):
+        """未完成的任务 [(person_id, 姓名, 照片路径)]，按删除时间排序"""
+        with closing(self.connect()) as conn:
+            c = conn.cursor()
+            c.execute("""SELECT person_id, name, photo_path FROM face_purges
+                         WHERE finished_at IS NULL ORDER BY deleted_at""")
+            return c.fetchall()
+
+    def purge_batch(self, person_id):
+        """删除此人的一批出现记录，返回删除条数"""
+        with closing(self.connect()) as conn:
+            c = conn.cursor()
+            c.execute("""DELETE FROM appearances WHERE id IN
+                             (SELECT id FROM appearances WHERE person_id = ?
+                              ORDER BY start_ms DESC LIMIT ?)""", (person_id, self.batch_size))
+            deleted = c.rowcount
+            c.execute("UPDATE face_purges SET purged = purged + ? WHERE person_id = ?", (deleted, person_id))
+            conn.commit()
+        self.purged_rows += deleted
+        return deleted
+
+    def _referenced(self, photo_path):
+        with closing(self.connect()) as conn:
+            return conn.execute("SELECT 1 FROM registered_faces WHERE photo_path = ?",
+                                (photo_path,)).fetchone() is not None
+
+    def purge_archives(self, person_id):
+        """从归档文件中删除此人的记录，返回删除条数"""
+        if not self.archive_dir or not os.path.isdir(self.archive_dir):
+            return 0
+        deleted = retention.delete_person(self.archive_dir, person_id)
+        with closing(self.connect()) as conn:
+            conn.execute("UPDATE face_purges SET purged = purged + ? WHERE person_id = ?", (deleted, person_id))
+            conn.commit()
+        self.purged_rows += deleted
+        return deleted
+
+    def finish(self, person_id, photo_path):
+        if photo_path:
+            self.remove_photo(photo_path, lambda: self._referenced(photo_path))
+        with closing(self.connect()) as conn:
+            conn.execute("UPDATE face_purges SET finished_at = ? WHERE person_id = ? AND finished_at IS NULL",
+                         (datetime.now().isoformat(), person_id))
+            conn.commit()
+
+    def run_once(self):
+        """处理全部未完成的任务，返回删除的记录数"""
+        purged = 0
+        for person_id, name, photo_path in self.pending():
+            while True:
+                count = self.purge_batch(person_id)
+                purged += count
+                if count < self.batch_size:
+                    break
+                time.sleep(self.pause)
+            purged += self.purge_archives(person_id)
+            self.finish(person_id, photo_path)
+            logging.getLogger(__name__).info('已清理 %s 的考勤数据', name)
+        self.runs += 1
+        return purged
+
+    def notify(self):
+        """有新任务时立即开始清理"""
+        self._wakeup.set()
+
+    def ensure_thread(self):
+        # 线程不会跨fork保留，每个worker进程各自启动
+        if self._thread_pid != os.getpid():
+            self._thread_pid = os.getpid()
+            threading.Thread(target=self._run, name='purge', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logging.getLogger(__name__).exception('清理失败')
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def stats(self):
+        with closing(self.connect()) as conn:
+            c = conn.cursor()
+            c.execute("""SELECT person_id, name, purged, deleted_at, finished_at FROM face_purges
+                         WHERE finished_at IS NULL
+                         UNION ALL
+                         SELECT * FROM (SELECT person_id, name, purged, deleted_at, finished_at FROM face_purges
+                                        WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT ?)""",
+                      (self.history,))
+            jobs = []
+            for person_id, name, purged, deleted_at, finished_at in c.fetchall():
+                job = {'name': name, 'purged': purged, 'deleted_at': deleted_at, 'finished_at': finished_at}
+                if finished_at is None:
+                    # 剩余条数走 (person_id, start_ms) 索引计数
+                    c.execute("SELECT COUNT(*) FROM appearances WHERE person_id = ?", (person_id,))
+                    job['remaining'] = c.fetchone()[0]
+                jobs.append(job)
+        return {
+            'pending': sum(1 for job in jobs if job['finished_at'] is None),
+            'runs': self.runs,
+            'purged_rows': self.purged_rows,
+            'last_error': self.last_error,
+            'jobs': jobs,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='清理已删除人员的考勤数据')
+    parser.add_argument('db', nargs='?', default='face_records.db')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--archive-dir', default=os.environ.get('ARCHIVE_DIR', 'archive'))
+    args = parser.parse_args(argv)
+
+    worker = PurgeWorker(lambda: sqlite3.connect(args.db), batch_size=args.batch_size, archive_dir=args.archive_dir)
+    worker.run_once()
+    print(json.dumps(worker.stats(), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
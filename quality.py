@@ -0,0 +1,137 @@
+"""人脸质量评分：在检测与编码之间过滤过小、模糊、过暗过亮或侧脸严重的人脸
+
+特征编码是整条流水线中最贵的一步，而这些人脸几乎不可能匹配成功。
+评分按开销从低到高依次检查，任一项不达标即停止；姿态由5点关键点估算。
+"""
+import math
+import os
+
+import numpy as np
+
+import models
+
+LOW_QUALITY = 'low_quality'
+
+# 灰度化权重（ITU-R BT.601）
+_GRAY_WEIGHTS = np.array([0.299, 0.587, 0.114])
+_SHARPNESS_SIZE = 96  # 计算清晰度前把人脸区域降采样到的大致边长
+
+
+class QualityLimits:
+    """质量阈值；check_pose=False 时不做关键点定位"""
+
+    def __init__(self, min_size=40, min_sharpness=30.0, min_brightness=40, max_brightness=220,
+                 max_yaw=0.35, max_roll=25.0, check_pose=True):
+        self.min_size = min_size
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.max_yaw = max_yaw  # 鼻尖偏离两眼中点的水平距离 / 两眼间距
+        self.max_roll = max_roll  # 两眼连线的倾斜角度（度）
+        self.check_pose = check_pose
+
+    @classmethod
+    def from_env(cls, prefix, **defaults):
+        """从环境变量读取阈值，例如 QUALITY_MIN_SIZE、QUALITY_CHECK_POSE"""
+        limits = cls(**defaults)
+        for key, value in vars(limits).items():
+            raw = os.environ.get(prefix + key.upper())
+            if raw is None:
+                continue
+            if isinstance(value, bool):
+                setattr(limits, key, raw.lower() not in ('0', 'false', 'no'))
+            else:
+                setattr(limits, key, type(value)(raw))
+        return limits
+
+
+def _gray_region(img_array, location):
+    top, right, bottom, left = location
+    region = img_array[max(top, 0):bottom, max(left, 0):right]
+    if region.ndim == 3:
+        region = region[..., :3] @ _GRAY_WEIGHTS
+    return region.astype(np.float64)
+
+
+def sharpness(gray):
+    """拉普拉斯响应的方差，越大越清晰"""
+    step = max(1, min(gray.shape) // _SHARPNESS_SIZE)
+    gray = gray[::step, ::step]
+    if min(gray.shape) < 3:
+        return 0.0
+    laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+                 - 4 * gray[1:-1, 1:-1])
+    return float(laplacian.var())
+
+
+def pose(img_array, location):
+    """由5点关键点估算 (偏航比例, 翻滚角度)"""
+    landmarks = models.face_recognition().face_landmarks(img_array, [location], model='small')
+    if not landmarks:
+        return None, None
+    points = landmarks[0]
+    left_eye = np.mean(points['left_eye'], axis=0)
+    right_eye = np.mean(points['right_eye'], axis=0)
+    nose = np.array(points['nose_tip'][0], dtype=np.float64)
+    eye_vector = left_eye - right_eye
+    eye_distance = float(np.hypot(*eye_vector)) or 1.0
+    yaw = float((nose[0] - (left_eye[0] + right_eye[0]) / 2) / eye_distance)
+    roll = math.degrees(math.atan2(eye_vector[1], eye_vector[0]))
+    # 两眼先后顺序不影响结果，折算到 [-90, 90]
+    if roll > 90:
+        roll -= 180
+    elif roll < -90:
+        roll += 180
+    return yaw, roll
+
+
+def score_face(img_array, location, limits):
+    """评估一张人脸，返回评分字典；未通过时 reason 为第一个不达标的项目"""
+    top, right, bottom, left = location
+    size = min(right - left, bottom - top)
+    score = {'passed': False, 'reason': None, 'size': int(size)}
+    if size < limits.min_size:
+        score['reason'] = 'too_small'
+        return score
+
+    gray = _gray_region(img_array, location)
+    brightness = float(gray.mean()) if gray.size else 0.0
+    score['brightness'] = round(brightness, 1)
+    if brightness < limits.min_brightness:
+        score['reason'] = 'too_dark'
+        return score
+    if brightness > limits.max_brightness:
+        score['reason'] = 'too_bright'
+        return score
+
+    score['sharpness'] = round(sharpness(gray), 1)
+    if score['sharpness'] < limits.min_sharpness:
+        score['reason'] = 'blurry'
+        return score
+
+    if limits.check_pose:
+        yaw, roll = pose(img_array, location)
+        if yaw is None:
+            score['reason'] = 'no_landmarks'
+            return score
+        score['yaw'] = round(yaw, 3)
+        score['roll'] = round(roll, 1)
+        if abs(yaw) > limits.max_yaw:
+            score['reason'] = 'off_angle'
+            return score
+        if abs(roll) > limits.max_roll:
+            score['reason'] = 'tilted'
+            return score
+
+    score['passed'] = True
+    return score
+
+
+def filter_faces(img_array, locations, limits, counters=None):
+    """返回每个位置的评分；counters 不为空时累计通过数和各原因的跳过数"""
+    scores = [score_face(img_array, location, limits) for location in locations]
+    if counters is not None:
+        for score in scores:
+            counters.add('evaluated')
+            counters.add('passed' if score['passed'] else f"skipped_{score['reason']}")
+    return scores
@@ -0,0 +1,189 @@
+"""检测、编码与匹配流水线
+
+/recognize 的整帧模式与裁剪模式、人脸注册以及离线处理共用这里的实现。
+检测之后、编码之前可以按质量阈值过滤人脸（见 quality.py）。
+配置了摄像头区域（见 zones.py）时，整帧模式只在区域外接矩形内检测，区域外的人脸在编码前丢弃。
+坐标均为 face_recognition 的 (top, right, bottom, left) 形式。
+"""
+import base64
+import io
+from contextlib import nullcontext
+
+import numpy as np
+from PIL import Image
+
+import models
+import quality
+
+MATCH_TOLERANCE = 0.6  # 可调整阈值
+# face_recognition 的默认编码参数；更换后已注册的特征不再可比，需用 reencode.py 重新编码人脸库
+DEFAULT_ENCODER = {'model': 'small', 'num_jitters': 1}
+TRACKING_TIMEOUT = 3  # 3秒没检测到就认为离开了（页面端跟踪与离线视频处理相同）
+
+
+def decode_image(data_url):
+    """把前端上传的 data URL 解码为RGB数组"""
+    image_data = data_url.split(',')[1]
+    image = Image.open(io.BytesIO(base64.b64decode(image_data)))
+    return np.array(image.convert('RGB'))
+
+
+def _stage(pacer, name):
+    return pacer.stage(name) if pacer else nullcontext()
+
+
+def detect_faces(img_array):
+    return models.face_recognition().face_locations(img_array)
+
+
+def encode_faces(img_array, locations, encoder=None):
+    """对给定位置做关键点定位和特征提取；encoder 为编码参数，应与人脸库快照的 encoder 一致"""
+    if not locations:
+        return []
+    encoder = encoder or DEFAULT_ENCODER
+    return models.face_recognition().face_encodings(img_array, locations, num_jitters=encoder['num_jitters'],
+                                                    model=encoder['model'])
+
+
+def match_faces(snapshot, encodings, tolerance=MATCH_TOLERANCE):
+    """返回每个特征对应的 (姓名, 置信度)，未匹配为 ("Unknown", 0)"""
+    results = []
+    for encoding in encodings:
+        name, distance = snapshot.match(encoding, tolerance)
+        if name is None:
+            results.append(("Unknown", 0))
+        else:
+            results.append((name, 1 - distance))
+    return results
+
+
+def face_result(location, name, confidence):
+    top, right, bottom, left = location
+    return {
+        'bbox': {
+            'x': left,
+            'y': top,
+            'width': right - left,
+            'height': bottom - top
+        },
+        'name': name,
+        'confidence': confidence
+    }
+
+
+def _assemble(locations, scores, matches):
+    """按原顺序组合结果：质量不达标的人脸标记为 low_quality，其余依次取匹配结果"""
+    matches = iter(matches)
+    results = []
+    for location, score in zip(locations, scores):
+        if score is not None and not score['passed']:
+            result = face_result(location, quality.LOW_QUALITY, 0)
+            result['quality'] = score
+        else:
+            name, confidence = next(matches)
+            result = face_result(location, name, confidence)
+        results.append(result)
+    return results
+
+
+def _observe_zones(zone_counters, faces, discarded, pixels=0, detect_pixels=0):
+    if zone_counters is None:
+        return
+    zone_counters.add('frames')
+    zone_counters.add('pixels', pixels)
+    zone_counters.add('detect_pixels', detect_pixels)
+    zone_counters.add('faces', faces)
+    zone_counters.add('discarded_faces', discarded)
+
+
+def detect_in_zones(img_array, zones, zone_counters=None):
+    """只在区域外接矩形内检测，返回整帧坐标下中心落在区域内的人脸"""
+    height, width = img_array.shape[:2]
+    if zones is None:
+        locations = detect_faces(img_array)
+        _observe_zones(zone_counters, len(locations), 0, height * width, height * width)
+        return locations
+    top, right, bottom, left = zones.crop_box(height, width)
+    region = np.ascontiguousarray(img_array[top:bottom, left:right])
+    found = [(t + top, r + left, b + top, l + left) for t, r, b, l in detect_faces(region)] if region.size else []
+    locations = [location for location in found if zones.contains(location, height, width)]
+    _observe_zones(zone_counters, len(found), len(found) - len(locations),
+                   height * width, (bottom - top) * (right - left))
+    return locations
+
+
+def recognize_frame(img_array, snapshot, pacer=None, limits=None, counters=None, zones=None, zone_counters=None):
+    """整帧识别：检测 -> 质量过滤 -> 编码 -> 匹配
+
+    limits 为空时不做质量过滤；counters 用于累计质量过滤的通过与跳过数。
+    zones 为摄像头区域（zones.CameraZones），zone_counters 累计检测像素与丢弃的人脸数。
+    """
+    with _stage(pacer, 'detect'):
+        locations = detect_in_zones(img_array, zones, zone_counters)
+    with _stage(pacer, 'quality'):
+        if limits is None:
+            scores = [None] * len(locations)
+        else:
+            scores = quality.filter_faces(img_array, locations, limits, counters)
+    passed = [location for location, score in zip(locations, scores) if score is None or score['passed']]
+    with _stage(pacer, 'encode'):
+        encodings = encode_faces(img_array, passed, snapshot.encoder)
+    with _stage(pacer, 'match'):
+        matches = match_faces(snapshot, encodings)
+    return _assemble(locations, scores, matches)
+
+
+def crop_location(crop, height, width):
+    """裁剪图中人脸的位置；未提供时整张裁剪图即为人脸"""
+    face = crop.get('face')
+    if not face:
+        return (0, width, height, 0)
+    left = max(int(face['x']), 0)
+    top = max(int(face['y']), 0)
+    return (top, min(left + int(face['width']), width), min(top + int(face['height']), height), left)
+
+
+def to_frame_location(location, crop):
+    """把裁剪图内的坐标换算回整帧坐标"""
+    top, right, bottom, left = location
+    scale = float(crop.get('scale', 1)) or 1
+    x, y = float(crop.get('x', 0)), float(crop.get('y', 0))
+    return (int(round(y + top / scale)), int(round(x + right / scale)),
+            int(round(y + bottom / scale)), int(round(x + left / scale)))
+
+
+def recognize_crops(crops, snapshot, pacer=None, limits=None, counters=None, zones=None, frame_size=None,
+                    zone_counters=None):
+    """裁剪模式：客户端已知人脸位置，跳过整帧检测，只做关键点、编码和匹配
+
+    crops 中每项为 {'image': data URL, 'x', 'y': 裁剪区域在整帧中的左上角,
+    'scale': 裁剪图像素/整帧像素（默认1）, 'face': 裁剪图内的人脸框（可选）}
+    给出 zones 和整帧尺寸 frame_size=(高, 宽) 时，丢弃中心不在区域内的人脸。
+    """
+    with _stage(pacer, 'decode'):
+        arrays = [decode_image(crop['image']) for crop in crops]
+    with _stage(pacer, 'detect'):
+        locations = [crop_location(crop, arr.shape[0], arr.shape[1]) for crop, arr in zip(crops, arrays)]
+        if zones is not None and frame_size:
+            kept = [i for i, (crop, location) in enumerate(zip(crops, locations))
+                    if zones.contains(to_frame_location(location, crop), *frame_size)]
+            _observe_zones(zone_counters, len(crops), len(crops) - len(kept))
+            crops = [crops[i] for i in kept]
+            arrays = [arrays[i] for i in kept]
+            locations = [locations[i] for i in kept]
+        else:
+            _observe_zones(zone_counters, len(crops), 0)
+    with _stage(pacer, 'quality'):
+        if limits is None:
+            scores = [None] * len(crops)
+        else:
+            scores = [quality.filter_faces(arr, [location], limits, counters)[0]
+                      for arr, location in zip(arrays, locations)]
+    with _stage(pacer, 'encode'):
+        encodings = [encode_faces(arr, [location], snapshot.encoder)[0]
+                     for arr, location, score in zip(arrays, locations, scores)
+                     if score is None or score['passed']]
+    with _stage(pacer, 'match'):
+        matches = match_faces(snapshot, encodings)
+    frame_locations = [to_frame_location(location, crop) for crop, location in zip(crops, locations)]
+    return _assemble(frame_locations, scores, matches)
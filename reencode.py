@@ -0,0 +1,270 @@
+"""更换编码参数后重新编码人脸库
+
+更换 num_jitters、关键点模型（small/large）等编码参数后，已注册的特征与新参数生成的特征不可比。
+本工具从注册照片重新计算特征，不需要逐个重新注册，服务也不用停机：
+
+    python reencode.py face_records.db --model large --jitters 5 --workers 4   # 编码（可随时中断，重跑即续做）
+    python reencode.py face_records.db --model large --jitters 5 --switch      # 补齐后切换
+    python reencode.py face_records.db --rollback                              # 切回上一个版本
+    python reencode.py face_records.db --status
+
+每组参数对应 encoder_versions 中的一个版本，特征按 (人员, 版本) 写入 face_encodings，每批提交一次，
+中断后只处理还没有该版本特征的人员。编码期间新注册的人员在切换前补齐。
+切换在一个写事务中完成：当前特征先存为旧版本（供回滚），再把新版本的特征复制到 registered_faces.encoding，
+并发布一条 reload 变更；各进程的同步线程整体重新加载人脸库，识别随快照一起改用新参数编码。
+回滚即切换到上一个版本，期间新注册的人员同样先按旧参数补齐。
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+import models
+import recognition
+from storage import SQLiteStore
+
+DEFAULT_BATCH_SIZE = 64
+
+# 工作进程内的编码参数，由 _init_worker 设置
+_worker = {}
+
+
+def _state(c, key):
+    """encoder_state 中的版本号：active 为当前版本，previous 为上一个版本"""
+    c.execute("SELECT value FROM encoder_state WHERE key = ?", (key,))
+    row = c.fetchone()
+    return row[0] if row else None
+
+
+def _set_state(c, key, value):
+    c.execute("""INSERT INTO encoder_state (key, value) VALUES (?, ?)
+                 ON CONFLICT (key) DO UPDATE SET value = excluded.value""", (key, value))
+
+
+def _params(c, version):
+    c.execute("SELECT params FROM encoder_versions WHERE version = ?", (version,))
+    row = c.fetchone()
+    if not row:
+        raise ValueError(f'编码版本不存在: {version}')
+    return json.loads(row[0])
+
+
+def _ensure_active_version(c):
+    """当前版本号；从未切换过时为默认参数登记一个版本"""
+    version = _state(c, 'active')
+    if version is None:
+        c.execute("INSERT INTO encoder_versions (params, created_at, activated_at) VALUES (?, ?, ?)",
+                  (json.dumps(recognition.DEFAULT_ENCODER), datetime.now().isoformat(), datetime.now().isoformat()))
+        version = c.lastrowid
+        _set_state(c, 'active', version)
+    return version
+
+
+def version_for(connect, params):
+    """参数对应的版本号，不存在时新建；同样的参数重跑时返回同一个版本，已写入的特征得以复用"""
+    encoded = json.dumps(params, sort_keys=True)
+    with closing(connect()) as conn:
+        c = conn.cursor()
+        _ensure_active_version(c)
+        for version, existing in c.execute("SELECT version, params FROM encoder_versions").fetchall():
+            if json.dumps(json.loads(existing), sort_keys=True) == encoded:
+                conn.commit()
+                return version
+        c.execute("INSERT INTO encoder_versions (params, created_at) VALUES (?, ?)",
+                  (json.dumps(params), datetime.now().isoformat()))
+        version = c.lastrowid
+        conn.commit()
+        return version
+
+
+def missing(c, version):
+    """还没有该版本特征的人员 [(person_id, 姓名, 照片路径)]"""
+    c.execute("""SELECT f.id, f.name, f.photo_path FROM registered_faces f
+                 WHERE NOT EXISTS (SELECT 1 FROM face_encodings e
+                                   WHERE e.person_id = f.id AND e.encoder_version = ?)
+                 ORDER BY f.id""", (version,))
+    return c.fetchall()
+
+
+def _init_worker(params, base_dir):
+    _worker['params'] = params
+    _worker['base_dir'] = base_dir
+    models.face_recognition()
+
+
+def encode_photo(task):
+    """重新编码一张注册照片，返回 (person_id, 特征或None, 错误信息)"""
+    person_id, name, photo_path = task
+    try:
+        path = photo_path if os.path.isabs(photo_path) else os.path.join(_worker['base_dir'], photo_path)
+        img_array = np.array(Image.open(path).convert('RGB'))
+        locations = recognition.detect_faces(img_array)
+        if not locations:
+            return person_id, None, f'{name}: 照片中未检测到人脸'
+        # 注册时保证只有一张人脸；以防万一取最大的一张
+        location = max(locations, key=lambda loc: (loc[2] - loc[0]) * (loc[1] - loc[3]))
+        return person_id, recognition.encode_faces(img_array, [location], _worker['params'])[0], None
+    except Exception as e:
+        return person_id, None, f'{name}: {e}'
+
+
+def encode_missing(connect, version, workers=None, batch_size=DEFAULT_BATCH_SIZE, base_dir='.'):
+    """为还没有该版本特征的人员编码，每批提交一次；返回进度报告"""
+    started = time.perf_counter()
+    with closing(connect()) as conn:
+        c = conn.cursor()
+        params = _params(c, version)
+        # 当前版本的特征就在 registered_faces 中，不需要编码
+        pending = [] if version == _state(c, 'active') else missing(c, version)
+    tasks = [task for task in pending if task[2]]
+    errors = [f'{name}: 没有注册照片' for _, name, photo_path in pending if not photo_path]
+    encoded = 0
+    workers = workers or os.cpu_count() or 1
+    if tasks:
+        ctx = multiprocessing.get_context('spawn')
+        with ctx.Pool(workers, initializer=_init_worker, initargs=(params, base_dir)) as pool, \
+                closing(connect()) as conn:
+            batch = []
+            results = pool.imap_unordered(encode_photo, tasks, chunksize=max(1, min(16, len(tasks) // workers)))
+            for person_id, encoding, error in results:
+                if error:
+                    errors.append(error)
+                    continue
+                batch.append((person_id, version, pickle.dumps(np.asarray(encoding))))
+                if len(batch) >= batch_size:
+                    conn.executemany("INSERT OR REPLACE INTO face_encodings VALUES (?, ?, ?)", batch)
+                    conn.commit()
+                    encoded += len(batch)
+                    batch = []
+                    logging.getLogger(__name__).info('版本 %d 已编码 %d/%d', version, encoded, len(tasks))
+            conn.executemany("INSERT OR REPLACE INTO face_encodings VALUES (?, ?, ?)", batch)
+            conn.commit()
+            encoded += len(batch)
+    seconds = time.perf_counter() - started
+    return {
+        'version': version,
+        'params': params,
+        'workers': workers,
+        'encoded': encoded,
+        'failed': len(errors),
+        'errors': errors[:20],
+        'seconds': round(seconds, 2),
+        'faces_per_second': round(encoded / seconds, 2) if seconds > 0 and encoded else None,
+    }
+
+
+def switch(connect, version):
+    """原子地切换到已编码完成的版本；还有人员缺少该版本特征时不切换，返回缺少的姓名"""
+    with closing(connect()) as conn:
+        conn.isolation_level = None
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            params = _params(c, version)
+            current = _ensure_active_version(c)
+            absent = [] if current == version else [name for _, name, _ in missing(c, version)]
+            if absent or current == version:
+                c.execute("ROLLBACK")
+                return absent
+            # 当前特征（包括上次切换后新注册的人员）存为当前版本，供回滚
+            c.execute("""INSERT OR REPLACE INTO face_encodings (person_id, encoder_version, encoding)
+                         SELECT id, ?, encoding FROM registered_faces""", (current,))
+            c.execute("""UPDATE registered_faces SET encoding =
+                             (SELECT encoding FROM face_encodings e
+                              WHERE e.person_id = registered_faces.id AND e.encoder_version = ?)""", (version,))
+            c.execute("DELETE FROM face_encodings WHERE person_id NOT IN (SELECT id FROM registered_faces)")
+            c.execute("UPDATE encoder_versions SET activated_at = ? WHERE version = ?",
+                      (datetime.now().isoformat(), version))
+            _set_state(c, 'active', version)
+            _set_state(c, 'previous', current)
+            c.execute("""INSERT INTO gallery_events (op, encoding, created_at) VALUES ('reload', ?, ?)""",
+                      (pickle.dumps(params), datetime.now().isoformat()))
+            c.execute("COMMIT")
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
+    return []
+
+
+def encode_and_switch(connect, version, attempts=3, **options):
+    """补齐缺少的特征后切换；补齐期间又有新注册时重试，返回 (报告, 仍缺少的姓名)"""
+    for _ in range(attempts):
+        report = encode_missing(connect, version, **options)
+        absent = switch(connect, version)
+        if not absent or report['failed']:
+            return report, absent
+    return report, absent
+
+
+def status(connect):
+    with closing(connect()) as conn:
+        c = conn.cursor()
+        active = _state(c, 'active')
+        previous = _state(c, 'previous')
+        c.execute("SELECT COUNT(*) FROM registered_faces")
+        total = c.fetchone()[0]
+        versions = []
+        for version, params, created_at, activated_at in c.execute(
+                "SELECT version, params, created_at, activated_at FROM encoder_versions ORDER BY version").fetchall():
+            versions.append({'version': version, 'params': json.loads(params), 'created_at': created_at,
+                             'activated_at': activated_at, 'active': version == active,
+                             'missing': 0 if version == active else len(missing(c, version))})
+    return {'active': active, 'previous': previous, 'registered_faces': total,
+            'default_params': recognition.DEFAULT_ENCODER, 'versions': versions}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='更换编码参数后重新编码人脸库')
+    parser.add_argument('db', nargs='?', default=os.environ.get('FACE_DB_PATH', 'face_records.db'))
+    parser.add_argument('--model', choices=('small', 'large'), default=recognition.DEFAULT_ENCODER['model'],
+                        help='关键点模型')
+    parser.add_argument('--jitters', type=int, default=recognition.DEFAULT_ENCODER['num_jitters'],
+                        help='编码时的随机扰动次数')
+    parser.add_argument('--workers', type=int, default=None, help='编码进程数，默认为CPU核数')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='每次提交的特征数')
+    parser.add_argument('--base-dir', default='.', help='相对照片路径的起点（服务的工作目录）')
+    action = parser.add_mutually_exclusive_group()
+    action.add_argument('--switch', action='store_true', help='补齐后切换到这组参数')
+    action.add_argument('--rollback', action='store_true', help='切回上一个版本')
+    action.add_argument('--status', action='store_true', help='只查看各版本的状态')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    SQLiteStore(args.db).init_schema()
+
+    def connect():
+        return sqlite3.connect(args.db)
+
+    if args.status:
+        print(json.dumps(status(connect), indent=2, ensure_ascii=False))
+        return
+    options = {'workers': args.workers, 'batch_size': args.batch_size, 'base_dir': args.base_dir}
+    if args.rollback:
+        with closing(connect()) as conn:
+            version = _state(conn.cursor(), 'previous')
+        if version is None:
+            raise SystemExit('没有可以回滚的版本')
+    else:
+        version = version_for(connect, {'model': args.model, 'num_jitters': args.jitters})
+    if args.switch or args.rollback:
+        report, absent = encode_and_switch(connect, version, **options)
+        report['switched'] = not absent
+        report['missing'] = absent[:20]
+    else:
+        report = encode_missing(connect, version, **options)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if report.get('switched') is False:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
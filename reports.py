@@ -0,0 +1,255 @@
+"""考勤报表：日报、周报、月报
+
+按开始时间分批读取出现记录（AttendanceStore.iter_appearances），每批转成NumPy数组后向量化处理：
+同一人重叠的出现先合并为在场时段，再累加每人每天的在场分钟、到达/离开时间分布和各时间段的平均在场人数。
+跨批次只保留每人最后一个可能继续合并的时段，内存占用取决于批大小和人数，与记录总数无关。
+"""
+import csv
+import io
+import time
+import warnings
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from storage import day_range_ms, from_ms, to_ms
+
+KINDS = ('daily', 'weekly', 'monthly')
+DEFAULT_BUCKET_MINUTES = {'daily': 15, 'weekly': 60, 'monthly': 60}
+TIME_OF_DAY_BUCKET_MINUTES = 30  # 到达/离开时间分布的分桶
+CHUNK_SIZE = 100000
+_MINUTE_MS = 60000
+_NEVER = np.iinfo(np.int64).max
+
+
+def report_range(kind, day):
+    """报表类型与日期对应的 [开始, 结束)：当天、所在的周（周一开始）或所在的月"""
+    start = datetime(day.year, day.month, day.day)
+    if kind == 'daily':
+        return start, start + timedelta(days=1)
+    if kind == 'weekly':
+        monday = start - timedelta(days=start.weekday())
+        return monday, monday + timedelta(days=7)
+    if kind == 'monthly':
+        first = start.replace(day=1)
+        return first, (first + timedelta(days=32)).replace(day=1)
+    raise ValueError(f'未知的报表类型: {kind}')
+
+
+def merge_segments(people, starts, ends):
+    """合并同一人重叠或相接的区间，返回按 (人, 开始) 排序的 (人, 开始, 结束)"""
+    if not len(people):
+        return people, starts, ends
+    order = np.lexsort((starts, people))
+    people, starts, ends = people[order], starts[order], ends[order]
+    # 组内结束时间的前缀最大值：每人加上递增的偏移后做一次 maximum.accumulate，组与组互不影响
+    base = starts.min()
+    span = int(ends.max() - base) + 1
+    offset = people * span
+    reach = np.maximum.accumulate(offset + (ends - base)) - offset + base
+    first = np.ones(len(people), dtype=bool)
+    first[1:] = (people[1:] != people[:-1]) | (starts[1:] > reach[:-1])
+    first = np.flatnonzero(first)
+    return people[first], starts[first], np.maximum.reduceat(ends, first)
+
+
+def _coverage(starts, ends, edges):
+    """累计在场毫秒数 C(t) = Σ clip(t - 开始, 0, 结束 - 开始)，t 取各个分桶边界"""
+    origin = edges[0]
+    starts = np.sort(starts - origin)
+    ends = np.sort(ends - origin)
+    t = edges - origin
+    start_sums = np.concatenate(([0], np.cumsum(starts)))
+    end_sums = np.concatenate(([0], np.cumsum(ends)))
+    i = np.searchsorted(starts, t)
+    j = np.searchsorted(ends, t)
+    return (i * t - start_sums[i]) - (j * t - end_sums[j])
+
+
+def _clock(ms):
+    minutes = int(ms) // _MINUTE_MS
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def _distribution(values):
+    """当天零点起的毫秒数 -> 分桶计数与分位数"""
+    bucket_ms = TIME_OF_DAY_BUCKET_MINUTES * _MINUTE_MS
+    buckets = 24 * 60 // TIME_OF_DAY_BUCKET_MINUTES
+    counts = np.bincount(np.minimum(values // bucket_ms, buckets - 1), minlength=buckets)
+    if len(values):
+        p10, p50, p90 = np.percentile(values, [10, 50, 90])
+        summary = {'p10': _clock(p10), 'p50': _clock(p50), 'p90': _clock(p90)}
+    else:
+        summary = {'p10': None, 'p50': None, 'p90': None}
+    return counts, summary
+
+
+class _Accumulator:
+    """累加已确定（不会再与后续记录合并）的在场时段"""
+
+    def __init__(self, start_ms, end_ms, day_edges, bucket_edges):
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.day_edges = day_edges
+        self.bucket_edges = bucket_edges
+        self.index = {}  # 姓名 -> 行号
+        days = len(day_edges) - 1
+        self.present_ms = np.zeros((0, days), dtype=np.int64)
+        self.arrive = np.full((0, days), _NEVER, dtype=np.int64)
+        self.depart = np.full((0, days), -1, dtype=np.int64)
+        self.coverage = np.zeros(len(bucket_edges), dtype=np.int64)
+        self.segments = 0
+
+    def codes(self, names):
+        index = self.index
+        return np.fromiter((index.setdefault(name, len(index)) for name in names),
+                           dtype=np.int64, count=len(names))
+
+    def _grow(self):
+        rows = len(self.present_ms)
+        if len(self.index) <= rows:
+            return
+        extra = max(len(self.index), 2 * rows) - rows
+        days = self.present_ms.shape[1]
+        self.present_ms = np.vstack([self.present_ms, np.zeros((extra, days), dtype=np.int64)])
+        self.arrive = np.vstack([self.arrive, np.full((extra, days), _NEVER, dtype=np.int64)])
+        self.depart = np.vstack([self.depart, np.full((extra, days), -1, dtype=np.int64)])
+
+    def add(self, people, starts, ends):
+        starts = np.maximum(starts, self.start_ms)
+        ends = np.minimum(ends, self.end_ms)
+        inside = ends > starts
+        people, starts, ends = people[inside], starts[inside], ends[inside]
+        if not len(people):
+            return
+        self.segments += len(people)
+        self._grow()
+        edges = self.day_edges
+        first_day = np.searchsorted(edges, starts, 'right') - 1
+        last_day = np.searchsorted(edges, ends, 'left') - 1
+        # 时段可能跨越午夜：第k轮累加每个时段的第k天，轮数等于最长时段跨越的天数
+        k = 0
+        while True:
+            day = first_day + k
+            spans = day <= last_day
+            if not spans.any():
+                break
+            day = day[spans]
+            overlap = np.minimum(ends[spans], edges[day + 1]) - np.maximum(starts[spans], edges[day])
+            np.add.at(self.present_ms, (people[spans], day), overlap)
+            k += 1
+        np.minimum.at(self.arrive, (people, first_day), starts - edges[first_day])
+        np.maximum.at(self.depart, (people, last_day), ends - edges[last_day])
+        self.coverage += _coverage(starts, ends, self.bucket_edges)
+
+
+def build_report(store, start, end, bucket_minutes=60, chunk_size=CHUNK_SIZE):
+    """[start, end) 的考勤报表：每人每天在场分钟、到达/离开时间分布、平均在场人数曲线"""
+    started = time.perf_counter()
+    start_ms, end_ms = to_ms(start), to_ms(end)
+    if end_ms <= start_ms:
+        raise ValueError('结束时间必须晚于开始时间')
+    days = []
+    day = start.date()
+    while not days or day_range_ms(days[-1])[1] < end_ms:
+        days.append(day)
+        day += timedelta(days=1)
+    day_edges = np.array([day_range_ms(d)[0] for d in days] + [day_range_ms(days[-1])[1]], dtype=np.int64)
+    bucket_ms = int(bucket_minutes * _MINUTE_MS)
+    bucket_edges = np.append(np.arange(start_ms, end_ms, bucket_ms, dtype=np.int64), end_ms)
+
+    acc = _Accumulator(start_ms, end_ms, day_edges, bucket_edges)
+    carry = (np.zeros(0, dtype=np.int64),) * 3
+    records = 0
+    for rows in store.iter_appearances(start, end, chunk_size):
+        names, starts, ends = zip(*rows)
+        records += len(rows)
+        starts = np.array(starts, dtype=np.int64)
+        ends = np.maximum(np.array(ends, dtype=np.int64), starts)
+        # 记录按开始时间返回，之后批次的记录都不早于本批最后一条；
+        # 每人最后一个时段若结束得不早于它，还可能与后续记录合并，留到下一批
+        horizon = starts.max()
+        people, starts, ends = merge_segments(np.concatenate([carry[0], acc.codes(names)]),
+                                              np.concatenate([carry[1], starts]),
+                                              np.concatenate([carry[2], ends]))
+        last = np.ones(len(people), dtype=bool)
+        last[:-1] = people[1:] != people[:-1]
+        pending = last & (ends >= horizon)
+        acc.add(people[~pending], starts[~pending], ends[~pending])
+        carry = (people[pending], starts[pending], ends[pending])
+    acc.add(*carry)
+
+    count = len(acc.index)
+    present_ms = acc.present_ms[:count]
+    arrive = acc.arrive[:count]
+    depart = acc.depart[:count]
+    names = sorted(acc.index, key=acc.index.get)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # 某人在范围内没有到达记录时中位数为NaN
+        median_arrival = np.nanmedian(np.where(arrive == _NEVER, np.nan, arrive), axis=1) if count else []
+        median_departure = np.nanmedian(np.where(depart < 0, np.nan, depart), axis=1) if count else []
+    people = []
+    for row in sorted(range(count), key=names.__getitem__):
+        total = int(present_ms[row].sum())
+        if not total:
+            continue
+        people.append({
+            'name': names[row],
+            'present_minutes': round(total / _MINUTE_MS, 1),
+            'days_present': int((present_ms[row] > 0).sum()),
+            'median_arrival': _clock(median_arrival[row]),
+            'median_departure': _clock(median_departure[row]),
+            'minutes_per_day': [round(ms / _MINUTE_MS, 1) for ms in present_ms[row].tolist()],
+        })
+
+    arrival_counts, arrivals = _distribution(arrive[arrive != _NEVER])
+    departure_counts, departures = _distribution(depart[depart >= 0])
+    bucket_lengths = np.diff(bucket_edges)
+    average = np.diff(acc.coverage) / bucket_lengths
+    occupancy = [{'time': from_ms(t).isoformat(), 'average_present': round(float(v), 2)}
+                 for t, v in zip(bucket_edges[:-1].tolist(), average.tolist())]
+    peak = occupancy[int(np.argmax(average))] if len(average) else None
+    return {
+        'start': from_ms(start_ms).isoformat(),
+        'end': from_ms(end_ms).isoformat(),
+        'days': [d.isoformat() for d in days],
+        'records': records,
+        'segments': acc.segments,
+        'people': people,
+        'arrivals': dict(arrivals, histogram=arrival_counts.tolist()),
+        'departures': dict(departures, histogram=departure_counts.tolist()),
+        'time_of_day_buckets': [_clock(i * TIME_OF_DAY_BUCKET_MINUTES * _MINUTE_MS)
+                                for i in range(len(arrival_counts))],
+        'bucket_minutes': bucket_minutes,
+        'occupancy': occupancy,
+        'peak_occupancy': peak,
+        'elapsed_s': round(time.perf_counter() - started, 3),
+    }
+
+
+def attendance_report(store, kind, day=None, bucket_minutes=None):
+    """日报/周报/月报，day 默认为今天"""
+    start, end = report_range(kind, day or datetime.now().date())
+    return dict(build_report(store, start, end, bucket_minutes or DEFAULT_BUCKET_MINUTES[kind]), kind=kind)
+
+
+def to_csv(report, table='people'):
+    """把报表中的一张表转成CSV：people（每人每天）、occupancy（在场人数曲线）或 arrivals（到达/离开分布）"""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    if table == 'people':
+        writer.writerow(['name', 'present_minutes', 'days_present', 'median_arrival', 'median_departure']
+                        + report['days'])
+        for person in report['people']:
+            writer.writerow([person['name'], person['present_minutes'], person['days_present'],
+                             person['median_arrival'], person['median_departure']] + person['minutes_per_day'])
+    elif table == 'occupancy':
+        writer.writerow(['time', 'average_present'])
+        writer.writerows((point['time'], point['average_present']) for point in report['occupancy'])
+    elif table == 'arrivals':
+        writer.writerow(['time_of_day', 'arrivals', 'departures'])
+        writer.writerows(zip(report['time_of_day_buckets'], report['arrivals']['histogram'],
+                             report['departures']['histogram']))
+    else:
+        raise ValueError(f'未知的报表表格: {table}')
+    return out.getvalue()
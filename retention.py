@@ -0,0 +1,294 @@
+"""考勤记录保留与归档
+
+热表 appearances 只保留最近 RETENTION_DAYS 天的记录。更早的记录按开始时间所在月份（本地时间）
+移入 ARCHIVE_DIR 下的月度SQLite文件 appearances-YYYY-MM.db，同时在热库的 appearance_rollups
+中累加按人按天的汇总（次数、总时长）；person_stats 的累计值不受影响。
+
+归档与删除在热库的同一个写事务中完成，多个worker同时运行也不会重复归档；
+归档文件以记录ID为主键，中断后重跑是幂等的。删除后空出的页通过增量VACUUM
+分小步归还给文件系统。查询时间范围早于归档水位线时才会打开对应月份的归档文件。
+
+归档记录按 person_id 与热库中现存的 registered_faces 关联，姓名取当前姓名：已删除人员的归档记录
+不再可见（清理任务随后把它们从归档文件中删除，见 purge.py），同名重新注册的人员也不会继承旧记录。
+
+    python retention.py face_records.db --days 180 --archive-dir archive
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timedelta
+
+ARCHIVE_PREFIX = 'appearances-'
+ARCHIVE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS appearances
+        (id INTEGER PRIMARY KEY,
+         person_id INTEGER,
+         person_name TEXT,
+         start_ms INTEGER,
+         end_ms INTEGER,
+         duration REAL,
+         confidence REAL);
+    CREATE INDEX IF NOT EXISTS idx_appearances_start ON appearances (start_ms);
+    CREATE INDEX IF NOT EXISTS idx_appearances_person ON appearances (person_id);
+'''
+
+
+def _ms(dt):
+    return int(round(dt.timestamp() * 1000))
+
+
+def month_of(ms):
+    return datetime.fromtimestamp(ms / 1000).strftime('%Y-%m')
+
+
+def months_between(start_ms, end_ms):
+    """[start_ms, end_ms) 覆盖的月份列表，形如 ['2024-01', '2024-02']"""
+    if end_ms <= start_ms:
+        return []
+    start = datetime.fromtimestamp(start_ms / 1000)
+    last = month_of(end_ms - 1)
+    months = []
+    year, month = start.year, start.month
+    while True:
+        months.append(f'{year:04d}-{month:02d}')
+        if months[-1] >= last:
+            return months
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def archive_path(archive_dir, month):
+    return os.path.join(archive_dir, f'{ARCHIVE_PREFIX}{month}.db')
+
+
+def archive_months(archive_dir):
+    """已有归档文件的月份"""
+    paths = glob.glob(os.path.join(archive_dir, f'{ARCHIVE_PREFIX}*.db'))
+    return sorted(os.path.basename(path)[len(ARCHIVE_PREFIX):-3] for path in paths)
+
+
+def watermark(c):
+    """归档水位线：早于它的记录可能已在归档文件中（从未归档时为None）"""
+    c.execute("SELECT value FROM retention_state WHERE key = 'archived_before_ms'")
+    row = c.fetchone()
+    return row[0] if row else None
+
+
+def read_archives(archive_dir, start_ms, end_ms, people):
+    """从归档文件读取 [start_ms, end_ms) 内的记录 [(姓名, 开始, 结束, 时长, 置信度)]
+
+    people 为热库中现存人员 {person_id: 姓名}，只返回这些人的记录；只有一人时按 person_id 过滤。
+    """
+    if not people:
+        return []
+    sql = """SELECT person_id, start_ms, end_ms, duration, confidence FROM appearances
+             WHERE start_ms >= ? AND start_ms < ?"""
+    params = [start_ms, end_ms]
+    if len(people) == 1:
+        sql += " AND person_id = ?"
+        params.extend(people)
+    rows = []
+    for month in months_between(start_ms, end_ms):
+        path = archive_path(archive_dir, month)
+        if not os.path.exists(path):
+            continue
+        with closing(sqlite3.connect(f'file:{path}?mode=ro', uri=True)) as conn:
+            for row in conn.execute(sql + " ORDER BY start_ms", params):
+                name = people.get(row[0])
+                if name is not None:
+                    rows.append((name,) + row[1:])
+    return rows
+
+
+def delete_person(archive_dir, person_id):
+    """从全部归档文件中删除一个人的记录，返回删除条数"""
+    deleted = 0
+    for month in archive_months(archive_dir):
+        with closing(sqlite3.connect(archive_path(archive_dir, month))) as conn:
+            conn.executescript(ARCHIVE_SCHEMA)
+            deleted += conn.execute("DELETE FROM appearances WHERE person_id = ?", (person_id,)).rowcount
+            conn.commit()
+    return deleted
+
+
+def _write_archive(archive_dir, month, rows):
+    with closing(sqlite3.connect(archive_path(archive_dir, month))) as conn:
+        conn.executescript(ARCHIVE_SCHEMA)
+        conn.executemany("""INSERT OR IGNORE INTO appearances
+                            (id, person_id, person_name, start_ms, end_ms, duration, confidence)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)""", rows)
+        conn.commit()
+
+
+def _day_ms(ms):
+    day = datetime.fromtimestamp(ms / 1000)
+    return _ms(datetime(day.year, day.month, day.day))
+
+
+class RetentionWorker:
+    """定期把过期记录移入月度归档并增量回收空间"""
+
+    def __init__(self, connect, archive_dir, retention_days, interval=3600,
+                 batch_size=2000, vacuum_pages=256, pause=0.05):
+        self.connect = connect
+        self.archive_dir = archive_dir
+        self.retention_days = retention_days
+        self.interval = interval
+        self.batch_size = batch_size  # 每个写事务归档的记录数
+        self.vacuum_pages = vacuum_pages  # 每步增量VACUUM释放的页数
+        self.pause = pause  # 批间暂停，让出写锁
+        self.runs = 0
+        self.archived_rows = 0
+        self.vacuumed_pages = 0
+        self.last_run_at = None
+        self.last_duration = None
+        self.last_error = None
+        self._thread_pid = None
+        self._warned_vacuum = False
+
+    def cutoff_ms(self, now=None):
+        return _ms((now or datetime.now()) - timedelta(days=self.retention_days))
+
+    def archive_batch(self, cutoff_ms):
+        """归档一批早于 cutoff_ms 的记录，返回归档条数"""
+        with closing(self.connect()) as conn:
+            conn.isolation_level = None
+            c = conn.cursor()
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                # 先推进水位线：查询层据此决定是否读取归档，归档过程中也不会漏读
+                c.execute("""INSERT INTO retention_state (key, value) VALUES ('archived_before_ms', ?)
+                             ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)""", (cutoff_ms,))
+                # 已删除人员的记录留给 purge.py 删除，不再归档
+                c.execute("""SELECT a.id, a.person_id, f.name, a.start_ms, a.end_ms, a.duration, a.confidence
+                             FROM appearances a LEFT JOIN registered_faces f ON f.id = a.person_id
+                             WHERE a.start_ms < ?
+                               AND a.person_id NOT IN (SELECT person_id FROM face_purges WHERE finished_at IS NULL)
+                             ORDER BY a.start_ms LIMIT ?""", (cutoff_ms, self.batch_size))
+                rows = c.fetchall()
+                by_month = {}
+                rollups = {}
+                for row in rows:
+                    by_month.setdefault(month_of(row[3]), []).append(row)
+                    key = (row[1], _day_ms(row[3]))
+                    count, duration = rollups.get(key, (0, 0.0))
+                    rollups[key] = (count + 1, duration + (row[5] or 0))
+                # 先写归档再删除；归档写入失败时热库事务回滚，数据不会丢失
+                for month, month_rows in by_month.items():
+                    _write_archive(self.archive_dir, month, month_rows)
+                c.executemany("""INSERT INTO appearance_rollups (person_id, day_ms, appearances, total_duration)
+                                 VALUES (?, ?, ?, ?)
+                                 ON CONFLICT (person_id, day_ms) DO UPDATE SET
+                                     appearances = appearances + excluded.appearances,
+                                     total_duration = total_duration + excluded.total_duration""",
+                              [(person_id, day, count, duration)
+                               for (person_id, day), (count, duration) in rollups.items()])
+                c.executemany("DELETE FROM appearances WHERE id = ?", [(row[0],) for row in rows])
+                c.execute("COMMIT")
+            except Exception:
+                c.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def vacuum(self):
+        """分步执行增量VACUUM，返回释放的页数；数据库未启用增量模式时不做任何事"""
+        freed = 0
+        with closing(self.connect()) as conn:
+            conn.isolation_level = None
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                if not self._warned_vacuum:
+                    self._warned_vacuum = True
+                    logging.getLogger(__name__).warning(
+                        '数据库未启用增量VACUUM，归档后的空间不会归还；'
+                        '可在维护窗口执行 python retention.py --enable-incremental-vacuum')
+                return 0
+            while True:
+                pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                if not pages:
+                    break
+                # execute() 只执行一步（释放一页），executescript 会执行到底
+                conn.executescript(f"PRAGMA incremental_vacuum({self.vacuum_pages});")
+                freed += pages - conn.execute("PRAGMA freelist_count").fetchone()[0]
+                time.sleep(self.pause)
+        self.vacuumed_pages += freed
+        return freed
+
+    def run_once(self, now=None):
+        """归档全部过期记录并回收空间，返回归档条数"""
+        started = time.perf_counter()
+        cutoff = self.cutoff_ms(now)
+        os.makedirs(self.archive_dir, exist_ok=True)
+        archived = 0
+        while True:
+            count = self.archive_batch(cutoff)
+            archived += count
+            self.archived_rows += count
+            if count < self.batch_size:
+                break
+            time.sleep(self.pause)
+        self.vacuum()
+        self.runs += 1
+        self.last_run_at = datetime.now().isoformat()
+        self.last_duration = round(time.perf_counter() - started, 3)
+        return archived
+
+    def ensure_thread(self):
+        # 线程不会跨fork保留，每个worker进程各自启动；并发归档由写事务串行化
+        if self._thread_pid != os.getpid() and self.retention_days > 0:
+            self._thread_pid = os.getpid()
+            threading.Thread(target=self._run, name='retention', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                archived = self.run_once()
+                self.last_error = None
+                if archived:
+                    logging.getLogger(__name__).info('已归档 %d 条出现记录', archived)
+            except Exception as e:
+                self.last_error = str(e)
+                logging.getLogger(__name__).exception('归档失败')
+            time.sleep(self.interval)
+
+    def stats(self):
+        return {
+            'retention_days': self.retention_days,
+            'runs': self.runs,
+            'archived_rows': self.archived_rows,
+            'vacuumed_pages': self.vacuumed_pages,
+            'last_run_at': self.last_run_at,
+            'last_duration_s': self.last_duration,
+            'last_error': self.last_error,
+            'archive_months': archive_months(self.archive_dir),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='归档过期的出现记录')
+    parser.add_argument('db', nargs='?', default='face_records.db')
+    parser.add_argument('--days', type=int, default=int(os.environ.get('RETENTION_DAYS', 180)))
+    parser.add_argument('--archive-dir', default=os.environ.get('ARCHIVE_DIR', 'archive'))
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help='把数据库切换为增量VACUUM模式（执行一次完整VACUUM，期间锁库）')
+    args = parser.parse_args(argv)
+
+    from storage import SQLiteStore
+
+    if args.enable_incremental_vacuum:
+        with closing(sqlite3.connect(args.db)) as conn:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+    store = SQLiteStore(args.db, args.archive_dir)
+    store.init_schema()
+    worker = store.retention_worker(args.days)
+    worker.run_once()
+    print(json.dumps(worker.stats(), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,777 @@
+"""考勤数据存储层
+
+AttendanceStore 定义应用需要的全部读写操作；SQLiteStore 是默认实现，
+MemoryStore 是供测试使用的本地替身（多个同名实例共享同一份数据，可模拟多副本）。
+
+多副本部署时，通过环境变量 FACE_STORE=包名.模块:类名 指定共享存储的实现，
+所有副本写入同一个存储；人脸库的每次变更都会追加到 gallery_events，
+版本号即事件序号，各副本按版本轮询并增量应用。
+
+考勤表以整数 person_id（registered_faces.id）关联人员，时间存为毫秒级Unix时间戳；
+旧版以姓名和ISO字符串存储的数据库由 migrations.py 在线迁移。
+超过保留期的出现记录由 retention.py 移入月度归档文件，appearances_between 会按需一并读取。
+删除人员时出现记录由 purge.py 在后台分批清理，清理任务登记在 face_purges 中。
+更换编码参数时由 reencode.py 把各版本的特征写入 face_encodings，切换时整体复制到 registered_faces.encoding，
+当前版本号记在 encoder_state 中；add_face 在写事务中核对特征所用的编码参数，切换后写入的旧参数特征会被拒绝。
+各摄像头的识别区域（见 zones.py）以JSON存放在 camera_zones 中。
+"""
+import heapq
+import importlib
+import itertools
+import json
+import logging
+import os
+import pickle
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timedelta
+
+import backup
+import purge
+import retention
+
+DEFAULT_DB_PATH = 'face_records.db'
+SCHEMA_VERSION = 2  # PRAGMA user_version；0 为以姓名和ISO字符串存储的旧版结构
+MAX_APPEARANCE_MS = 24 * 3600 * 1000  # 单次出现的最长时长，查询归档中跨越范围起点的记录时使用
+
+# 出现记录的区间索引（R*Tree），由触发器随 appearances 增删改同步。
+# R*Tree 以32位浮点存储坐标并向外取整，只用于粗筛，结果需按 appearances 中的精确值复核。
+_INTERVAL_TRIGGERS = {
+    'appearances_interval_insert': """AFTER INSERT ON appearances BEGIN
+        INSERT OR REPLACE INTO appearance_intervals (id, start_ms, end_ms)
+        VALUES (NEW.id, MIN(NEW.start_ms, NEW.end_ms), MAX(NEW.start_ms, NEW.end_ms)); END""",
+    'appearances_interval_update': """AFTER UPDATE OF start_ms, end_ms ON appearances BEGIN
+        UPDATE appearance_intervals SET start_ms = MIN(NEW.start_ms, NEW.end_ms),
+                                        end_ms = MAX(NEW.start_ms, NEW.end_ms)
+        WHERE id = NEW.id; END""",
+    'appearances_interval_delete': """AFTER DELETE ON appearances BEGIN
+        DELETE FROM appearance_intervals WHERE id = OLD.id; END""",
+}
+
+
+def to_ms(dt):
+    """datetime 转毫秒时间戳；不带时区的按本地时间处理"""
+    return int(round(dt.timestamp() * 1000))
+
+
+def from_ms(ms):
+    """毫秒时间戳转带本地时区的 datetime"""
+    return datetime.fromtimestamp(ms / 1000).astimezone()
+
+
+def day_range_ms(day):
+    """本地某一天的 [开始, 结束) 毫秒时间戳"""
+    start = datetime(day.year, day.month, day.day)
+    return to_ms(start), to_ms(start + timedelta(days=1))
+
+
+def _month_range_ms(month):
+    """'YYYY-MM' 对应的本地时间月份范围（毫秒）"""
+    year, mon = (int(part) for part in month.split('-'))
+    first = datetime(year, mon, 1)
+    following = datetime(year + 1, 1, 1) if mon == 12 else datetime(year, mon + 1, 1)
+    return to_ms(first), to_ms(following)
+
+
+def create_tables(c):
+    """创建当前版本的表和索引（幂等）"""
+    # 只对新建的数据库生效；已有数据库需执行一次VACUUM才能切换（见 retention.py）
+    c.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+    # 创建人脸注册表，id 即 person_id
+    c.execute('''CREATE TABLE IF NOT EXISTS registered_faces
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  name TEXT UNIQUE,
+                  encoding BLOB,
+                  photo_path TEXT,
+                  created_at TEXT)''')
+    # 照片按内容去重，删除照片前检查是否仍被引用
+    c.execute("CREATE INDEX IF NOT EXISTS idx_registered_faces_photo ON registered_faces (photo_path)")
+
+    # 创建出现记录表
+    c.execute('''CREATE TABLE IF NOT EXISTS appearances
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  person_id INTEGER NOT NULL REFERENCES registered_faces(id),
+                  start_ms INTEGER NOT NULL,
+                  end_ms INTEGER NOT NULL,
+                  duration REAL,
+                  confidence REAL)''')
+    # 按人删除、统计每人今日次数走第一个索引，按日期范围统计走第二个
+    c.execute("CREATE INDEX IF NOT EXISTS idx_appearances_person_start ON appearances (person_id, start_ms)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_appearances_start ON appearances (start_ms)")
+
+    # 创建统计表
+    c.execute('''CREATE TABLE IF NOT EXISTS person_stats
+                 (person_id INTEGER PRIMARY KEY REFERENCES registered_faces(id),
+                  total_appearances INTEGER,
+                  total_duration REAL,
+                  first_seen_ms INTEGER,
+                  last_seen_ms INTEGER)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_person_stats_last_seen ON person_stats (last_seen_ms)")
+
+    # 已归档记录按人按天的汇总，day_ms 为本地日期零点
+    c.execute('''CREATE TABLE IF NOT EXISTS appearance_rollups
+                 (person_id INTEGER NOT NULL,
+                  day_ms INTEGER NOT NULL,
+                  appearances INTEGER,
+                  total_duration REAL,
+                  PRIMARY KEY (person_id, day_ms))''')
+
+    # 归档水位线等状态
+    c.execute("CREATE TABLE IF NOT EXISTS retention_state (key TEXT PRIMARY KEY, value INTEGER)")
+
+    _create_interval_index(c)
+
+    # 已删除人员的考勤数据清理任务，purged 为已删除的出现记录数
+    c.execute('''CREATE TABLE IF NOT EXISTS face_purges
+                 (person_id INTEGER PRIMARY KEY,
+                  name TEXT,
+                  photo_path TEXT,
+                  purged INTEGER DEFAULT 0,
+                  deleted_at TEXT,
+                  finished_at TEXT)''')
+
+    # 编码参数的各个版本
+    c.execute('''CREATE TABLE IF NOT EXISTS encoder_versions
+                 (version INTEGER PRIMARY KEY AUTOINCREMENT,
+                  params TEXT NOT NULL,
+                  created_at TEXT,
+                  activated_at TEXT)''')
+    # 各版本的人脸特征，registered_faces.encoding 始终为当前版本
+    c.execute('''CREATE TABLE IF NOT EXISTS face_encodings
+                 (person_id INTEGER NOT NULL,
+                  encoder_version INTEGER NOT NULL,
+                  encoding BLOB,
+                  PRIMARY KEY (person_id, encoder_version))''')
+    # 编码参数状态：active 为当前版本号（没有时为默认参数），previous 为上一个版本（供回滚）
+    c.execute("CREATE TABLE IF NOT EXISTS encoder_state (key TEXT PRIMARY KEY, value INTEGER)")
+    # 早期版本把编码状态记在 retention_state 中
+    c.execute("""INSERT OR IGNORE INTO encoder_state (key, value)
+                 SELECT CASE key WHEN 'encoder_version' THEN 'active' ELSE 'previous' END, value
+                 FROM retention_state WHERE key IN ('encoder_version', 'previous_encoder_version')""")
+    c.execute("DELETE FROM retention_state WHERE key IN ('encoder_version', 'previous_encoder_version')")
+
+    # 摄像头识别区域，zones 为区域列表的JSON
+    c.execute('''CREATE TABLE IF NOT EXISTS camera_zones
+                 (camera TEXT PRIMARY KEY,
+                  zones TEXT NOT NULL,
+                  updated_at TEXT)''')
+
+    # 人脸库变更日志，version 即人脸库版本号
+    c.execute('''CREATE TABLE IF NOT EXISTS gallery_events
+                 (version INTEGER PRIMARY KEY AUTOINCREMENT,
+                  op TEXT,
+                  name TEXT,
+                  encoding BLOB,
+                  created_at TEXT)''')
+
+
+def _create_interval_index(c):
+    """创建区间索引并回填已有记录；SQLite未编译R*Tree模块时跳过，查询退回按开始时间索引"""
+    c.execute("SELECT 1 FROM sqlite_master WHERE name = 'appearance_intervals'")
+    if c.fetchone():
+        return
+    try:
+        c.execute("CREATE VIRTUAL TABLE appearance_intervals USING rtree(id, start_ms, end_ms)")
+    except sqlite3.OperationalError:
+        return
+    c.execute("""INSERT INTO appearance_intervals (id, start_ms, end_ms)
+                 SELECT id, MIN(start_ms, end_ms), MAX(start_ms, end_ms) FROM appearances""")
+    for name, body in _INTERVAL_TRIGGERS.items():
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+
+def _active_encoder(c):
+    """当前版本的编码参数，从未切换过时为None（默认参数）"""
+    c.execute("""SELECT v.params FROM encoder_state s JOIN encoder_versions v ON v.version = s.value
+                 WHERE s.key = 'active'""")
+    row = c.fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def same_encoder(a, b):
+    return json.dumps(a, sort_keys=True) == json.dumps(b, sort_keys=True)
+
+
+class EncoderChanged(Exception):
+    """注册时编码参数已切换（见 reencode.py）；params 为当前参数，应按它重新编码"""
+
+    def __init__(self, params):
+        super().__init__('编码参数已切换')
+        self.params = params
+
+
+class AttendanceStore:
+    """存储接口"""
+
+    def init_schema(self):
+        """创建表结构（幂等）"""
+        raise NotImplementedError
+
+    def load_gallery(self):
+        """返回 (版本号, [(姓名, 人脸特征), ...])"""
+        raise NotImplementedError
+
+    def load_active_gallery(self):
+        """返回 (版本号, [(姓名, 人脸特征), ...], 编码参数)；编码参数为None表示默认参数"""
+        version, faces = self.load_gallery()
+        return version, faces, None
+
+    def gallery_changes(self, since_version):
+        """返回版本号大于 since_version 的变更 [(版本号, 'add'|'delete'|'reload', 姓名, 人脸特征)]
+
+        reload 表示编码参数已切换（见 reencode.py），需要整体重新加载；其特征字段为新的编码参数。
+        """
+        raise NotImplementedError
+
+    def face_exists(self, name):
+        raise NotImplementedError
+
+    def photo_referenced(self, photo_path):
+        """是否有注册记录引用该照片（照片按内容命名，不同的人可能引用同一个文件）"""
+        raise NotImplementedError
+
+    def add_face(self, name, encoding, photo_path, encoder=None):
+        """注册人脸并发布一条 add 变更，返回新版本号
+
+        encoder 为计算特征所用的编码参数：与当前版本不一致时（编码期间发生了切换）不写入，抛出 EncoderChanged。
+        """
+        raise NotImplementedError
+
+    def delete_face(self, name):
+        """删除人脸并发布一条 delete 变更，返回 (新版本号, 照片路径)；不存在时返回None
+
+        注册记录、统计和汇总在同一个事务中直接删除（没有停用标记，删除后不能恢复）。
+
+        支持后台清理的存储（purge_worker 不为None）只登记清理任务，出现记录和照片由清理任务删除。
+        """
+        raise NotImplementedError
+
+    def list_faces(self):
+        """返回 [(姓名, 照片路径)]，按注册时间倒序"""
+        raise NotImplementedError
+
+    def record_appearance(self, name, start_time, end_time, confidence):
+        """写入一次出现记录并更新统计；姓名未注册时不写入并返回False"""
+        raise NotImplementedError
+
+    def record_appearances(self, appearances):
+        """批量写入 [(姓名, 开始, 结束, 置信度)]，跳过未注册的姓名和已存在的相同记录，返回写入条数"""
+        raise NotImplementedError
+
+    def appearances_between(self, start_time, end_time, name=None):
+        """[start_time, end_time) 内的出现记录 [(姓名, 开始毫秒, 结束毫秒, 时长, 置信度)]，按开始时间排序"""
+        raise NotImplementedError
+
+    def appearances_overlapping(self, start_time, end_time, name=None):
+        """与 [start_time, end_time) 有重叠的出现记录，格式同 appearances_between"""
+        raise NotImplementedError
+
+    def iter_appearances(self, start_time, end_time, chunk_size=100000):
+        """分批返回与 [start_time, end_time) 有重叠的出现记录 [(姓名, 开始毫秒, 结束毫秒)]，整体按开始时间排序"""
+        raise NotImplementedError
+
+    def statistics(self):
+        """今日统计与每人汇总，结构与 /statistics 响应一致"""
+        raise NotImplementedError
+
+    def change_marker(self):
+        """廉价的数据变更标记，任何写入之后都会改变"""
+        raise NotImplementedError
+
+    def export(self, start_time=None, end_time=None):
+        """导出数据，结构与 /export_data 响应一致；给出时间范围时只导出范围内的出现记录（含归档）"""
+        raise NotImplementedError
+
+    def camera_zones(self):
+        """返回 {摄像头: 区域列表}"""
+        raise NotImplementedError
+
+    def set_camera_zones(self, camera, zones):
+        """保存摄像头的区域列表；zones 为空时删除该摄像头的配置，返回是否存在旧配置"""
+        raise NotImplementedError
+
+    def retention_worker(self, retention_days, **options):
+        """过期记录归档器（见 retention.py），不支持归档的存储返回None"""
+        return None
+
+    def purge_worker(self, **options):
+        """已删除人员的考勤数据清理器（见 purge.py），不支持的存储返回None"""
+        return None
+
+    def backup_manager(self, backup_dir, **options):
+        """在线备份（见 backup.py），不支持的存储返回None"""
+        return None
+
+
+class SQLiteStore(AttendanceStore):
+    """基于本地SQLite文件的存储（默认）"""
+
+    def __init__(self, path=DEFAULT_DB_PATH, archive_dir=None):
+        self.path = path
+        self.archive_dir = archive_dir
+        self._interval_index = None
+
+    def _connect(self):
+        return sqlite3.connect(self.path)
+
+    def init_schema(self):
+        with closing(self._connect()) as conn:
+            c = conn.cursor()
+            legacy = c.execute("""SELECT 1 FROM sqlite_master
+                                  WHERE type = 'table' AND name = 'appearance_records'""").fetchone()
+            create_tables(c)
+            if not legacy:
+                c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+        if legacy:
+            # 旧版数据库：补齐尚未迁移的记录后切换到新表（大库请先用 migrations.py 在线迁移）
+            from migrations import migrate
+            logging.getLogger(__name__).warning('检测到旧版考勤表，开始迁移')
+            migrate(self._connect, finalize=True)
+
+    def _current_version(self, c):
+        c.execute("SELECT COALESCE(MAX(version), 0) FROM gallery_events")
+        return c.fetchone()[0]
+
+    def load_gallery(self):
+        return self.load_active_gallery()[:2]
+
+    def load_active_gallery(self):
+        with closing(self._connect()) as conn:
+            c = conn.cursor()
+            # 在同一个读事务中取版本号、人脸和编码参数，保证三者一致
+            c.execute("BEGIN")
+            version = self._current_version(c)
+            c.execute("SELECT name, encoding FROM registered_faces")
+            faces = [(name, pickle.loads(blob)) for name, blob in c.fetchall()]
+            params = _active_encoder(c)
+            conn.commit()
+        return version, faces, params
+
+    def gallery_changes(self, since_version):
+        with closing(self._connect()) as conn:
+            c = conn.cursor()
+            c.execute("""SELECT version, op, name, encoding FROM gallery_events
+                         WHERE version > ? ORDER BY version""", (since_version,))
+            return [(version, op, name, pickle.loads(blob) if blob else None)
+                    for version, op, name, blob in c.fetchall()]
+
+    def face_exists(self, name):
+        with closing(self._connect()) as conn:
+            c = conn.cursor()
+            c.execute("SELECT id FROM registered_faces WHERE name = ?", (name,))
+            return c.fetchone() is not None
+
+    def photo_referenced(self, photo_path):
+        with closing(self._connect()) as conn:
+            c = conn.cursor()
+            c.execute("SELECT 1 FROM registered_faces WHERE photo_path = ?", (photo_path,))
+            return c.fetchone() is not None
+
+    def add_face(self, name, encoding, photo_path, encoder=None):
+        now = datetime.now().isoformat()
+        encoding_blob = pickle.dumps(encoding)
+        with closing(self._connect()) as conn:
+            conn.isolation_level = None
+            c = conn.cursor()
+            # 先取得写锁再核对编码参数，切换（reencode.switch）无法插在核对与写入之间
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                if encoder is not None:
+                    active = _active_encoder(c)
+                    if active is not None and not same_encoder(active, encoder):
+                        raise EncoderChanged(active)
+                c.execute("""INSERT INTO registered_faces (name, encoding, photo_path, created_at)
+                             VALUES (?, ?, ?, ?)""",
+                          (name, encoding_blob, photo_path, now))
+                c.execute("""INSERT INTO gallery_events (op, name, encoding, created_at)
+                             VALUES ('add', ?, ?, ?)""", (name, encoding_blob, now))
+                version = c.lastrowid
+                c.execute("COMMIT")
+            except Exception:
+                c.execute("ROLLBACK")
+                raise
+        return version
+
+    def delete_face(self, name):
+        with closing(self._connect()) as conn:
+            c = conn.cursor()
+
+            # 获取人员ID和照片路径
+            c.execute("SELECT id, photo_path FROM registered_faces WHERE name = ?", (name,))
+            result = c.fetchone()
+            if not result:
+                return None
+            person_id, photo_path = result
+
+            # 统计和汇总每人只有少量行，直接删除；出现记录登记给后台分批清理
+            c.execute("DELETE FROM person_stats WHERE person_id = ?", (person_id,))
+            c.execute("DELETE FROM appearance_rollups WHERE person_id = ?", (person_id,))
+            c.execute("DELETE FROM face_encodings WHERE person_id = ?", (person_id,))
+            c.execute("""INSERT OR REPLACE INTO face_purges (person_id, name, photo_path, deleted_at)
+                         VALUES (?, ?, ?, ?)""", (person_id, name, photo_path, datetime.now().isoformat()))
+
+            # 从数据库删除；查询都按 registered_faces 关联，此人的出现记录立即不可见
+            c.execute("DELETE FROM registered_faces WHERE id = ?", (person_id,))
+
+            c.execute("""INSERT INTO gallery_events (op, name, created_at)
+                         VALUES ('delete', ?, ?)""", (name, datetime.now().isoformat()))
+            version = c.lastrowid
+            conn.commit()
+            return version, photo_path
+
+    def list_faces(self):
+        with closing(self._connect()) as conn:
+            c = conn.cursor()
+            c.execute("SELECT name, photo_path FROM registered_faces ORDER BY created_at DESC")
+            return c.fetchall()
+
+    def record_appearance(self, name, start_time, end_time, confidence):
+        duration = (end_time - start_time).total_seconds()
+        start_ms, end_ms = to_ms(start_time), to_ms(end_time)
+        with closing(self._connect()) as conn:
+            conn.isolation_level = None
+            c = conn.cursor()
+            # 先取得写锁再查人员ID，删除（delete_face）无法插在查询与写入之间，
+            # 否则写入的出现记录指向已删除且清理过的人员，成为没有任何任务清理的孤立记录
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                c.execute("SELECT id FROM registered_faces WHERE name = ?", (name,))
+                row = c.fetchone()
+                if not row:
+                    # 人员已被删除（或从未注册），不再产生孤立记录
+                    c.execute("ROLLBACK")
+                    return False
+                person_id = row[0]
+
+                # 记录这次出现
+                c.execute("""INSERT INTO appearances
+                             (person_id, start_ms, end_ms, duration, confidence)
+                             VALUES (?, ?, ?, ?, ?)""",
+                          (person_id, start_ms, end_ms, duration, confidence))
+
+                # 更新统计信息（与出现记录在同一事务中）
+                self.update_person_statistics(c, person_id, start_ms, end_ms, duration)
+                c.execute("COMMIT")
+            except Exception:
+                c.execute("ROLLBACK")
+                raise
+        return True
+
+    def record_appearances(self, appearances):
+        with closing(self._connect()) as conn:
+            conn.isolation_level = None
+            c = conn.cursor()
+            # 与 record_appearance 相同：人员ID的查询和写入在同一个写事务中
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                c.execute("SELECT name, id FROM registered_faces")
+                person_ids = dict(c.fetchall())
+                totals = {}
+                for name, start_time, end_time, confidence in appearances:
+                    person_id = person_ids.get(name)
+                    if person_id is None:
+                        continue
+                    duration = (end_time - start_time).total_seconds()
+                    start_ms, end_ms = to_ms(start_time), to_ms(end_time)
+                    # 同一段录像重复导入时不产生重复记录
+                    c.execute("""INSERT INTO appearances (person_id, start_ms, end_ms, duration, confidence)
+                                 SELECT ?, ?, ?, ?, ?
+                                 WHERE NOT EXISTS (SELECT 1 FROM appearances
+                                                   WHERE person_id = ? AND start_ms = ? AND end_ms = ?)""",
+                              (person_id, start_ms, end_ms, duration, confidence, person_id, start_ms, end_ms))
+                    if c.rowcount:
+                        count, total, first, last = totals.get(person_id, (0, 0.0, start_ms, end_ms))
+                        totals[person_id] = (count + 1, total + duration, min(first, start_ms), max(last, end_ms))
+
+                # 补录的多是历史记录，首末出现时间取两边的较早/较晚值
+                c.executemany("""INSERT INTO person_stats
+                                 (person_id, total_appearances, total_duration, first_seen_ms, last_seen_ms)
+                                 VALUES (?, ?, ?, ?, ?)
+                                 ON CONFLICT (person_id) DO UPDATE SET
+                                     total_appearances = total_appearances + excluded.total_appearances,
+                                     total_duration = total_duration + excluded.total_duration,
+                                     first_seen_ms = MIN(first_seen_ms, excluded.first_seen_ms),
+                                     last_seen_ms = MAX(last_seen_ms, excluded.last_seen_ms)""",
+                              [(person_id,) + values for person_id, values in totals.items()])
+                c.execute("COMMIT")
+            except Exception:
+                c.execute("ROLLBACK")
+                raise
+        return sum(values[0] for values in totals.values())
+
+    def update_person_statistics(self, c, person_id, start_ms, end_ms, duration):
+        """更新人员统计信息"""
+        c.execute("""INSERT INTO person_stats
+                     (person_id, total_appearances, total_duration, first_seen_ms, last_seen_ms)
+                     VALUES (?, 1, ?, ?, ?)
+                     ON CONFLICT (person_id) DO UPDATE SET
+                         total_appearances = total_appearances + 1,
+                         total_duration = total_duration + excluded.total_duration,
+                         last_seen_ms = excluded.last_seen_ms""",
+                  (person_id, duration, start_ms, end_ms))
+
+    def _people(self, c, name=None):
+        """现存人员 {person_id: 姓名}，用于关联归档记录；给出姓名时只含此人"""
+        if name is None:
+            c.execute("SELECT id, name FROM registered_faces")
+        else:
+            c.execute("SELECT id, name FROM registered_faces WHERE name = ?", (name,))
+        return dict(c.fetchall())
+
+    def appearances_between(self, start_time, end_time, name=None):
+        start_ms, end_ms = to_ms(start_time), to_ms(end_time)
+        sql = """SELECT f.name, a.start_ms, a.end_ms, a.duration, a.confidence
+                 FROM appearances a JOIN registered_faces f ON f.id = a.person_id
+                 WHERE a.start_ms >= ? AND a.start_ms < ?"""
+        params = [start_ms, end_ms]
+        if name is not None:
+            sql += " AND f.name = ?"
+            params.append(name)
+        with closing(self._connect()) as conn:
+            c = conn.cursor()
+            rows = c.execute(sql, params).fetchall()
+            archived_before = retention.watermark(c)
+            # 范围早于归档水位线时才读取对应月份的归档文件，按 person_id 关联现存人员
+            if self.archive_dir and archived_before is not None and start_ms < archived_before:
+                rows += retention.read_archives(self.archive_dir, start_ms, min(end_ms, archived_before),
+                                                self._people(c, name))
+        rows.sort(key=lambda row: row[1])
+        return rows
+
+    def _has_interval_index(self, c):
+        if self._interval_index is None:
+            c.execute("SELECT 1 FROM sqlite_master WHERE name = 'appearance_intervals'")
+            self._interval_index = c.fetchone() is not None
+        return self._interval_index
+
+    def appearances_overlapping(self, start_time, end_time, name=None):
+        start_ms, end_ms = to_ms(start_time), to_ms(end_time)
+        with closing(self._connect()) as conn:
+            c = conn.cursor()
+            if name is not None:
+                # 单人查询走 (person_id, start_ms) 索引
+                c.execute("""SELECT f.name, a.start_ms, a.end_ms, a.duration, a.confidence
+                             FROM registered_faces f JOIN appearances a ON a.person_id = f.id
+                             WHERE f.name = ? AND a.start_ms < ? AND a.end_ms > ?""",
+                          (name, end_ms, start_ms))
+            elif self._has_interval_index(c):
+                # CROSS JOIN 固定由R*Tree驱动：先按（取整后的）区间粗筛，再按精确值复核
+                c.execute("""SELECT f.name, a.start_ms, a.end_ms, a.duration, a.confidence
+                             FROM appearance_intervals i
+                             CROSS JOIN appearances a ON a.id = i.id
+                             JOIN registered_faces f ON f.id = a.person_id
+                             WHERE i.start_ms <= ? AND i.end_ms >= ?
+                               AND a.start_ms < ? AND a.end_ms > ?""",
+                          (end_ms, start_ms, end_ms, start_ms))
+            else:
+                c.execute("""SELECT f.name, a.start_ms, a.end_ms, a.duration, a.confidence
+                             FROM appearances a JOIN registered_faces f ON f.id = a.person_id
+                             WHERE a.start_ms < ? AND a.end_ms > ?""", (end_ms, start_ms))
+            rows = c.fetchall()
+            archived_before = retention.watermark(c)
+            if self.archive_dir and archived_before is not None and start_ms < archived_before:
+                archived = retention.read_archives(self.archive_dir, start_ms - MAX_APPEARANCE_MS,
+                                                   min(end_ms, archived_before), self._people(c, name))
+                rows += [row for row in archived if row[2] > start_ms]
+        rows.sort(key=lambda row: (row[1], row[0], row[2]))
+        return rows
+
+    def iter_appearances(self, start_time, end_time, chunk_size=100000):
+        start_ms, end_ms = to_ms(start_time), to_ms(end_time)
+        # 跨越范围起点的记录中最早的开始时间，之后按 start_ms 索引顺序扫描
+        crossing = self.appearances_overlapping(start_time, from_ms(start_ms + 1))
+        lower = min([start_ms] + [row[1] for row in crossing])
+        with closing(self._connect()) as conn:
+            c = conn.cursor()
+            archived_before = retention.watermark(c)
+            streams = []
+            if self.archive_dir and archived_before is not None and lower < archived_before:
+                streams.append(self._iter_archived(self._people(c), lower, min(end_ms, archived_before), start_ms))
+            c.execute("""SELECT f.name, a.start_ms, a.end_ms
+                         FROM appearances a JOIN registered_faces f ON f.id = a.person_id
+                         WHERE a.start_ms >= ? AND a.start_ms < ? AND a.end_ms > ?
+                         ORDER BY a.start_ms""", (lower, end_ms, start_ms))
+            streams.append(itertools.chain.from_iterable(iter(lambda: c.fetchmany(chunk_size), [])))
+            # 热表中也可能有早于水位线的记录（例如补录的历史数据），两路按开始时间归并
+            rows = []
+            for row in heapq.merge(*streams, key=lambda row: row[1]):
+                rows.append(row)
+                if len(rows) >= chunk_size:
+                    yield rows
+                    rows = []
+            if rows:
+                yield rows
+
+    def _iter_archived(self, people, lower, upper, start_ms):
+        """按开始时间返回 [lower, upper) 内的归档记录 (姓名, 开始, 结束)；按月读取，每次最多一个月的数据在内存中"""
+        for month in retention.months_between(lower, upper):
+            month_start, month_end = _month_range_ms(month)
+            for row in retention.read_archives(self.archive_dir, max(month_start, lower),
+                                               min(month_end, upper), people):
+                if row[2] > start_ms:
+                    yield row[:3]
+
+    def statistics(self):
+        with closing(self._connect()) as conn:
+            c = conn.cursor()
+
+            # 获取注册人数
+            c.execute("SELECT COUNT(*) FROM registered_faces")
+            registered_count = c.fetchone()[0]
+
+            # 获取今日签到人数（本地时间的今天，按 start_ms 范围走索引）
+            today_start, today_end = day_range_ms(datetime.now().date())
+            c.execute("""SELECT COUNT(DISTINCT a.person_id), AVG(a.duration)
+                         FROM appearances a JOIN registered_faces f ON f.id = a.person_id
+                         WHERE a.start_ms >= ? AND a.start_ms < ?""", (today_start, today_end))
+            today_count, avg_duration = c.fetchone()
+
+            # 获取平均停留时间（分钟）
+            avg_duration = round((avg_duration or 0) / 60, 1)  # 转换为分钟
+
+            # 获取每个人的统计信息
+            c.execute("""SELECT f.name, ps.total_appearances, ps.total_duration, ps.last_seen_ms,
+                         (SELECT COUNT(*) FROM appearances a
+                          WHERE a.person_id = ps.person_id AND a.start_ms >= ? AND a.start_ms < ?) as today_count
+                         FROM person_stats ps
+                         JOIN registered_faces f ON f.id = ps.person_id
+                         ORDER BY ps.last_seen_ms DESC""", (today_start, today_end))
+
+            person_stats = []
+            for row in c.fetchall():
+                person_stats.append({
+                    'name': row[0],
+                    'appearances': row[1],
+                    'total_duration': round(row[2] / 60, 1),  # 转换为分钟
+                    'last_seen': from_ms(row[3]).strftime('%Y-%m-%d %H:%M'),
+                    'today_count': row[4]
+                })
+
+        return {
+            'registered_count': registered_count,
+            'today_count': today_count,
+            'avg_duration': avg_duration,
+            'person_stats': person_stats
+        }
+
+    def change_marker(self):
+        with closing(self._connect()) as conn:
+            c = conn.cursor()
+            # 两个MAX都走主键索引，与表大小无关
+            c.execute("""SELECT (SELECT COALESCE(MAX(id), 0) FROM appearances),
+                                (SELECT COALESCE(MAX(version), 0) FROM gallery_events)""")
+            return c.fetchone()
+
+    def export(self, start_time=None, end_time=None):
+        with closing(self._connect()) as conn:
+            c = conn.cursor()
+
+            data = {
+                'export_time': datetime.now().isoformat(),
+                'registered_faces': [],
+                'appearance_records': [],
+                'statistics': []
+            }
+
+            # 注册人脸
+            c.execute("SELECT name, created_at FROM registered_faces")
+            for row in c.fetchall():
+                data['registered_faces'].append({
+                    'name': row[0],
+                    'created_at': row[1]
+                })
+
+            # 出现记录（对外仍使用姓名和ISO时间）；未指定范围时只导出热表
+            if start_time is None and end_time is None:
+                c.execute("""SELECT f.name, a.start_ms, a.end_ms, a.duration
+                             FROM appearances a JOIN registered_faces f ON f.id = a.person_id
+                             ORDER BY a.start_ms DESC""")
+                appearances = c.fetchall()
+            else:
+                appearances = self.appearances_between(start_time or datetime.fromtimestamp(0),
+                                                       end_time or datetime.now() + timedelta(days=1))
+                appearances.reverse()
+            for row in appearances:
+                data['appearance_records'].append({
+                    'person_name': row[0],
+                    'start_time': from_ms(row[1]).isoformat(),
+                    'end_time': from_ms(row[2]).isoformat(),
+                    'duration': row[3]
+                })
+
+            # 统计信息
+            c.execute("""SELECT f.name, ps.total_appearances, ps.total_duration, ps.first_seen_ms, ps.last_seen_ms
+                         FROM person_stats ps JOIN registered_faces f ON f.id = ps.person_id""")
+            for row in c.fetchall():
+                data['statistics'].append({
+                    'person_name': row[0],
+                    'total_appearances': row[1],
+                    'total_duration': row[2],
+                    'first_seen': from_ms(row[3]).isoformat(),
+                    'last_seen': from_ms(row[4]).isoformat()
+                })
+
+        return data
+
+    def camera_zones(self):
+        with closing(self._connect()) as conn:
+            c = conn.cursor()
+            c.execute("SELECT camera, zones FROM camera_zones")
+            return {camera: json.loads(zones) for camera, zones in c.fetchall()}
+
+    def set_camera_zones(self, camera, zones):
+        with closing(self._connect()) as conn:
+            c = conn.cursor()
+            c.execute("SELECT 1 FROM camera_zones WHERE camera = ?", (camera,))
+            existed = c.fetchone() is not None
+            if zones:
+                c.execute("INSERT OR REPLACE INTO camera_zones (camera, zones, updated_at) VALUES (?, ?, ?)",
+                          (camera, json.dumps(zones), datetime.now().isoformat()))
+            else:
+                c.execute("DELETE FROM camera_zones WHERE camera = ?", (camera,))
+            conn.commit()
+            return existed
+
+    def retention_worker(self, retention_days, **options):
+        if not self.archive_dir:
+            return None
+        return retention.RetentionWorker(self._connect, self.archive_dir, retention_days, **options)
+
+    def purge_worker(self, **options):
+        return purge.PurgeWorker(self._connect, archive_dir=self.archive_dir, **options)
+
+    def backup_manager(self, backup_dir, **options):
+        return backup.BackupManager(self._connect, backup_dir, archive_dir=self.archive_dir, **options)
+
+
+_memory_ids = itertools.count()
+
+
+class MemoryStore(SQLiteStore):
+    """内存中的SQLite（共享缓存），供测试和本地模拟多副本使用
+
+    同名的多个实例访问同一份数据；至少保留一个连接时数据才会存在。
+    """
+
+    def __init__(self, name=None):
+        name = name or f'face_store_{next(_memory_ids)}'
+        super().__init__(f'file:{name}?mode=memory&cache=shared')
+        self._keeper = self._connect()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, uri=True, check_same_thread=False)
+
+
+def create_store(spec=None):
+    """根据 FACE_STORE 创建存储：sqlite（默认）、memory 或 包名.模块:类名"""
+    spec = spec or os.environ.get('FACE_STORE', 'sqlite')
+    if spec == 'sqlite':
+        return SQLiteStore(os.environ.get('FACE_DB_PATH', DEFAULT_DB_PATH),
+                           os.environ.get('ARCHIVE_DIR', 'archive'))
+    if spec == 'memory':
+        return MemoryStore()
+    module_name, _, class_name = spec.partition(':')
+    store_class = getattr(importlib.import_module(module_name), class_name)
+    return store_class()
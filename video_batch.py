@@ -0,0 +1,213 @@
+"""离线视频批处理：从录像中补录考勤
+
+每个视频按 --chunk-seconds 切成若干时间段，由多个进程并行解码；每段按 --fps 抽帧，
+用与 /recognize 相同的检测、质量过滤、编码和匹配流程（recognition.recognize_frame）识别。
+所有帧的结果汇总后按页面端的跟踪规则生成出现记录：同一人两次被识别的间隔超过
+TRACKING_TIMEOUT 秒即视为离开，出现时段为首次到最后一次被识别的时间。
+结果一次性批量写入数据库，重复导入同一段录像不会产生重复记录。
+
+    python video_batch.py meeting.mp4 --start 2024-01-15T09:00:00 --fps 2 --workers 4
+    python video_batch.py a.mp4 b.mp4 --dry-run
+
+未指定 --start 时，以文件修改时间减去视频时长作为录制开始时间。
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from datetime import datetime, timedelta
+
+import models
+import quality
+import recognition
+from gallery import GallerySnapshot
+from storage import SQLiteStore
+
+DEFAULT_FPS = 2.0
+DEFAULT_CHUNK_SECONDS = 60.0
+DEFAULT_MAX_WIDTH = 960
+
+# 工作进程内的状态，由 _init_worker 设置
+_worker = {}
+
+
+def probe(path):
+    """视频的帧率与时长（秒）"""
+    cv2 = models.cv2()
+    capture = cv2.VideoCapture(path)
+    try:
+        if not capture.isOpened():
+            raise ValueError(f'无法打开视频: {path}')
+        fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+        frames = capture.get(cv2.CAP_PROP_FRAME_COUNT)
+        return fps, frames / fps
+    finally:
+        capture.release()
+
+
+def split_chunks(duration, chunk_seconds):
+    """[0, duration) 切成 [(开始秒, 结束秒)]"""
+    chunks = []
+    start = 0.0
+    while start < duration:
+        chunks.append((start, min(start + chunk_seconds, duration)))
+        start += chunk_seconds
+    return chunks
+
+
+def _init_worker(db_path, limits, max_width):
+    # 每个进程自带人脸库快照；OpenCV只用单线程，并行度由进程数决定
+    version, faces, encoder = SQLiteStore(db_path).load_active_gallery()
+    _worker['snapshot'] = GallerySnapshot([name for name, _ in faces], [encoding for _, encoding in faces], version,
+                                          encoder=encoder)
+    _worker['limits'] = limits
+    _worker['max_width'] = max_width
+    models.cv2().setNumThreads(1)
+
+
+def process_chunk(task):
+    """解码一个时间段并识别抽样帧，返回 (视频序号, 开始秒, 结束秒, [(秒, 姓名, 置信度)], 抽样帧数)"""
+    index, path, video_fps, start, end, sample_fps = task
+    cv2 = models.cv2()
+    snapshot, limits, max_width = _worker['snapshot'], _worker['limits'], _worker['max_width']
+    capture = cv2.VideoCapture(path)
+    detections = []
+    sampled = 0
+    try:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, int(start * video_fps))
+        next_sample = start
+        while True:
+            # 只解码需要抽样的帧，其余帧 grab 后直接跳过
+            if not capture.grab():
+                break
+            position = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            if position >= end:
+                break
+            if position < next_sample:
+                continue
+            ok, frame = capture.retrieve()
+            if not ok:
+                break
+            next_sample += 1 / sample_fps
+            sampled += 1
+            if max_width and frame.shape[1] > max_width:
+                scale = max_width / frame.shape[1]
+                frame = cv2.resize(frame, (max_width, int(round(frame.shape[0] * scale))))
+            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            for face in recognition.recognize_frame(rgb, snapshot, limits=limits):
+                if face['name'] not in ('Unknown', quality.LOW_QUALITY):
+                    detections.append((position, face['name'], float(face['confidence'])))
+    finally:
+        capture.release()
+    return index, start, end, detections, sampled
+
+
+def build_sessions(detections, timeout=recognition.TRACKING_TIMEOUT):
+    """[(秒, 姓名, 置信度)] -> [(姓名, 首次秒, 最后秒, 平均置信度)]，规则与页面端 updatePersonTracking 相同"""
+    open_sessions = {}
+    sessions = []
+    for position, name, confidence in sorted(detections):
+        session = open_sessions.get(name)
+        if session is not None and position - session[2] > timeout:
+            sessions.append(session)
+            session = None
+        if session is None:
+            open_sessions[name] = [name, position, position, confidence, 1]
+        else:
+            session[2] = position
+            session[3] += confidence
+            session[4] += 1
+    sessions.extend(open_sessions.values())
+    return sorted((name, first, last, total / count) for name, first, last, total, count in sessions)
+
+
+def run(videos, db_path, starts=None, sample_fps=DEFAULT_FPS, chunk_seconds=DEFAULT_CHUNK_SECONDS,
+        workers=None, timeout=recognition.TRACKING_TIMEOUT, max_width=DEFAULT_MAX_WIDTH, dry_run=False):
+    """处理视频并写入出现记录，返回处理报告"""
+    started = time.perf_counter()
+    if 1 / sample_fps >= timeout:
+        logging.getLogger(__name__).warning('抽帧间隔 %.2f 秒不小于离开判定时间 %s 秒，每次识别都会成为单独的出现',
+                                            1 / sample_fps, timeout)
+    infos = []
+    tasks = []
+    for index, path in enumerate(videos):
+        video_fps, duration = probe(path)
+        if starts and index < len(starts) and starts[index]:
+            recorded_at = starts[index]
+        else:
+            recorded_at = datetime.fromtimestamp(os.path.getmtime(path)) - timedelta(seconds=duration)
+        infos.append({'path': path, 'recorded_at': recorded_at, 'duration': duration,
+                      'detections': [], 'sampled_frames': 0})
+        tasks.extend((index, path, video_fps, start, end, sample_fps)
+                     for start, end in split_chunks(duration, chunk_seconds))
+
+    limits = quality.QualityLimits.from_env('QUALITY_')
+    workers = workers or os.cpu_count() or 1
+    ctx = multiprocessing.get_context('spawn')
+    done = 0
+    with ctx.Pool(workers, initializer=_init_worker, initargs=(db_path, limits, max_width)) as pool:
+        for index, start, end, detections, sampled in pool.imap_unordered(process_chunk, tasks):
+            infos[index]['detections'].extend(detections)
+            infos[index]['sampled_frames'] += sampled
+            done += end - start
+            logging.getLogger(__name__).info('%s %.0f-%.0f秒完成，累计 %.0f 秒视频',
+                                             videos[index], start, end, done)
+
+    appearances = []
+    for info in infos:
+        sessions = build_sessions(info['detections'], timeout)
+        info['sessions'] = [{'name': name,
+                             'start_time': (info['recorded_at'] + timedelta(seconds=first)).isoformat(),
+                             'end_time': (info['recorded_at'] + timedelta(seconds=last)).isoformat(),
+                             'confidence': round(confidence, 3)}
+                            for name, first, last, confidence in sessions]
+        appearances.extend((name, info['recorded_at'] + timedelta(seconds=first),
+                            info['recorded_at'] + timedelta(seconds=last), confidence)
+                           for name, first, last, confidence in sessions)
+    inserted = 0 if dry_run else SQLiteStore(db_path).record_appearances(appearances)
+
+    wall = time.perf_counter() - started
+    video_seconds = sum(info['duration'] for info in infos)
+    return {
+        'videos': [{'path': info['path'],
+                    'recorded_at': info['recorded_at'].isoformat(),
+                    'duration_s': round(info['duration'], 1),
+                    'sampled_frames': info['sampled_frames'],
+                    'detections': len(info['detections']),
+                    'sessions': info['sessions']} for info in infos],
+        'chunks': len(tasks),
+        'workers': workers,
+        'appearances': len(appearances),
+        'inserted': inserted,
+        'dry_run': dry_run,
+        'video_seconds': round(video_seconds, 1),
+        'wall_seconds': round(wall, 2),
+        'video_seconds_per_second': round(video_seconds / wall, 2) if wall > 0 else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='从录像中批量补录考勤')
+    parser.add_argument('videos', nargs='+')
+    parser.add_argument('--db', default=os.environ.get('FACE_DB_PATH', 'face_records.db'))
+    parser.add_argument('--start', action='append', type=datetime.fromisoformat,
+                        help='录制开始时间（ISO格式），多个视频时按顺序重复指定')
+    parser.add_argument('--fps', type=float, default=DEFAULT_FPS, help='每秒抽样的帧数')
+    parser.add_argument('--chunk-seconds', type=float, default=DEFAULT_CHUNK_SECONDS, help='每个并行任务的视频时长')
+    parser.add_argument('--workers', type=int, default=None, help='解码进程数，默认为CPU核数')
+    parser.add_argument('--timeout', type=float, default=recognition.TRACKING_TIMEOUT,
+                        help='超过多少秒未识别到即视为离开')
+    parser.add_argument('--max-width', type=int, default=DEFAULT_MAX_WIDTH, help='识别前把帧缩小到此宽度，0表示不缩放')
+    parser.add_argument('--dry-run', action='store_true', help='只输出识别出的出现记录，不写入数据库')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    report = run(args.videos, args.db, args.start, args.fps, args.chunk_seconds, args.workers,
+                 args.timeout, args.max_width, args.dry_run)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
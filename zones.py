@@ -0,0 +1,139 @@
+"""摄像头感兴趣区域（ROI）
+
+每路摄像头可以配置若干区域（矩形或多边形），坐标为相对画面宽高的比例（0~1），
+与上传画面的分辨率无关（页面端会按服务器建议缩小画面）。识别时先把画面裁到所有区域的
+外接矩形（向外扩展 margin，避免中心在区域内、但靠近边缘的人脸被裁掉一部分而检测不到）再做检测，
+中心点不在任何区域内的人脸在编码前丢弃。
+
+    {"type": "rect", "x": 0.1, "y": 0.2, "width": 0.5, "height": 0.6}
+    {"type": "polygon", "points": [[0.1, 0.1], [0.9, 0.1], [0.5, 0.9]]}
+"""
+import math
+import threading
+import time
+
+from metrics import Counters
+
+DEFAULT_CAMERA = 'default'
+
+
+def _polygon(zone):
+    """区域 -> 顶点列表 [(x, y)]，格式错误时抛出ValueError"""
+    if not isinstance(zone, dict):
+        raise ValueError('区域应为对象')
+    kind = zone.get('type', 'rect')
+    try:
+        if kind == 'rect':
+            x, y, w, h = (float(zone[key]) for key in ('x', 'y', 'width', 'height'))
+            if w <= 0 or h <= 0:
+                raise ValueError('矩形区域的宽高必须大于0')
+            points = [(x, y), (x + w, y), (x + w, y + h), (x, y + h)]
+        elif kind == 'polygon':
+            points = [(float(px), float(py)) for px, py in zone['points']]
+            if len(points) < 3:
+                raise ValueError('多边形区域至少需要3个顶点')
+        else:
+            raise ValueError(f'未知的区域类型: {kind}')
+    except (KeyError, TypeError) as e:
+        raise ValueError(f'区域格式错误: {zone}') from e
+    if any(not 0 <= value <= 1 for point in points for value in point):
+        raise ValueError('区域坐标应为0~1之间的比例')
+    return points
+
+
+def parse_zones(zones):
+    """校验区域列表，返回规范化后的列表（补全 type）"""
+    if not isinstance(zones, list):
+        raise ValueError('zones 应为列表')
+    for zone in zones:
+        _polygon(zone)
+    return [dict(zone, type=zone.get('type', 'rect')) for zone in zones]
+
+
+def _inside(x, y, points):
+    """射线法判断点是否在多边形内"""
+    inside = False
+    j = len(points) - 1
+    for i in range(len(points)):
+        xi, yi = points[i]
+        xj, yj = points[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+class CameraZones:
+    """一路摄像头的全部区域"""
+
+    def __init__(self, zones, margin=0.0):
+        self.zones = parse_zones(zones)
+        self.margin = margin  # 检测范围向外扩展的边距（画面短边的比例），应不小于最大人脸边长的一半
+        self.polygons = [_polygon(zone) for zone in self.zones]
+        xs = [x for points in self.polygons for x, _ in points]
+        ys = [y for points in self.polygons for _, y in points]
+        self.bounds = (min(xs), min(ys), max(xs), max(ys))
+
+    def crop_box(self, height, width):
+        """所有区域外接矩形向外扩展 margin 后的像素范围 (top, right, bottom, left)"""
+        x0, y0, x1, y1 = self.bounds
+        pad = int(math.ceil(self.margin * min(height, width)))
+        return (max(int(math.floor(y0 * height)) - pad, 0), min(int(math.ceil(x1 * width)) + pad, width),
+                min(int(math.ceil(y1 * height)) + pad, height), max(int(math.floor(x0 * width)) - pad, 0))
+
+    def contains(self, location, height, width):
+        """人脸框中心是否在某个区域内"""
+        top, right, bottom, left = location
+        x = (left + right) / 2 / width
+        y = (top + bottom) / 2 / height
+        return any(_inside(x, y, points) for points in self.polygons)
+
+
+class ZoneRegistry:
+    """各摄像头区域的进程内缓存，定期从存储刷新；同时按摄像头统计节省的像素和人脸数"""
+
+    def __init__(self, load, refresh_interval=2.0, margin=0.0):
+        self.load = load  # () -> {摄像头: 区域列表}
+        self.refresh_interval = refresh_interval
+        self.margin = margin
+        self._cameras = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def refresh(self):
+        cameras = {}
+        for camera, zones in self.load().items():
+            if zones:
+                cameras[camera] = CameraZones(zones, self.margin)
+        self._cameras = cameras
+        self._loaded_at = time.monotonic()
+
+    def get(self, camera):
+        """摄像头的区域，未配置时为None"""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh_interval:
+            with self._lock:
+                if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh_interval:
+                    self.refresh()
+        return self._cameras.get(camera)
+
+    def counters(self, camera):
+        """摄像头的统计；未配置区域的摄像头（名称来自客户端，数量不受控）合并计入 DEFAULT_CAMERA"""
+        if camera not in self._cameras:
+            camera = DEFAULT_CAMERA
+        counters = self._counters.get(camera)
+        if counters is None:
+            with self._lock:
+                counters = self._counters.setdefault(camera, Counters())
+        return counters
+
+    def stats(self):
+        result = {}
+        for camera, counters in sorted(self._counters.items()):
+            values = counters.snapshot()
+            pixels = values.get('pixels', 0)
+            faces = values.get('faces', 0)
+            result[camera] = dict(values, zones=len(self._cameras[camera].zones) if camera in self._cameras else 0,
+                                  pixel_savings=round(1 - values.get('detect_pixels', 0) / pixels, 3) if pixels else 0.0,
+                                  face_savings=round(values.get('discarded_faces', 0) / faces, 3) if faces else 0.0)
+        return result